@@ -0,0 +1,68 @@
+"""
+Count the algod requests needed to confirm many concurrent transactions.
+
+By default transactions are confirmed through the shared round watcher;
+`--per-transaction` runs one `wait_for_confirmation` loop per transaction,
+which is how the Algorand helpers used to confirm them.
+
+    python -m benchmarks.confirmations --transactions 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakes import FakeAlgodClient, configure_environment
+
+configure_environment()
+
+from algosdk import account, transaction  # noqa: E402
+
+import services.algorand as algorand  # noqa: E402
+from config.resources import resources  # noqa: E402
+
+
+async def confirm(client, private_key: str, address: str, note: int, shared: bool):
+    sp = await algorand.suggested_params_cache.get()
+    txn = transaction.PaymentTxn(address, sp, address, 0, note=str(note).encode())
+    stxn = txn.sign(private_key)
+    if shared:
+        await algorand.send_signed_group_and_confirm([stxn])
+    else:
+        txid = await algorand.run_algod(client.send_transaction, stxn)
+        await algorand.run_algod(transaction.wait_for_confirmation, client, txid, 4)
+
+
+async def main(args):
+    client = FakeAlgodClient(round_time=args.round_time)
+    resources.override(algod_client=client)
+    private_key, address = account.generate_account()
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            confirm(client, private_key, address, i, not args.per_transaction)
+            for i in range(args.transactions)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    confirmation_calls = sum(
+        count
+        for name, count in client.calls.items()
+        if name not in ("suggested_params", "send_transaction")
+    )
+    print(f"mode: {'per-transaction' if args.per_transaction else 'round watcher'}")
+    print(f"{args.transactions} transactions confirmed in {elapsed:.2f}s")
+    print(f"confirmation requests to algod: {confirmation_calls}")
+    for name, count in sorted(client.calls.items()):
+        print(f"  {name}: {count}")
+    print(f"suggested params cache: {algorand.suggested_params_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=50)
+    parser.add_argument("--round-time", type=float, default=0.2)
+    parser.add_argument("--per-transaction", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+Measure `/auth/me` latency while land-record issuances are in flight.
+
+With the algod calls running on the thread pool the latency of cheap routes
+should stay flat no matter how many issuances are pending. Pass `--blocking`
+to run the same workflow directly on the event loop, which is how the
+Algorand helpers used to behave.
+
+    python -m benchmarks.event_loop --issuances 8 --requests 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fakes import FakeAlgodClient, FakeEngine, configure_environment
+
+configure_environment()
+
+import httpx  # noqa: E402
+from algosdk import account, transaction  # noqa: E402
+
+import services.algorand as algorand  # noqa: E402
+import services.auth as auth  # noqa: E402
+from config.resources import resources  # noqa: E402
+from main import app  # noqa: E402
+from models.auth import Role, User  # noqa: E402
+
+
+async def issue(private_key: str, address: str):
+    # The same transactions and submission path as issue_land_record
+    txn = algorand.build_asa_txn(
+        await algorand.issuance_params(),
+        address,
+        unit_name="LAND",
+        asset_name="benchmark",
+        total=1,
+        decimals=0,
+        url="https://example.com/deed.pdf",
+    )
+    _, results = await algorand.send_signed_group_and_confirm([txn.sign(private_key)])
+    txns = algorand.build_opt_in_and_transfer_txns(
+        await algorand.issuance_params(),
+        address,
+        address,
+        results[0]["asset-index"],
+        amount=1,
+    )
+    await algorand.send_signed_group_and_confirm(
+        algorand.sign_group(txns, [private_key, private_key])
+    )
+
+
+async def issue_blocking(private_key: str, address: str):
+    client = resources.algod_client
+    for _ in range(3):
+        sp = client.suggested_params()
+        txn = transaction.PaymentTxn(address, sp, address, 0)
+        txid = client.send_transaction(txn.sign(private_key))
+        transaction.wait_for_confirmation(client, txid, 4)
+        await asyncio.sleep(0)
+
+
+async def measure(client: httpx.AsyncClient, token: str, requests: int):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(
+            "/auth/me/", headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    latencies.sort()
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    return statistics.median(latencies), p99, latencies[-1]
+
+
+async def main(args):
+    resources.override(
+        algod_client=FakeAlgodClient(round_time=args.round_time),
+        engine=FakeEngine(),
+    )
+    private_key, address = account.generate_account()
+    user = User(
+        username="benchmark",
+        hash_password="",
+        first_name="Bench",
+        surname="Mark",
+        national_id=1,
+        phone_number="0",
+        algorand_address=address,
+        algorand_encrypted_private_key="",
+        role=Role.TOKEN_ISSUER,
+    )
+    await resources.engine.save(user)
+    token = auth.create_access_token({"username": user.username, "role": user.role})
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        idle = await measure(client, token, args.requests)
+        workflow = issue_blocking if args.blocking else issue
+        tasks = [
+            asyncio.create_task(workflow(private_key, address))
+            for _ in range(args.issuances)
+        ]
+        await asyncio.sleep(0)
+        busy = await measure(client, token, args.requests)
+        await asyncio.gather(*tasks)
+
+    print(f"mode: {'blocking' if args.blocking else 'threadpool'}")
+    for label, (p50, p99, worst) in (("idle", idle), ("busy", busy)):
+        print(f"{label}  /auth/me p50={p50:.2f}ms p99={p99:.2f}ms max={worst:.2f}ms")
+    print(f"{args.issuances} issuances in flight during the busy run")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--issuances", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--round-time", type=float, default=0.2)
+    parser.add_argument("--blocking", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,496 @@
+"""
+Local stand-ins for the external services used by the API, so that the
+benchmarks in this package can run without MongoDB, Spaces or an algod node.
+"""
+
+import asyncio
+import io
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import msgpack
+from algosdk import error, transaction
+from botocore.exceptions import ClientError
+from pymongo.results import BulkWriteResult
+from bson import ObjectId
+from cryptography.fernet import Fernet
+
+
+def configure_environment():
+    """
+    Provide dummy settings so that `config.settings.Settings()` can be built
+    without a `.env` file. Must be called before importing any app module.
+    """
+    defaults = {
+        "MONGO_DB_URI": "mongodb://localhost:27017",
+        "TWILIO_ACCOUNT_SID": "benchmark",
+        "TWILIO_AUTH_TOKEN": "benchmark",
+        "TWILIO_PHONE_NUMBER": "benchmark",
+        "SIGNING_ALGORITHM": "HS256",
+        "SIGNING_SECRET_KEY": "benchmark",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "ENCRYPTION_KEY": Fernet.generate_key().decode(),
+        "DIGITAL_OCEAN_ACCESS_KEY": "benchmark",
+        "DIGITAL_OCEAN_SECRET_KEY": "benchmark",
+        "ALGOD_ADDRESS": "http://localhost:4001",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+class FakeAlgodClient:
+    """
+    Blocking algod stand-in that produces a new round every `round_time`
+    seconds. Transactions submitted in round `r` are confirmed in round `r + 1`.
+    """
+
+    def __init__(self, round_time: float = 0.2, latency: float = 0.0):
+        self.round_time = round_time
+        self.latency = latency
+        self.calls = Counter()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._confirmed = {}
+        self._next_asset_id = 1000
+        self._assets = {}
+        self._holdings = defaultdict(int)
+        self._blocks = defaultdict(list)
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _round(self) -> int:
+        return int((time.monotonic() - self._start) / self.round_time) + 1
+
+    def _submit(self, stxns) -> str:
+        confirmed_round = self._round() + 1
+        with self._lock:
+            for stxn in stxns:
+                info = {"confirmed-round": confirmed_round, "pool-error": ""}
+                entry = stxn.dictify()
+                txn = stxn.transaction
+                if isinstance(txn, transaction.AssetConfigTxn) and not txn.index:
+                    info["asset-index"] = entry["caid"] = self._next_asset_id
+                    self._create_asset(self._next_asset_id, txn)
+                    self._next_asset_id += 1
+                elif isinstance(txn, transaction.AssetTransferTxn):
+                    closing = self._transfer_asset(txn)
+                    if closing:
+                        entry["aca"] = closing
+                self._confirmed[stxn.get_txid()] = info
+                self._blocks[confirmed_round].append(entry)
+        return stxns[0].get_txid()
+
+    def _create_asset(self, asset_id: int, txn: transaction.AssetConfigTxn):
+        self._assets[asset_id] = {
+            "creator": txn.sender,
+            "clawback": txn.clawback,
+            "url": txn.url,
+            "total": txn.total,
+        }
+        self._holdings[txn.sender, asset_id] = txn.total
+
+    def _transfer_asset(self, txn: transaction.AssetTransferTxn) -> int:
+        # Balances change on submission; an opt-in only creates the holding
+        source = txn.revocation_target or txn.sender
+        self._holdings[source, txn.index] -= txn.amount
+        self._holdings[txn.receiver, txn.index] += txn.amount
+        if not txn.close_assets_to:
+            return 0
+        closing = self._holdings.pop((txn.sender, txn.index))
+        self._holdings[txn.close_assets_to, txn.index] += closing
+        return closing
+
+    def status(self):
+        self._call("status")
+        return {"last-round": self._round()}
+
+    def status_after_block(self, round_num: int):
+        self._call("status_after_block")
+        while self._round() <= round_num:
+            time.sleep(self.round_time / 10)
+        return {"last-round": self._round()}
+
+    def suggested_params(self):
+        self._call("suggested_params")
+        first = self._round()
+        return transaction.SuggestedParams(
+            fee=1000,
+            first=first,
+            last=first + 1000,
+            gh="SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=",
+            gen="testnet-v1.0",
+            flat_fee=True,
+            min_fee=1000,
+        )
+
+    def send_transaction(self, stxn):
+        self._call("send_transaction")
+        return self._submit([stxn])
+
+    def send_transactions(self, stxns):
+        self._call("send_transactions")
+        return self._submit(list(stxns))
+
+    def get_block_txids(self, round_num: int):
+        self._call("get_block_txids")
+        if round_num > self._round():
+            raise RuntimeError(f"round {round_num} has not been committed yet")
+        with self._lock:
+            txids = [
+                txid
+                for txid, info in self._confirmed.items()
+                if info["confirmed-round"] == round_num
+            ]
+        return {"blockTxids": txids}
+
+    def block_info(self, block=None, response_format="json", round_num=None):
+        self._call("block_info")
+        round_num = round_num or block
+        if round_num > self._round():
+            raise error.AlgodHTTPError("ledger does not have entry", 404)
+        with self._lock:
+            txns = list(self._blocks.get(round_num, []))
+        # Only the fields the chain mirror reads; msgpack as algod sends it
+        response = {"block": {"rnd": round_num, "txns": txns}}
+        if response_format == "msgpack":
+            return msgpack.packb(response, use_bin_type=True)
+        return response
+
+    def pending_transaction_info(self, txid: str):
+        self._call("pending_transaction_info")
+        with self._lock:
+            info = self._confirmed.get(txid)
+        if info is None:
+            raise error.AlgodHTTPError("txid not found", 404)
+        if info["confirmed-round"] > self._round():
+            return {"confirmed-round": 0, "pool-error": ""}
+        return dict(info, txn={"txid": txid})
+
+    def asset_info(self, asset_id: int):
+        self._call("asset_info")
+        with self._lock:
+            params = self._assets.get(asset_id)
+        if params is None:
+            raise error.AlgodHTTPError("asset does not exist", 404)
+        return {"index": asset_id, "params": dict(params)}
+
+    def account_asset_info(self, address: str, asset_id: int):
+        self._call("account_asset_info")
+        with self._lock:
+            if (address, asset_id) not in self._holdings:
+                raise error.AlgodHTTPError("account asset info not found", 404)
+            amount = self._holdings[address, asset_id]
+        return {
+            "asset-holding": {"amount": amount, "asset-id": asset_id},
+            "round": self._round(),
+        }
+
+
+class FakeS3Client:
+    """
+    Blocking S3 stand-in. Each request costs `latency` seconds plus the time
+    to move its body at `bandwidth` bytes per second over one connection.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: float | None = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = Counter()
+        self.objects = {}
+        self.metadata = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, size: int = 0):
+        with self._lock:
+            self.calls[name] += 1
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+    def put_object(self, Bucket, Key, Body, Metadata=None, **kwargs):
+        self._call("put_object", len(Body))
+        self.objects[(Bucket, Key)] = [bytes(Body)]
+        self.metadata[(Bucket, Key)] = dict(Metadata or {})
+        return {"ETag": f'"{len(Body)}"'}
+
+    def _missing(self, Bucket, Key, operation: str):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError(
+                {"Error": {"Code": "404", "Message": "Not Found"}}, operation
+            )
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call("head_object")
+        self._missing(Bucket, Key, "HeadObject")
+        # Like Spaces, no ChecksumSHA256 is reported
+        return {
+            "ContentLength": sum(len(part) for part in self.objects[(Bucket, Key)]),
+            "Metadata": self.metadata.get((Bucket, Key), {}),
+        }
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("get_object")
+        self._missing(Bucket, Key, "GetObject")
+        return {"Body": io.BytesIO(self.read(Bucket, Key))}
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, **kwargs):
+        source = (CopySource["Bucket"], CopySource["Key"])
+        self._call("copy_object")
+        self._missing(*source, "CopyObject")
+        self.objects[(Bucket, Key)] = list(self.objects[source])
+        self.metadata[(Bucket, Key)] = dict(Metadata or {})
+        return {}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call("delete_object")
+        self.objects.pop((Bucket, Key), None)
+        self.metadata.pop((Bucket, Key), None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return (
+            f"https://{Params['Bucket']}.s3.local/{Params['Key']}?expires={ExpiresIn}"
+        )
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("create_multipart_upload")
+        upload_id = f"upload-{len(self._uploads) + 1}"
+        self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._call("upload_part", len(Body))
+        self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._call("complete_multipart_upload")
+        parts = self._uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        # Parts are kept as they are; joining them here would hold the GIL
+        # long enough to show up as event loop stalls in the benchmarks.
+        self.objects[(Bucket, Key)] = [parts[number] for number in numbers]
+        self.metadata[(Bucket, Key)] = {}
+        return {}
+
+    def read(self, bucket: str, key: str) -> bytes:
+        return b"".join(self.objects[(bucket, key)])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._call("abort_multipart_upload")
+        self._uploads.pop(UploadId, None)
+        return {}
+
+
+def _lookup(doc: dict, field: str):
+    # Dotted fields reach into embedded documents
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """
+    Evaluate the subset of the MongoDB query language used by the app.
+    """
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        value = _lookup(doc, field)
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$exists" and (field in doc) != operand:
+                return False
+            if op in ("$gt", "$lt") and value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents: list[dict], projection=None):
+        self.documents = documents
+        self.projection = projection
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.documents:
+            if self.projection:
+                doc = {
+                    key: value
+                    for key, value in doc.items()
+                    if key == "_id" or self.projection.get(key)
+                }
+            yield dict(doc)
+
+
+class FakeCollection:
+    """
+    The handful of Motor collection methods the app calls directly.
+    """
+
+    def __init__(self, documents: dict, name: str = ""):
+        self.documents = documents
+        self.name = name
+
+    def find(self, query=None, projection=None, sort=None, limit=0, **kwargs):
+        found = [doc for doc in self.documents.values() if matches(doc, query or {})]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        if limit:
+            found = found[:limit]
+        return FakeCursor(found, projection)
+
+    def _first(self, query, sort=None) -> dict | None:
+        found = [doc for doc in self.documents.values() if matches(doc, query)]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return found[0] if found else None
+
+    def _upsert(self, query, update) -> dict | None:
+        # The equality part of an upsert filter stands in for a unique
+        # index: a second document is never inserted
+        keys = {
+            key: value for key, value in query.items() if not isinstance(value, dict)
+        }
+        if any(matches(doc, keys) for doc in self.documents.values()):
+            return None
+        doc = dict(keys, _id=ObjectId())
+        self.documents[doc["_id"]] = doc
+        doc.update(update.get("$setOnInsert", {}))
+        return doc
+
+    @staticmethod
+    def _update(doc, update):
+        doc.update(update.get("$set", {}))
+        for key, amount in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + amount
+
+    async def find_one(self, query=None, **kwargs):
+        doc = self._first(query or {})
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(
+        self, query, update, sort=None, upsert=False, return_document=False, **kwargs
+    ):
+        doc = self._first(query, sort)
+        before = dict(doc) if doc else None
+        if doc is None:
+            if not upsert or (doc := self._upsert(query, update)) is None:
+                return None
+        self._update(doc, update)
+        # ReturnDocument.AFTER is True, BEFORE (the default) is False
+        return dict(doc) if return_document else before
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        doc = self._first(query)
+        if doc is None and upsert:
+            doc = self._upsert(query, update)
+        if doc is not None:
+            self._update(doc, update)
+
+    async def delete_one(self, query, **kwargs):
+        doc = self._first(query)
+        if doc is not None:
+            del self.documents[doc["_id"]]
+
+    async def bulk_write(self, requests, ordered=True):
+        matched = 0
+        for request in requests:
+            doc = self._first(request._filter)
+            if doc is not None:
+                matched += 1
+            elif request._upsert:
+                doc = self._upsert(request._filter, request._doc)
+            if doc is not None:
+                self._update(doc, request._doc)
+        return BulkWriteResult({"nMatched": matched}, acknowledged=True)
+
+
+class FakeEngine:
+    """
+    In-memory replacement for `odmantic.AIOEngine` that understands the
+    equality, comparison and `$in` queries used by the routes.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._collections = defaultdict(dict)
+
+    async def _io(self, name: str):
+        self.calls[name] += 1
+        await asyncio.sleep(self.latency)
+
+    def _select(self, model, queries):
+        query = {"$and": list(queries)} if queries else {}
+        return [
+            model.model_validate_doc(doc)
+            for doc in self._collections[model].values()
+            if matches(doc, query)
+        ]
+
+    def get_collection(self, model):
+        return FakeCollection(self._collections[model], model.__collection__)
+
+    async def save(self, instance):
+        await self._io("save")
+        doc = instance.model_dump_doc()
+        self._collections[type(instance)][doc["_id"]] = doc
+        return instance
+
+    async def find_one(self, model, *queries, **kwargs):
+        await self._io("find_one")
+        found = self._select(model, queries)
+        return found[0] if found else None
+
+    async def find(self, model, *queries, **kwargs):
+        await self._io("find")
+        return self._select(model, queries)
+
+
+def install_fakes(
+    db_latency: float = 0.0,
+    s3_latency: float = 0.0,
+    s3_bandwidth: float | None = None,
+    algod_latency: float = 0.0,
+    round_time: float = 0.2,
+) -> tuple[FakeEngine, FakeS3Client, FakeAlgodClient]:
+    """
+    Make the app's resource container hand out fresh fakes for the Mongo
+    engine, the S3 client and the algod client.
+    """
+    from config.resources import resources
+
+    engine = FakeEngine(latency=db_latency)
+    s3_client = FakeS3Client(latency=s3_latency, bandwidth=s3_bandwidth)
+    algod_client = FakeAlgodClient(round_time=round_time, latency=algod_latency)
+    resources.override(engine=engine, s3_client=s3_client, algod_client=algod_client)
+    return engine, s3_client, algod_client
@@ -0,0 +1,317 @@
+"""
+Drive the API in-process against the local fakes and report requests per
+second and p50/p99 latency for each scenario. Issuance and revocation run
+through the job queue; the time to drain the queued jobs is reported too.
+
+    python -m benchmarks.load_test --scenarios login create-record issue \\
+        --requests 200 --concurrency 16 --db-latency 0.002 --algod-latency 0.01
+
+Pass `--json results.json` to keep the numbers for comparison between runs,
+and `--baseline results.json --max-p99-regression 20` on a later run to exit
+nonzero when a scenario's p99 grew by more than 20% over the baseline.
+Admission control is off unless `--admission` is given; every request comes
+from one client, so expect 429s (counted as `rejected`) once it is on.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+
+from benchmarks.fakes import FakeEngine, configure_environment, install_fakes
+
+configure_environment()
+
+import httpx  # noqa: E402
+from algosdk import account  # noqa: E402
+
+import services.auth as auth  # noqa: E402
+from main import app  # noqa: E402
+from models.auth import Role, User  # noqa: E402
+from models.jobs import Job, JobStatus  # noqa: E402
+from models.records import Record  # noqa: E402
+from services.admission import admission  # noqa: E402
+from services.crypto import encrypt_data  # noqa: E402
+from services.jobs import job_queue  # noqa: E402
+
+PASSWORD = "benchmark"
+
+
+@dataclass
+class Context:
+    run: int
+    headers: dict[str, str]
+    deed: bytes
+    unissued: list[str] = field(default_factory=list)
+    issued: list[str] = field(default_factory=list)
+
+
+def new_user(username: str, role: Role, hash_password: str = "") -> User:
+    private_key, address = account.generate_account()
+    return User(
+        username=username,
+        hash_password=hash_password,
+        first_name="Bench",
+        surname="Mark",
+        national_id=1,
+        phone_number="0",
+        algorand_address=address,
+        algorand_encrypted_private_key=encrypt_data(private_key).decode(),
+        role=role,
+    )
+
+
+async def seed(engine: FakeEngine, holders: int, deed_size: int) -> Context:
+    """
+    Store a token issuer, `holders` land holders with unverified records to
+    issue, and `holders` more whose records are issued and can be revoked.
+    """
+    issuer = new_user("benchmark", Role.TOKEN_ISSUER, auth.pwd_context.hash(PASSWORD))
+    await engine.save(issuer)
+    token = auth.create_access_token({"username": issuer.username, "role": issuer.role})
+    context = Context(
+        run=int(time.time()),
+        headers={"Authorization": f"Bearer {token}"},
+        deed=b"%PDF-1.4\n" + bytes(deed_size),
+    )
+    for i in range(2 * holders):
+        holder = new_user(f"holder-{i}", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        issued = i >= holders
+        record = Record(
+            location=f"Plot {i}",
+            file_url=f"https://land-records.example/deeds/{i}",
+            verified=issued,
+            user_id=str(holder.id),
+            asset_id=1000 + i if issued else None,
+            transaction_id=f"TX{i}" if issued else None,
+        )
+        await engine.save(record)
+        (context.issued if issued else context.unissued).append(str(holder.id))
+    return context
+
+
+async def register(client: httpx.AsyncClient, context: Context, i: int):
+    return await client.post(
+        "/auth/register",
+        json={
+            "username": f"user-{context.run}-{i}",
+            "password": PASSWORD,
+            "first_name": "Load",
+            "surname": "Test",
+            "national_id": i,
+            "phone_number": "0",
+            "role": Role.TOKEN_HOLDER.value,
+        },
+    )
+
+
+async def login(client: httpx.AsyncClient, context: Context, i: int):
+    return await client.post(
+        "/auth/token", data={"username": "benchmark", "password": PASSWORD}
+    )
+
+
+async def create_record(client: httpx.AsyncClient, context: Context, i: int):
+    # Deeds are stored by content hash, so every request sends distinct bytes
+    deed = context.deed + i.to_bytes(8, "big")
+    return await client.post(
+        "/records/create-record",
+        params={"location": f"Plot {i}"},
+        files={"file": (f"deed-{i}.pdf", deed, "application/pdf")},
+        headers=context.headers,
+    )
+
+
+async def issue(client: httpx.AsyncClient, context: Context, i: int):
+    return await client.post(
+        "/records/issue-record",
+        params={"land_holder_id": context.unissued[i]},
+        headers=context.headers,
+    )
+
+
+async def revoke(client: httpx.AsyncClient, context: Context, i: int):
+    return await client.get(
+        "/records/revoke-token",
+        params={"user_id": context.issued[i]},
+        headers=context.headers,
+    )
+
+
+SCENARIOS = {
+    "register": register,
+    "login": login,
+    "create-record": create_record,
+    "issue": issue,
+    "revoke": revoke,
+}
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    return latencies[max(int(len(latencies) * q) - 1, 0)]
+
+
+async def drain_jobs(engine: FakeEngine) -> float:
+    start = time.perf_counter()
+    while await engine.find(
+        Job, Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING])
+    ):
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    engine: FakeEngine,
+    context: Context,
+    name: str,
+    requests: int,
+    concurrency: int,
+) -> dict:
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    rejected = 0
+    indexes = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, rejected
+        for i in indexes:
+            start = time.perf_counter()
+            response = await scenario(client, context, i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code == 429:
+                rejected += 1
+            elif response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "errors": errors,
+        "rejected": rejected,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "jobs_drained_s": round(await drain_jobs(engine), 3),
+        "jobs_failed": len(await engine.find(Job, Job.status == JobStatus.FAILED)),
+    }
+
+
+def p99_regressions(
+    results: list[dict], baseline: list[dict], max_regression: float | None
+) -> list[str]:
+    """
+    Print each scenario's p99 change against `baseline` and return the
+    scenarios whose p99 grew by more than `max_regression` percent.
+    """
+    baseline_p99 = {result["scenario"]: result["p99_ms"] for result in baseline}
+    regressed = []
+    for result in results:
+        before = baseline_p99.get(result["scenario"])
+        if not before:
+            continue
+        change = (result["p99_ms"] - before) / before * 100
+        print(
+            f"{result['scenario']:<14} p99 {before:8.2f}ms -> "
+            f"{result['p99_ms']:8.2f}ms ({change:+.1f}%)"
+        )
+        if max_regression is not None and change > max_regression:
+            regressed.append(result["scenario"])
+    return regressed
+
+
+async def main(args) -> int:
+    engine, _, algod_client = install_fakes(
+        db_latency=args.db_latency,
+        s3_latency=args.s3_latency,
+        algod_latency=args.algod_latency,
+        round_time=args.round_time,
+    )
+    admission.enabled = args.admission
+    if args.bcrypt_rounds:
+        auth.pwd_context.update(bcrypt__rounds=args.bcrypt_rounds)
+    context = await seed(engine, args.requests, args.deed_size)
+
+    results = []
+    await job_queue.start()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            for name in args.scenarios:
+                result = await run_scenario(
+                    client, engine, context, name, args.requests, args.concurrency
+                )
+                results.append(result)
+                print(
+                    f"{name:<14} rps={result['rps']:9.2f} "
+                    f"p50={result['p50_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms "
+                    f"errors={result['errors']} rejected={result['rejected']} "
+                    f"jobs={result['jobs_drained_s']:.2f}s "
+                    f"failed jobs={result['jobs_failed']}"
+                )
+    finally:
+        await job_queue.stop()
+
+    print(f"algod calls: {dict(algod_client.calls)}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = p99_regressions(results, baseline, args.max_p99_regression)
+        if regressed:
+            print(
+                f"p99 regressed by more than {args.max_p99_regression}%: "
+                + ", ".join(regressed)
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=0.001)
+    parser.add_argument("--s3-latency", type=float, default=0.005)
+    parser.add_argument("--algod-latency", type=float, default=0.005)
+    parser.add_argument("--round-time", type=float, default=0.2)
+    parser.add_argument("--deed-size", type=int, default=256 * 1024)
+    parser.add_argument(
+        "--bcrypt-rounds",
+        type=int,
+        help="Lower the bcrypt cost to measure everything around hashing",
+    )
+    parser.add_argument(
+        "--admission",
+        action="store_true",
+        help="Keep admission control and rate limiting on",
+    )
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument(
+        "--baseline", help="Compare p99 latency with the results in this file"
+    )
+    parser.add_argument(
+        "--max-p99-regression",
+        type=float,
+        help="Exit nonzero when a p99 grew by more than this percent over "
+        "the baseline",
+    )
+    args = parser.parse_args()
+    if args.max_p99_regression is not None and not args.baseline:
+        parser.error("--max-p99-regression requires --baseline")
+    sys.exit(asyncio.run(main(args)))
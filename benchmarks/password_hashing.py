@@ -0,0 +1,93 @@
+"""
+Report `/auth/token` throughput for different bcrypt pool sizes, along with
+the latency of a cheap route while the logins are being processed.
+
+    python -m benchmarks.password_hashing --logins 32 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.fakes import FakeEngine, configure_environment
+
+configure_environment()
+
+import httpx  # noqa: E402
+
+import services.auth as auth  # noqa: E402
+from config.resources import resources  # noqa: E402
+from main import app  # noqa: E402
+from models.auth import Role, User  # noqa: E402
+
+
+async def login(client: httpx.AsyncClient):
+    response = await client.post(
+        "/auth/token", data={"username": "benchmark", "password": "benchmark"}
+    )
+    response.raise_for_status()
+
+
+async def ping(client: httpx.AsyncClient, done: asyncio.Event) -> list[float]:
+    latencies = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get("/")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def run(workers: int, logins: int):
+    auth.password_hasher = auth.PasswordHasher(workers=workers, max_pending=logins)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        done = asyncio.Event()
+        pinger = asyncio.create_task(ping(client, done))
+        start = time.perf_counter()
+        await asyncio.gather(*(login(client) for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        latencies = await pinger
+    auth.password_hasher.executor.shutdown()
+    print(
+        f"workers={workers:<3} logins/s={logins / elapsed:7.2f} "
+        f"GET / p50={statistics.median(latencies):.2f}ms max={max(latencies):.2f}ms"
+    )
+
+
+async def main(args):
+    resources.override(engine=FakeEngine())
+    await resources.engine.save(
+        User(
+            username="benchmark",
+            hash_password=auth.pwd_context.hash("benchmark"),
+            first_name="Bench",
+            surname="Mark",
+            national_id=1,
+            phone_number="0",
+            algorand_address="",
+            algorand_encrypted_private_key="",
+            role=Role.TOKEN_HOLDER,
+        )
+    )
+    print(f"{os.cpu_count()} cores available")
+    for workers in args.workers:
+        await run(workers, args.logins)
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, max(cores // 2, 1), cores, cores * 2}),
+    )
+    asyncio.run(main(parser.parse_args()))
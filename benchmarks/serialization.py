@@ -0,0 +1,101 @@
+"""
+Compare the ways a record listing can be turned into response bytes:
+
+- encoder: `jsonable_encoder` over the ODMantic models, then `json.dumps`
+  (what FastAPI does for routes without a response model)
+- response_model: FastAPI's re-validation and serialisation against
+  `RecordPage`, then `json.dumps`
+- model_response: validate each document once into `RecordView` and dump
+  the page to bytes with `ModelResponse`
+
+    python -m benchmarks.serialization --records 1000 100000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fakes import configure_environment
+
+configure_environment()
+
+from bson import ObjectId  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from models.records import Record, RecordPage, RecordView  # noqa: E402
+from services.responses import ModelResponse  # noqa: E402
+
+page_field = create_model_field("Response_RecordPage", RecordPage, mode="serialization")
+
+
+def documents(count: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "_id": ObjectId(),
+            "location": f"Plot {i}, Nairobi",
+            "file_url": f"https://bucket.example/deeds/{i:064x}",
+            "sha256": f"{i:064x}",
+            "verified": i % 2 == 0,
+            "user_id": str(ObjectId.from_datetime(now)),
+            "transaction_id": f"TX{i:050d}",
+            "asset_id": 1000 + i,
+            "revoke_transaction_id": None,
+            "is_land_revoked": False,
+        }
+        for i in range(count)
+    ]
+
+
+async def encoder(docs: list[dict]) -> bytes:
+    records = [Record.model_validate_doc(doc) for doc in docs]
+    return JSONResponse({"records": jsonable_encoder(records)}).body
+
+
+async def response_model(docs: list[dict]) -> bytes:
+    page = RecordPage(records=[RecordView.model_validate(doc) for doc in docs])
+    content = await serialize_response(
+        field=page_field, response_content=page, exclude_unset=True, is_coroutine=True
+    )
+    return JSONResponse(content).body
+
+
+async def model_response(docs: list[dict]) -> bytes:
+    page = RecordPage(records=[RecordView.model_validate(doc) for doc in docs])
+    return ModelResponse(page, exclude_unset=True).body
+
+
+async def measure(path, docs: list[dict], repeats: int) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        body = await path(docs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body)
+
+
+async def main(args):
+    for count in args.records:
+        docs = documents(count)
+        repeats = max(1, min(args.repeats, 100_000 // count))
+        print(f"{count} records, median of {repeats}")
+        baseline = None
+        for path in (encoder, response_model, model_response):
+            elapsed, size = await measure(path, docs, repeats)
+            baseline = baseline or elapsed
+            print(
+                f"  {path.__name__:<15} {elapsed:9.1f}ms "
+                f"x{baseline / elapsed:5.2f} {size / 1e6:7.2f}MB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--repeats", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
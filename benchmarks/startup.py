@@ -0,0 +1,63 @@
+"""
+Profile how long `import main` takes in a fresh interpreter, which is most
+of a cold start, and list the modules that cost the most.
+
+    python -m benchmarks.startup --runs 5 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.fakes import configure_environment
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(elapsed, int("boto3" in sys.modules))
+"""
+
+
+def import_once(env: dict) -> tuple[float, bool, dict[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    elapsed, boto3_loaded = result.stdout.split()
+    # stderr lines look like "import time: self [us] | cumulative | name"
+    self_times = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[0].split(":")[-1].strip().isdigit():
+            self_times[parts[2].strip()] = int(parts[0].split(":")[-1])
+    return float(elapsed), boto3_loaded == "1", self_times
+
+
+def main(args):
+    configure_environment()
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    runs = [import_once(env) for _ in range(args.runs)]
+    elapsed = [run[0] for run in runs]
+    print(
+        f"import main: median {statistics.median(elapsed) * 1000:.0f}ms "
+        f"min {min(elapsed) * 1000:.0f}ms over {args.runs} runs"
+    )
+    print(f"boto3 imported: {runs[-1][1]}")
+    print("slowest modules by self time (last run):")
+    self_times = runs[-1][2]
+    for name in sorted(self_times, key=self_times.get, reverse=True)[: args.top]:
+        print(f"  {self_times[name] / 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    main(parser.parse_args())
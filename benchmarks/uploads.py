@@ -0,0 +1,76 @@
+"""
+Measure deed upload throughput against a local S3 stand-in, and how long the
+event loop stalls while the uploads run.
+
+    python -m benchmarks.uploads --sizes 1 10 100 --bandwidth 50
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import time
+
+from benchmarks.fakes import FakeS3Client, configure_environment
+
+configure_environment()
+
+from fastapi import UploadFile  # noqa: E402
+from starlette.datastructures import Headers  # noqa: E402
+
+import services.upload as upload  # noqa: E402
+from config.settings import settings  # noqa: E402
+
+MB = 1024 * 1024
+
+
+async def loop_lag(done: asyncio.Event) -> float:
+    worst = 0.0
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst * 1000
+
+
+async def run(client: FakeS3Client, size_mb: int):
+    content = os.urandom(size_mb * MB)
+    file_obj = UploadFile(
+        file=io.BytesIO(content),
+        filename=f"deed-{size_mb}mb.pdf",
+        headers=Headers({"content-type": "application/pdf"}),
+    )
+    done = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(done))
+    start = time.perf_counter()
+    uploaded = await upload.upload_file_to_bucket(file_obj, s3_client=client)
+    elapsed = time.perf_counter() - start
+    done.set()
+    stall = await lag
+    assert uploaded.sha256 == hashlib.sha256(content).hexdigest()
+    assert client.read("land-records", file_obj.filename) == content
+    print(
+        f"{size_mb:>4} MB  {elapsed:6.2f}s  {size_mb / elapsed:7.2f} MB/s  "
+        f"max loop stall {stall:.2f}ms"
+    )
+
+
+async def main(args):
+    client = FakeS3Client(latency=args.latency, bandwidth=args.bandwidth * MB)
+    settings.upload_concurrency = args.concurrency
+    print(
+        f"part size {settings.upload_part_size // MB} MB, "
+        f"{args.concurrency} parts in flight, {args.bandwidth} MB/s per connection"
+    )
+    for size_mb in args.sizes:
+        await run(client, size_mb)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--bandwidth", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=settings.upload_concurrency)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+import os
+
+from algosdk.v2client import algod
+from motor.motor_asyncio import AsyncIOMotorClient
+from odmantic import AIOEngine
+
+from config.settings import settings
+from services.metrics import MongoCommandTimer
+
+
+class Resources:
+    """
+    Clients for MongoDB, Spaces and algod. Each one is created on first use
+    in the worker process that needs it, so importing the app builds nothing
+    and a forked worker never shares its parent's connections. The app
+    lifespan closes them on shutdown.
+    """
+
+    def __init__(self):
+        self._mongo_client = None
+        self._engine = None
+        self._s3_client = None
+        self._algod_client = None
+
+    @property
+    def mongo_client(self) -> AsyncIOMotorClient:
+        if self._mongo_client is None:
+            self._mongo_client = AsyncIOMotorClient(
+                settings.mongo_db_uri,
+                maxPoolSize=settings.mongo_max_pool_size,
+                minPoolSize=settings.mongo_min_pool_size,
+                maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+                event_listeners=[MongoCommandTimer()],
+            )
+        return self._mongo_client
+
+    @property
+    def engine(self) -> AIOEngine:
+        if self._engine is None:
+            self._engine = AIOEngine(client=self.mongo_client, database="nft_platform")
+        return self._engine
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            # boto3 takes a noticeable share of startup, so load it on demand
+            import boto3
+            from botocore.config import Config
+
+            self._s3_client = boto3.client(
+                "s3",
+                region_name="ams3",
+                endpoint_url="https://ams3.digitaloceanspaces.com",
+                aws_access_key_id=settings.digital_ocean_access_key,
+                aws_secret_access_key=settings.digital_ocean_secret_key,
+                config=Config(
+                    max_pool_connections=settings.upload_max_workers,
+                    tcp_keepalive=settings.s3_tcp_keepalive,
+                ),
+            )
+        return self._s3_client
+
+    @property
+    def algod_client(self) -> algod.AlgodClient:
+        if self._algod_client is None:
+            self._algod_client = algod.AlgodClient(
+                algod_token="", algod_address=settings.algod_address
+            )
+        return self._algod_client
+
+    def override(self, **clients):
+        """
+        Use the given clients instead of building them, e.g.
+        `resources.override(engine=..., s3_client=..., algod_client=...)`.
+        """
+        for name, client in clients.items():
+            setattr(self, f"_{name}", client)
+
+    def forget(self):
+        """
+        Drop references to every client without closing them.
+        """
+        self._mongo_client = None
+        self._engine = None
+        self._s3_client = None
+        self._algod_client = None
+
+    def close(self):
+        if self._mongo_client is not None:
+            self._mongo_client.close()
+        if self._s3_client is not None and hasattr(self._s3_client, "close"):
+            self._s3_client.close()
+        self.forget()
+
+
+resources = Resources()
+
+# A forked worker must build its own clients; the parent's sockets and
+# monitor threads do not survive the fork.
+os.register_at_fork(after_in_child=resources.forget)
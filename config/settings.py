@@ -13,6 +13,54 @@ class Settings(BaseSettings):
     digital_ocean_access_key: str
     digital_ocean_secret_key: str
     algod_address: str
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int | None = None
+    s3_tcp_keepalive: bool = True
+    algod_max_workers: int = 8
+    algod_params_ttl: float = 5.0
+    issue_valid_rounds: int = 20
+    job_workers: int = 4
+    job_lease_seconds: int = 120
+    job_poll_interval: float = 5.0
+    job_max_attempts: int = 3
+    batch_group_concurrency: int = 8
+    password_hash_workers: int | None = None
+    password_hash_max_pending: int = 64
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 30.0
+    signing_key_cache_size: int = 32
+    signing_key_cache_ttl: float = 60.0
+    upload_part_size: int = 8 * 1024 * 1024
+    upload_concurrency: int = 4
+    upload_max_workers: int = 16
+    upload_url_expires: int = 900
+    upload_max_size: int = 100 * 1024 * 1024
+    record_page_size: int = 100
+    record_stream_batch_size: int = 500
+    verify_cache_size: int = 10000
+    verify_cache_ttl: float = 60.0
+    verify_batch_concurrency: int = 32
+    chain_mirror_enabled: bool = False
+    chain_mirror_start_round: int | None = None
+    chain_mirror_fetch_concurrency: int = 8
+    chain_mirror_max_lag: int = 5
+    chain_mirror_retry_interval: float = 5.0
+    idempotency_ttl: int = 24 * 3600
+    idempotency_lock_seconds: int = 300
+    idempotency_wait_seconds: float = 30.0
+    idempotency_poll_interval: float = 0.25
+    metrics_token: str | None = None
+    admission_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    rate_limit_cache_size: int = 100000
+    trust_forwarded_for: bool = False
+    auth_max_concurrent: int = 32
+    auth_rate: float = 0.5
+    auth_burst: int = 10
+    issue_max_concurrent: int = 16
+    issue_rate: float = 2.0
+    issue_burst: int = 20
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -1,13 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from config.resources import resources
+from config.settings import settings
 from routes.auth import authRouter
 from routes.default import defaultRouter
 from routes.records import recordsRouter
 from routes.verify import verifyRouter
+from services.admission import AdmissionMiddleware
+from services.chain_mirror import chain_mirror
+from services.crypto import signing_key_cache
+from services.indexes import ensure_indexes
+from services.jobs import job_queue
+from services.metrics import MetricsMiddleware
+from services.responses import ModelResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    await job_queue.start()
+    if settings.chain_mirror_enabled:
+        await chain_mirror.start()
+    # Wipe decrypted signing keys soon after they expire, even when idle
+    key_sweeper = asyncio.create_task(
+        signing_key_cache.sweep(settings.signing_key_cache_ttl / 4)
+    )
+    yield
+    key_sweeper.cancel()
+    await chain_mirror.stop()
+    await job_queue.stop()
+    resources.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ModelResponse)
 
+# Added first so it runs inside CORS and its 429s are still readable
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -15,6 +47,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(defaultRouter, tags=["Entry Point"])
 app.include_router(authRouter, tags=["Authentication"])
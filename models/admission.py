@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from odmantic import Model
+
+
+class RateLimitBucket(Model):
+    """
+    A client's token bucket for one route, shared by every API process.
+    `admitted` tells whether the last request took a token.
+    """
+
+    key: str
+    tokens: float
+    admitted: bool
+    updated_at: datetime
+    expires_at: datetime
+
+    model_config = {"collection": "rate_limits"}
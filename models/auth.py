@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Optional
 
-from odmantic import Model
+from odmantic import Model, ObjectId
 from pydantic import BaseModel
 
 
@@ -24,6 +24,24 @@ class User(Model):
     disabled: bool = False
 
 
+class PublicUser(BaseModel):
+    """
+    What a user may see of an account; leaves out the password hash and the
+    encrypted signing key.
+    """
+
+    id: ObjectId
+    username: str
+    first_name: str
+    surname: str
+    national_id: int
+    phone_number: str
+    algorand_address: str
+    role: Role
+    file_id: Optional[str] = None
+    disabled: bool = False
+
+
 class CreateUser(BaseModel):
     username: str
     password: str
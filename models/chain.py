@@ -0,0 +1,69 @@
+from enum import Enum
+from typing import Optional
+
+from odmantic import Model
+from pydantic import BaseModel
+
+
+class MirroredAsset(Model):
+    """
+    An ASA created by one of our token issuers, as of `round`.
+    """
+
+    asset_id: int
+    creator: str
+    url: str = ""
+    clawback: Optional[str] = None
+    destroyed: bool = False
+    round: int
+
+    model_config = {"collection": "mirrored_assets"}
+
+
+class AssetHolding(Model):
+    """
+    An account's balance of a mirrored ASA, as of the last round that
+    changed it. `opted_in` turns false when the account closes it out.
+    """
+
+    asset_id: int
+    address: str
+    amount: int = 0
+    opted_in: bool = True
+    round: int
+
+    model_config = {"collection": "asset_holdings"}
+
+
+class SyncCheckpoint(Model):
+    """
+    Last round whose blocks a chain follower has fully applied.
+    """
+
+    name: str
+    round: int
+
+    model_config = {"collection": "sync_checkpoints"}
+
+
+class ReconciliationIssue(str, Enum):
+    NOT_MIRRORED = "not_mirrored"
+    ASSET_DESTROYED = "asset_destroyed"
+    NOT_HELD = "not_held"
+    STILL_HELD = "still_held"
+    UNVERIFIED_BUT_HELD = "unverified_but_held"
+    DEED_MISMATCH = "deed_mismatch"
+
+
+class ReconciliationItem(BaseModel):
+    record_id: str
+    user_id: str
+    asset_id: int
+    issue: ReconciliationIssue
+    detail: str
+
+
+class ReconciliationReport(BaseModel):
+    round: Optional[int] = None
+    checked: int = 0
+    mismatches: list[ReconciliationItem] = []
@@ -0,0 +1,30 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from odmantic import Model
+
+
+class IdempotencyStatus(str, Enum):
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+
+class IdempotencyRecord(Model):
+    """
+    The response stored for an `Idempotency-Key`. `key` is scoped to the
+    user and route; `owner` identifies the request holding the lock while
+    it runs. Mongo removes the document once `expires_at` has passed.
+    """
+
+    key: str
+    fingerprint: str
+    owner: str
+    status: IdempotencyStatus = IdempotencyStatus.IN_PROGRESS
+    status_code: Optional[int] = None
+    media_type: Optional[str] = None
+    body: Optional[bytes] = None
+    lock_expires_at: datetime
+    expires_at: datetime
+
+    model_config = {"collection": "idempotency_keys"}
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+
+from odmantic import Field, Model, ObjectId
+from pydantic import BaseModel
+
+from models.records import RecordBatchItem
+
+
+class JobKind(str, Enum):
+    ISSUE = "issue"
+    REVOKE = "revoke"
+    ISSUE_BATCH = "issue_batch"
+    REVOKE_BATCH = "revoke_batch"
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Job(Model):
+    kind: JobKind
+    issuer_id: str
+    land_holder_id: Optional[str] = None
+    land_holder_ids: list[str] = Field(default_factory=list)
+    status: JobStatus = JobStatus.PENDING
+    attempts: int = 0
+    record_id: Optional[str] = None
+    asset_id: Optional[int] = None
+    transaction_id: Optional[str] = None
+    report: list[RecordBatchItem] = Field(default_factory=list)
+    error: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    lease_token: Optional[str] = None
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+
+
+class JobView(BaseModel):
+    """
+    What the issuer who queued a job sees of it. Leases and attempt counts
+    stay internal.
+    """
+
+    id: ObjectId
+    kind: JobKind
+    status: JobStatus
+    record_id: Optional[str] = None
+    asset_id: Optional[int] = None
+    transaction_id: Optional[str] = None
+    report: list[RecordBatchItem] = []
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
@@ -2,16 +2,96 @@ from enum import Enum
 from typing import Optional
 
 from fastapi import File, UploadFile
-from odmantic import Model
-from pydantic import BaseModel
+from odmantic import Model, ObjectId
+from pydantic import BaseModel, Field
+
+
+class TransactionAttempt(BaseModel):
+    """
+    A signed transaction saved before it is sent, so that a retry can look
+    up whether it was confirmed instead of sending another one.
+    """
+
+    txid: str
+    first_valid: int
+    last_valid: int
 
 
 class Record(Model):
     location: str
     file_url: str
+    sha256: Optional[str] = None
     verified: bool
     user_id: str
     transaction_id: Optional[str] = None
     asset_id: Optional[int] = None
     revoke_transaction_id: Optional[str] = None
     is_land_revoked: bool = False
+    asset_attempt: Optional[TransactionAttempt] = None
+    transfer_attempt: Optional[TransactionAttempt] = None
+    revoke_attempt: Optional[TransactionAttempt] = None
+
+
+class RecordView(BaseModel):
+    """
+    A record as read straight from the collection. Only `id` is always
+    present, so a listing can fetch just the fields it was asked for.
+    """
+
+    id: ObjectId = Field(validation_alias="_id")
+    location: Optional[str] = None
+    file_url: Optional[str] = None
+    sha256: Optional[str] = None
+    verified: Optional[bool] = None
+    user_id: Optional[str] = None
+    transaction_id: Optional[str] = None
+    asset_id: Optional[int] = None
+    revoke_transaction_id: Optional[str] = None
+    is_land_revoked: Optional[bool] = None
+
+
+RECORD_FIELDS = frozenset(RecordView.model_fields) - {"id"}
+
+
+class RecordPage(BaseModel):
+    records: list[RecordView]
+    next_after: Optional[str] = None
+
+
+class UploadRequest(BaseModel):
+    filename: str
+    content_type: str = "application/pdf"
+    size: int = Field(gt=0)
+    sha256: str = Field(pattern="^[0-9a-f]{64}$")
+
+
+class UploadTicket(BaseModel):
+    key: str
+    exists: bool = False
+    url: Optional[str] = None
+    headers: dict[str, str] = {}
+    expires_in: int = 0
+
+
+class FinalizeUpload(BaseModel):
+    sha256: str = Field(pattern="^[0-9a-f]{64}$")
+    location: str
+
+
+class RecordBatch(BaseModel):
+    land_holder_ids: list[str] = Field(min_length=1, max_length=1000)
+
+
+class BatchItemStatus(str, Enum):
+    ISSUED = "issued"
+    REVOKED = "revoked"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+class RecordBatchItem(BaseModel):
+    land_holder_id: str
+    status: BatchItemStatus = BatchItemStatus.FAILED
+    asset_id: Optional[int] = None
+    transaction_id: Optional[str] = None
+    detail: Optional[str] = None
@@ -1,7 +1,8 @@
 from enum import Enum
+from typing import Optional
 
 from odmantic import Model
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class VerifyUser(BaseModel):
@@ -10,6 +11,32 @@ class VerifyUser(BaseModel):
     company_name: str
     email: str
     national_id: int
+    # SHA-256 of the deed the third party was shown, if it has a copy
+    sha256: Optional[str] = Field(default=None, pattern="^[0-9a-f]{64}$")
+
+
+class VerifyBatch(BaseModel):
+    items: list[VerifyUser] = Field(min_length=1, max_length=10000)
+
+
+class VerificationStatus(str, Enum):
+    VERIFIED = "verified"
+    REVOKED = "revoked"
+    MISMATCH = "mismatch"
+    NOT_ISSUED = "not_issued"
+    NOT_FOUND = "not_found"
+    ERROR = "error"
+
+
+class VerificationResult(BaseModel):
+    national_id: int
+    status: VerificationStatus
+    asset_id: Optional[int] = None
+    location: Optional[str] = None
+    holds_asset: Optional[bool] = None
+    deed_matches: Optional[bool] = None
+    round: Optional[int] = None
+    detail: Optional[str] = None
 
 
 class ThirdPartyUser(Model):
@@ -3,16 +3,17 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from odmantic.exceptions import DuplicateKeyError
 
-from models.auth import CreateUser, Token, User
+from models.auth import CreateUser, PublicUser, Token, User
 from services.algorand import generate_algorand_keypair
 from services.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     authenticate_user,
     create_access_token,
-    engine,
     get_current_active_user,
     get_password_hash,
+    save_user,
 )
 from services.crypto import encrypt_data
 
@@ -20,17 +21,13 @@ authRouter = APIRouter(prefix="/auth")
 
 
 # POST Register new user
-@authRouter.post("/register", status_code=status.HTTP_201_CREATED)
+@authRouter.post(
+    "/register", status_code=status.HTTP_201_CREATED, response_model=PublicUser
+)
 async def register_new_User(data: CreateUser):
 
-    user_exist = await engine.find_one(User, User.username == data.username)
-    if user_exist:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists."
-        )
-
     # Password hashing
-    hash_password = get_password_hash(data.password)
+    hash_password = await get_password_hash(data.password)
 
     # Generate Algorand keypair
     private_key, address = generate_algorand_keypair()
@@ -39,7 +36,7 @@ async def register_new_User(data: CreateUser):
     encrypted_private_key = encrypt_data(private_key)
 
     # Create user instance
-    save_user = User(
+    new_user = User(
         username=data.username,
         first_name=data.first_name,
         surname=data.surname,
@@ -51,8 +48,14 @@ async def register_new_User(data: CreateUser):
         role=data.role,
     )
 
-    await engine.save(save_user)
-    return save_user
+    # The unique username index rejects existing users
+    try:
+        await save_user(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists."
+        )
+    return new_user
 
 
 @authRouter.post("/token")
@@ -74,9 +77,9 @@ async def login_for_access_token(
     return Token(access_token=access_token, token_type="bearer")
 
 
-@authRouter.get("/me/", response_model=User)
+@authRouter.get("/me/", response_model=PublicUser)
 async def read_users_me(
-    current_user: Annotated[User, Depends(get_current_active_user)]
+    current_user: Annotated[User, Depends(get_current_active_user)],
 ):
     return current_user
 
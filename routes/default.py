@@ -1,4 +1,10 @@
-from fastapi import APIRouter
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+
+from config.settings import settings
+from services import metrics
 
 defaultRouter = APIRouter()
 
@@ -7,3 +13,21 @@ defaultRouter = APIRouter()
 @defaultRouter.get("/")
 async def entry_point():
     return {"message": "welcome to Application Server!"}
+
+
+# Prometheus scrape target, served only to scrapers presenting
+# `metrics_token` as a bearer token
+@defaultRouter.get("/metrics", include_in_schema=False)
+async def read_metrics(authorization: Annotated[str, Header()] = ""):
+    if settings.metrics_token is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(
+        token.encode(), settings.metrics_token.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,72 +1,217 @@
+import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from bson import ObjectId
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from odmantic.query import QueryExpression
 
-from config.database import engine
+from config.resources import resources
+from config.settings import settings
 from models.auth import User
-from models.records import Record
+from models.chain import ReconciliationReport
+from models.jobs import Job, JobKind, JobView
+from models.records import (
+    FinalizeUpload,
+    Record,
+    RecordBatch,
+    RecordPage,
+    UploadRequest,
+    UploadTicket,
+)
 from services.auth import get_current_active_user
-from services.upload import upload_file_to_bucket
-from services.algorand import create_asa, opt_in_to_asa, revoke_asa, transfer_asa
-from services.crypto import decrypt_data
+from services.chain_mirror import ChainMirrorUnavailable, reconcile_records
+from services.idempotency import idempotent, request_fingerprint
+from services.jobs import job_queue
+from services.records import (
+    RecordWorkflowError,
+    after_id,
+    find_records_page,
+    load_land_holder,
+    record_projection,
+    save_land_record,
+    stream_records,
+)
+from services.responses import ModelResponse
+from services.upload import (
+    UploadVerificationError,
+    create_upload_url,
+    deed_key,
+    hash_file,
+    object_exists,
+    staging_key,
+    store_deed,
+    verify_uploaded_file,
+)
+
+logger = logging.getLogger(__name__)
 
 recordsRouter = APIRouter(prefix="/records")
 
 
 # POST Create Land deed Records
-@recordsRouter.post("/create-record")
+@recordsRouter.post("/create-record", response_model=Record)
 async def create_record(
     current_user: Annotated[User, Depends(get_current_active_user)],
     location: str,
     file: UploadFile = File(...),
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ):
     """
     Create Land record. This endpoint is supposed to create an unverified
     record. Steps:
     1. User sends land record (pdf) with metadata (name, location, etc)
     2. Save user info. Save status of verified to false
-    3. If saved successfully, save the pdf document in AWS S3 bucket
+    3. If saved successfully, save the pdf document in AWS S3 bucket under
+       its content hash, skipping the upload if it is already stored
+    4. A retry with the same Idempotency-Key header and the same deed
+       content gets the first response back instead of creating another
+       record
     """
+    sha256, size = await hash_file(file)
 
-    # Upload object to S3 bucket
-    try:
-        file_url = upload_file_to_bucket(file_obj=file)
-    except Exception as e:
-        print(e)
+    async def create():
+        # Upload object to S3 bucket
+        try:
+            uploaded = await store_deed(file_obj=file, hashed=(sha256, size))
+        except Exception as e:
+            logger.error("Error uploading deed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error uploading file to S3 bucket. {e}",
+            )
+
+        # Save record to database
+        try:
+            record = await save_land_record(current_user, location, uploaded)
+        except RecordWorkflowError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return ModelResponse(record)
+
+    fingerprint = request_fingerprint(location, sha256)
+    return await idempotent(
+        current_user, "create-record", idempotency_key, fingerprint, create
+    )
+
+
+# POST Request a URL to upload a land deed straight to storage
+@recordsRouter.post("/upload-url", response_model=UploadTicket)
+async def request_upload_url(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    data: UploadRequest,
+):
+    """
+    First step of a direct upload. Steps:
+    1. User declares the deed's file name, type, size and SHA-256
+    2. If a deed with that SHA-256 is already stored, nothing is uploaded
+    3. Otherwise server returns a presigned PUT URL for a staging key of
+       the user, and the headers to send
+    4. User uploads the pdf straight to the bucket, then calls /finalize
+    """
+    if data.size > settings.upload_max_size:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error uploading file to S3 bucket. {e}",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File is too large.",
         )
 
-    # Save record to database
-    save_file = Record(
-        location=location,
-        file_url=file_url,
-        verified=False,
-        user_id=str(current_user.id),
+    # Identical deeds share one object; there is nothing to upload
+    key = deed_key(data.sha256)
+    if await object_exists(key):
+        return UploadTicket(key=key, exists=True)
+
+    url, headers = create_upload_url(
+        staging_key(str(current_user.id), data.sha256),
+        data.content_type,
+        data.size,
+        data.sha256,
+    )
+    return UploadTicket(
+        key=key, url=url, headers=headers, expires_in=settings.upload_url_expires
     )
 
-    user = engine.find_one(User, User.id == current_user.id)
-    if user:
-        user.file_id = str(save_file.id)
-        await engine.save(user)
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error saving record. Please try again.",
+
+# POST Create Land deed Record from a direct upload
+@recordsRouter.post("/finalize", response_model=Record)
+async def finalize_upload(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    data: FinalizeUpload,
+):
+    """
+    Second step of a direct upload. Steps:
+    1. Check the uploaded deed's size and checksum, hashing it server-side
+       when storage does not report one, and move it into `deeds/`
+    2. Save the unverified record
+    """
+    try:
+        uploaded = await verify_uploaded_file(str(current_user.id), data.sha256)
+    except UploadVerificationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        record = await save_land_record(current_user, data.location, uploaded)
+    except RecordWorkflowError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ModelResponse(record)
+
+
+async def list_records(
+    expression: QueryExpression,
+    limit: int,
+    after: str | None,
+    stream: bool,
+    fields: str | None,
+):
+    """
+    Return one keyset page of records, or every record after `after` as an
+    NDJSON stream. `fields` limits each record to the named fields plus id.
+    """
+    try:
+        projection = record_projection(fields)
+        if stream:
+            # Validate the cursor before the response starts
+            after_id(expression, after)
+            return StreamingResponse(
+                stream_records(expression, after, projection),
+                media_type="application/x-ndjson",
+            )
+        records, next_after = await find_records_page(
+            expression, limit, after, projection
         )
-    return save_file
+    except RecordWorkflowError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ModelResponse(
+        RecordPage(records=records, next_after=next_after), exclude_unset=True
+    )
 
 
 # GET Fetch all unverified land deeds
-@recordsRouter.get("/fetch-unverified-records")
+@recordsRouter.get(
+    "/fetch-unverified-records",
+    response_model=RecordPage,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
 async def fetch_all_unverified_records(
-    current_user: Annotated[User, Depends(get_current_active_user)]
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = settings.record_page_size,
+    after: str | None = None,
+    stream: bool = False,
+    fields: str | None = None,
 ):
     """
     Fetch all unverified land records
     1. Check user is token issuer
-    2. Fetch all unverified users
+    2. Fetch unverified records a page at a time; pass `next_after` back as
+       `after` for the next page, or set `stream` for NDJSON; `fields`
+       picks a comma separated subset of record fields
     """
     if current_user.role != "token_issuer":
         raise HTTPException(
@@ -74,19 +219,28 @@ async def fetch_all_unverified_records(
             detail="You are not authorised to access this resource.",
         )
 
-    records = await engine.find(Record, Record.verified == False)
-    return records
+    return await list_records(Record.verified == False, limit, after, stream, fields)
 
 
 # GET Fetch record
-@recordsRouter.get("/fetch-record")
+@recordsRouter.get(
+    "/fetch-record",
+    response_model=RecordPage,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
 async def fetch_all_records(
-    current_user: Annotated[User, Depends(get_current_active_user)]
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = settings.record_page_size,
+    after: str | None = None,
+    stream: bool = False,
+    fields: str | None = None,
 ):
     """
-    Fetch a single record
+    Fetch records
     1. Check user is token issuer
-    2. Fetch record
+    2. Fetch records a page at a time; pass `next_after` back as `after` for
+       the next page, or set `stream` for NDJSON; `fields` picks a comma
+       separated subset of record fields
     """
     if current_user.role != "token_issuer":
         raise HTTPException(
@@ -94,21 +248,24 @@ async def fetch_all_records(
             detail="You are not authorised to access this resource.",
         )
 
-    record = await engine.find(Record)
-    return record
+    return await list_records(QueryExpression(), limit, after, stream, fields)
 
 
 # POST Verify land record and create NFT on Algorand blockcahin
-@recordsRouter.post("/issue-record", status_code=status.HTTP_201_CREATED)
+@recordsRouter.post("/issue-record", status_code=status.HTTP_202_ACCEPTED)
 async def issue_digital_land_record(
-    current_user: Annotated[User, Depends(get_current_active_user)], land_holder_id: str
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    land_holder_id: str,
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ):
     """
     Verify and Create tokenised version of land record.
     1. Check user is token issuer
-    2. Once checked, create ASA representing land record
-    3. Land Holder opts-in to ASA
-    4. Transfer ASA to land holder
+    2. Queue an issuance job and return its id straight away
+    3. A worker creates the ASA representing the land record, then the land
+       holder opts-in to it and receives it in one atomic group
+    4. Poll /records/jobs/{job_id} for the outcome; a retry with the same
+       Idempotency-Key header gets the same job id instead of a new job
     """
     if current_user.role != "token_issuer":
         raise HTTPException(
@@ -116,57 +273,66 @@ async def issue_digital_land_record(
             detail="You are not authorised to access this resource.",
         )
 
-    land_holder = await engine.find_one(User, User.id == land_holder_id)
-    if not land_holder:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Land holder not found.",
-        )
+    async def enqueue():
+        try:
+            await load_land_holder(land_holder_id)
+        except RecordWorkflowError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
-    land_holder_record = await engine.find_one(Record, Record.user_id == land_holder_id)
-    if not land_holder_record:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Land holder record not found.",
+        job = await job_queue.enqueue(
+            JobKind.ISSUE,
+            issuer_id=str(current_user.id),
+            land_holder_id=land_holder_id,
+        )
+        return ModelResponse(
+            {"detail": "Issuance queued", "job_id": str(job.id)},
+            status_code=status.HTTP_202_ACCEPTED,
         )
 
-    # Create ASA
-    asset_id = create_asa(
-        private_key=decrypt_data(current_user.algorand_encrypted_private_key.encode()),
-        creator_address=current_user.algorand_address,
-        asset_name=f"{land_holder.first_name}_{land_holder.surname}_{land_holder_record.location}",
-        unit_name=f"{land_holder.first_name}_{land_holder.surname}_{land_holder_record.location}",
-        total=1,  # Algorand configiration for NFT
-        decimals=0,  # Algorand configuration for NFT
-        url=land_holder_record.file_url,
-    )
-
-    # Land owner opts-in to ASA
-    opt_in_to_asa(
-        private_key=decrypt_data(land_holder.algorand_encrypted_private_key.encode()),
-        address=land_holder.algorand_address,
-        asset_id=asset_id,
+    return await idempotent(
+        current_user,
+        "issue-record",
+        idempotency_key,
+        request_fingerprint(land_holder_id),
+        enqueue,
     )
 
-    # Transfer ASA to land holder
-    transaction_id = transfer_asa(
-        private_key=decrypt_data(current_user.algorand_encrypted_private_key.encode()),
-        sender_address=current_user.algorand_address,
-        receiver_address=land_holder.algorand_address,
-        asset_id=asset_id,
-        amount=1,
-    )
 
-    # save transaction id to Record document
-    land_holder_record.transaction_id = transaction_id
-    land_holder_record.verified = True
-    await engine.save(land_holder_record)
+# POST Verify many land records and create their NFTs
+@recordsRouter.post("/issue-batch", status_code=status.HTTP_202_ACCEPTED)
+async def issue_digital_land_records(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    data: RecordBatch,
+):
+    """
+    Verify and create tokenised versions of many land records at once.
+    1. Check user is token issuer
+    2. Queue a batch issuance job and return its id straight away
+    3. A worker resolves all land holders and their records in one query
+       each, creates the ASAs in atomic groups, then opts in and transfers
+       them to the land holders in atomic groups
+    4. Poll /records/jobs/{job_id}; its `report` holds the outcome for every
+       land holder
+    """
+    if current_user.role != "token_issuer":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorised to access this resource.",
+        )
 
-    return land_holder_record
+    job = await job_queue.enqueue(
+        JobKind.ISSUE_BATCH,
+        issuer_id=str(current_user.id),
+        land_holder_ids=data.land_holder_ids,
+    )
+    return ModelResponse(
+        {"detail": "Issuance queued", "job_id": str(job.id)},
+        status_code=status.HTTP_202_ACCEPTED,
+    )
 
 
 # POST Revoke Land record token
-@recordsRouter.get("/revoke-token", status_code=status.HTTP_200_OK)
+@recordsRouter.get("/revoke-token", status_code=status.HTTP_202_ACCEPTED)
 async def revoke_token(
     current_user: Annotated[User, Depends(get_current_active_user)],
     user_id: str,
@@ -174,7 +340,7 @@ async def revoke_token(
     """
     Revoke user's ASA representaiton of land record.
     1. Check user is token issuer.
-    2. Token issuer initiates a clawback transaction.
+    2. Queue a revocation job; a worker initiates the clawback transaction.
     """
     if current_user.role != "token_issuer":
         raise HTTPException(
@@ -182,33 +348,91 @@ async def revoke_token(
             detail="You are not authorised to access this resource.",
         )
 
-    land_holder = await engine.find_one(User, User.id == user_id)
+    try:
+        await load_land_holder(user_id)
+    except RecordWorkflowError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    job = await job_queue.enqueue(
+        JobKind.REVOKE, issuer_id=str(current_user.id), land_holder_id=user_id
+    )
+    return {"detail": "Revocation queued", "job_id": str(job.id)}
+
 
-    if not land_holder:
+# POST Revoke many Land record tokens
+@recordsRouter.post("/revoke-batch", status_code=status.HTTP_202_ACCEPTED)
+async def revoke_tokens(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    data: RecordBatch,
+):
+    """
+    Revoke the ASA representations of many land records, e.g. for a court
+    order covering several land holders.
+    1. Check user is token issuer.
+    2. Queue a batch revocation job and return its id straight away.
+    3. A worker resolves all land holders and their records in one query
+       each and initiates clawback transactions in atomic groups.
+    4. Poll /records/jobs/{job_id}; its `report` holds the outcome for every
+       land holder.
+    """
+    if current_user.role != "token_issuer":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Land holder not found.",
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorised to access this resource.",
         )
 
-    land_holder_record = await engine.find_one(Record, Record.user_id == user_id)
-    if not land_holder_record:
+    job = await job_queue.enqueue(
+        JobKind.REVOKE_BATCH,
+        issuer_id=str(current_user.id),
+        land_holder_ids=data.land_holder_ids,
+    )
+    return ModelResponse(
+        {"detail": "Revocation queued", "job_id": str(job.id)},
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+# GET Issuance or revocation job status
+@recordsRouter.get("/jobs/{job_id}", response_model=JobView)
+async def get_job_status(
+    current_user: Annotated[User, Depends(get_current_active_user)], job_id: str
+):
+    """
+    Fetch the status of an issuance or revocation job queued by the user.
+    """
+    job = None
+    if ObjectId.is_valid(job_id):
+        job = await resources.engine.find_one(
+            Job, Job.id == ObjectId(job_id), Job.issuer_id == str(current_user.id)
+        )
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Land holder record not found.",
+            detail="Job not found.",
         )
+    return ModelResponse(JobView.model_validate(job, from_attributes=True))
 
-    # Revoke ASA
-    revoke_txid = revoke_asa(
-        private_key=decrypt_data(current_user.algorand_encrypted_private_key.encode()),
-        clawback_address=current_user.algorand_address,
-        asset_id=land_holder_record.asset_id,
-        holder_address=land_holder.algorand_address,
-        amount=1,
-    )
 
-    # save revoke transaction id to Record document
-    land_holder_record.revoke_transaction_id = revoke_txid
-    land_holder_record.is_land_revoked = True
-    await engine.save(land_holder_record)
+# GET Records whose state the chain disagrees with
+@recordsRouter.get("/reconcile", response_model=ReconciliationReport)
+async def reconcile(current_user: Annotated[User, Depends(get_current_active_user)]):
+    """
+    Compare land records with the local mirror of the chain.
+    1. Check user is token issuer
+    2. Look up every issued record's asset and holder balance in the mirror
+    3. Report records whose verified or revoked state the chain does not
+       bear out, with the round the mirror had reached
+    Answers 503 while the mirror is off or still seeding.
+    """
+    if current_user.role != "token_issuer":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorised to access this resource.",
+        )
 
-    return {"detail": "Asset Revoked", "transaction_id": revoke_txid}
+    try:
+        return await reconcile_records()
+    except ChainMirrorUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
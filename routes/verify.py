@@ -1,19 +1,62 @@
-from fastapi import APIRouter
+from algosdk import error
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 
-from models.verify import VerifyUser
+from models.verify import VerificationResult, VerifyBatch, VerifyUser
+from services.verify import verify_land_holder, verify_land_holders
 
 verifyRouter = APIRouter(prefix="/verify")
 
 
 # Verify Land Records
-@verifyRouter.post("/third-party")
+@verifyRouter.post("/third-party", response_model=VerificationResult)
 async def verify_land_record(data: VerifyUser):
     """
     Aim of this funciton is to accept verification by third
     party. Steps:
-    1. Third party sends data to server
-    2. Server fetchs metadata from algorand blockchain
-    3. Metadata is decrypted and checked againts third party's data.
-    4. If metadata matches
+    1. Third party sends the land holder's name and national id, and
+       optionally the SHA-256 of the deed it was shown
+    2. Server finds the land holder and their issued record
+    3. Server reads the token's deed URL and the holder's balance from the
+       algorand blockchain, once per asset and round
+    4. Server reports whether the holder still owns the token and whether
+       the deed matches
     """
-    pass
+    try:
+        return await verify_land_holder(data)
+    except (error.AlgodHTTPError, OSError):
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Could not reach the Algorand network.",
+        )
+
+
+# Verify many Land Records
+@verifyRouter.post(
+    "/third-party/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "One VerificationResult per line, in request order",
+            "content": {"application/x-ndjson": {}},
+        }
+    },
+)
+async def verify_land_records(data: VerifyBatch):
+    """
+    Batch version of /verify/third-party for e.g. nightly checks by lenders.
+    1. Third party sends up to 10000 verification requests
+    2. Server resolves all land holders and records in one query each
+    3. Server checks the tokens on chain a bounded number at a time
+    4. One result per request is streamed back as NDJSON, in request order
+    """
+
+    # Resolved before the response starts, so a failed lookup is a 500
+    # rather than a 200 cut off midway
+    results = await verify_land_holders(data.items)
+
+    async def lines():
+        async for result in results:
+            yield result.model_dump_json().encode() + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,265 @@
+import logging
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from starlette import status
+
+from config.resources import resources
+from config.settings import settings
+from models.admission import RateLimitBucket
+from services.auth import token_username
+from services.cache import TTLCache
+from services.metrics import counter, gauge
+from services.responses import ModelResponse
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    """
+    Limits for one route: at most `max_concurrent` requests in flight in
+    this process, and per client a token bucket refilled with `rate` tokens
+    per second holding up to `burst`.
+    """
+
+    max_concurrent: int
+    rate: float
+    burst: int
+
+    @property
+    def idle_seconds(self) -> float:
+        # An untouched bucket is full again after this long
+        return self.burst / self.rate
+
+
+AUTH_POLICY = AdmissionPolicy(
+    max_concurrent=settings.auth_max_concurrent,
+    rate=settings.auth_rate,
+    burst=settings.auth_burst,
+)
+ISSUE_POLICY = AdmissionPolicy(
+    max_concurrent=settings.issue_max_concurrent,
+    rate=settings.issue_rate,
+    burst=settings.issue_burst,
+)
+
+# Routes too expensive to serve without limits, by method and path. Every
+# other route passes straight through.
+POLICIES = {
+    ("POST", "/auth/token"): AUTH_POLICY,
+    ("POST", "/auth/register"): AUTH_POLICY,
+    ("POST", "/records/issue-record"): ISSUE_POLICY,
+}
+
+
+class MemoryRateLimiter:
+    """
+    Token buckets kept in this process. Each worker enforces the limits on
+    its own, so clients get up to the number of workers times the rate.
+    """
+
+    def __init__(self, maxsize: int, idle_seconds: float):
+        # A bucket idle for longer than `idle_seconds` is full, so dropping it
+        # changes nothing
+        self._buckets = TTLCache(maxsize=maxsize, ttl=idle_seconds)
+
+    async def take(self, key: str, policy: AdmissionPolicy) -> float:
+        """
+        Take a token from `key`'s bucket. Returns 0 if one was taken, else
+        the seconds until one is available.
+        """
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (policy.burst, now))
+        tokens = min(policy.burst, tokens + (now - updated_at) * policy.rate)
+        if tokens >= 1:
+            self._buckets.set(key, (tokens - 1, now))
+            return 0.0
+        self._buckets.set(key, (tokens, now))
+        return (1 - tokens) / policy.rate
+
+
+class MongoRateLimiter:
+    """
+    Token buckets in the `rate_limits` collection, shared by every API
+    process. A bucket is refilled and drawn from in one atomic pipeline
+    update timed by the server clock. If Mongo cannot be reached requests
+    are let through rather than failing the whole API.
+    """
+
+    async def take(self, key: str, policy: AdmissionPolicy) -> float:
+        elapsed = {
+            "$divide": [
+                {"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]},
+                1000,
+            ]
+        }
+        refilled = {
+            "$min": [
+                policy.burst,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", policy.burst]},
+                        {"$multiply": [elapsed, policy.rate]},
+                    ]
+                },
+            ]
+        }
+        update = [
+            {"$set": {"tokens": refilled, "updated_at": "$$NOW"}},
+            {
+                "$set": {
+                    "admitted": {"$gte": ["$tokens", 1]},
+                    "expires_at": {
+                        "$add": ["$$NOW", math.ceil(policy.idle_seconds * 1000)]
+                    },
+                }
+            },
+            {
+                "$set": {
+                    "tokens": {
+                        "$cond": ["$admitted", {"$subtract": ["$tokens", 1]}, "$tokens"]
+                    }
+                }
+            },
+        ]
+        collection = resources.engine.get_collection(RateLimitBucket)
+        try:
+            try:
+                doc = await collection.find_one_and_update(
+                    {"key": key},
+                    update,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # Another process created the bucket first; draw from it
+                doc = await collection.find_one_and_update(
+                    {"key": key}, update, return_document=ReturnDocument.AFTER
+                )
+        except PyMongoError as e:
+            logger.warning("Could not read rate limit bucket %s: %s", key, e)
+            return 0.0
+        if doc["admitted"]:
+            return 0.0
+        return (1 - doc["tokens"]) / policy.rate
+
+
+RATE_LIMITERS = {
+    "memory": lambda: MemoryRateLimiter(
+        maxsize=settings.rate_limit_cache_size,
+        idle_seconds=max(policy.idle_seconds for policy in POLICIES.values()),
+    ),
+    "mongo": MongoRateLimiter,
+}
+
+
+def client_id(scope) -> str:
+    """
+    Identify who sent a request: the user of a valid bearer token, else the
+    client address. `X-Forwarded-For` is only read behind a trusted proxy,
+    which appends the address it saw last.
+    """
+    headers = dict(scope["headers"])
+    scheme, _, token = (
+        headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    )
+    if scheme.lower() == "bearer" and (username := token_username(token)):
+        return f"user:{username}"
+    forwarded = headers.get(b"x-forwarded-for")
+    if settings.trust_forwarded_for and forwarded:
+        return "ip:" + forwarded.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionControl:
+    """
+    Per-route concurrency caps and per-client rate limits for `policies`.
+    """
+
+    def __init__(self, policies: dict, limiter, enabled: bool = True):
+        self.policies = policies
+        self.limiter = limiter
+        self.enabled = enabled
+        self.in_flight = Counter()
+        self.rejected = Counter()
+
+    async def admit(self, scope, route: tuple[str, str]) -> float:
+        """
+        Admit a request for `route`, taking a concurrency slot that
+        `release` gives back. Returns 0 if admitted, else the seconds after
+        which the client may retry.
+        """
+        policy = self.policies[route]
+        if self.in_flight[route] >= policy.max_concurrent:
+            self.rejected[route[1], "concurrency"] += 1
+            return 1.0
+        retry_after = await self.limiter.take(f"{route[1]}:{client_id(scope)}", policy)
+        if retry_after:
+            self.rejected[route[1], "rate"] += 1
+            return retry_after
+        # Another request may have taken the last slot meanwhile
+        if self.in_flight[route] >= policy.max_concurrent:
+            self.rejected[route[1], "concurrency"] += 1
+            return 1.0
+        self.in_flight[route] += 1
+        return 0.0
+
+    def release(self, route: tuple[str, str]):
+        self.in_flight[route] -= 1
+
+
+admission = AdmissionControl(
+    POLICIES, RATE_LIMITERS[settings.rate_limit_backend](), settings.admission_enabled
+)
+gauge(
+    "admission_in_flight",
+    "Requests in flight on rate limited routes",
+    lambda: {(path,): count for (_, path), count in admission.in_flight.items()},
+    ("route",),
+)
+counter(
+    "admission_rejections_total",
+    "Requests turned away with a 429, by route and reason",
+    lambda: dict(admission.rejected),
+    ("route", "reason"),
+)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware answering requests to rate limited routes with a 429 and
+    `Retry-After` before any of their work is done. Other routes only pay for
+    a dictionary lookup.
+    """
+
+    def __init__(self, app, control: AdmissionControl = admission):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        route = (scope.get("method"), scope.get("path"))
+        if (
+            scope["type"] != "http"
+            or not self.control.enabled
+            or route not in self.control.policies
+        ):
+            return await self.app(scope, receive, send)
+
+        retry_after = await self.control.admit(scope, route)
+        if retry_after:
+            response = ModelResponse(
+                {"detail": "Too many requests. Please try again later."},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.release(route)
@@ -1,9 +1,159 @@
-from algosdk import account, transaction
-from algosdk.v2client import algod
+import asyncio
+import copy
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import msgpack
+from algosdk import account, constants, encoding, error, transaction
+
+from config.resources import resources
 from config.settings import settings
+from services.confirmation import RoundWatcher
+from services.metrics import cache_metrics, gauge, timed
+
+# algosdk only ships a blocking HTTP client, so every algod round-trip is
+# pushed onto a bounded thread pool to keep the event loop free.
+algod_executor = ThreadPoolExecutor(
+    max_workers=settings.algod_max_workers, thread_name_prefix="algod"
+)
+
+# One background task confirms every in-flight transaction.
+round_watcher = RoundWatcher(lambda: resources.algod_client, algod_executor)
+gauge(
+    "algorand_pending_confirmations",
+    "Transactions waiting for confirmation",
+    lambda: round_watcher.pending_count,
+)
+
+# Largest number of transactions algod accepts in one atomic group
+MAX_GROUP_SIZE = constants.TX_GROUP_LIMIT
+
+# Fragments of algod rejections caused by outdated suggested params: the
+# validity window has passed ("txn dead: round 1200 outside of 100--1100"), or
+# the minimum fee went up under congestion ("fee 1000 below threshold 2000",
+# "transaction had fee 1000, which is less than the minimum 2000").
+STALE_PARAMS_ERRORS = ("txn dead:", "below threshold", "less than the minimum")
+
+
+async def run_algod(func, *args, **kwargs):
+    """
+    Run a blocking algod call on the algod thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    with timed("algod", func.__name__):
+        return await loop.run_in_executor(
+            algod_executor, functools.partial(func, *args, **kwargs)
+        )
+
+
+class SuggestedParamsCache:
+    """
+    Share suggested transaction params between concurrent submissions.
+
+    The params are fetched at most once per `ttl` seconds; concurrent callers
+    that find the cache empty wait for a single in-flight refresh. Each caller
+    gets its own copy so transactions can't alter the shared value.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._params = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._params is not None and time.monotonic() < self._expires_at
+
+    async def get(self) -> transaction.SuggestedParams:
+        if not self._fresh():
+            async with self._lock:
+                if not self._fresh():
+                    self.misses += 1
+                    self._params = await run_algod(
+                        resources.algod_client.suggested_params
+                    )
+                    self._expires_at = time.monotonic() + self.ttl
+                    return copy.copy(self._params)
+        self.hits += 1
+        return copy.copy(self._params)
+
+    def invalidate(self):
+        self._params = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
 
-algod_client = algod.AlgodClient(algod_token="", algod_address=settings.algod_address)
+suggested_params_cache = SuggestedParamsCache(ttl=settings.algod_params_ttl)
+cache_metrics("suggested_params", suggested_params_cache.stats)
+
+
+async def issuance_params() -> transaction.SuggestedParams:
+    """
+    Suggested params valid for `issue_valid_rounds` rounds only, so a
+    transaction whose outcome was lost is known to be dead soon after.
+    """
+    sp = await suggested_params_cache.get()
+    sp.last = sp.first + settings.issue_valid_rounds
+    return sp
+
+
+async def _submit(signed_txns: list, wait_rounds: int) -> tuple[list[str], list[dict]]:
+    txids = [signed_txn.get_txid() for signed_txn in signed_txns]
+    # Watch before sending so the confirming block cannot be missed
+    for txid in txids:
+        round_watcher.watch(txid, wait_rounds)
+    try:
+        if len(signed_txns) == 1:
+            await run_algod(resources.algod_client.send_transaction, signed_txns[0])
+        else:
+            await run_algod(resources.algod_client.send_transactions, signed_txns)
+    except Exception as e:
+        for txid in txids:
+            round_watcher.discard(txid)
+        if isinstance(e, error.AlgodHTTPError) and any(
+            fragment in str(e) for fragment in STALE_PARAMS_ERRORS
+        ):
+            suggested_params_cache.invalidate()
+        raise
+    results = await asyncio.gather(
+        *(round_watcher.wait_for_confirmation(txid, wait_rounds) for txid in txids)
+    )
+    return txids, list(results)
+
+
+def is_rejection(exc: Exception) -> bool:
+    """
+    Whether `exc` means algod refused a transaction or group, in which case
+    none of it was applied and it is safe to send a corrected one.
+    """
+    return isinstance(exc, error.TransactionRejectedError) or (
+        isinstance(exc, error.AlgodHTTPError) and exc.code == 400
+    )
+
+
+async def send_signed_group_and_confirm(
+    signed_txns: list, wait_rounds: int = 4
+) -> tuple[list[str], list[dict]]:
+    """
+    Send one signed transaction, or a group signed with `sign_group`, and
+    wait for all of them to be confirmed.
+    """
+    return await _submit(signed_txns, wait_rounds)
+
+
+def sign_group(
+    txns: list[transaction.Transaction], private_keys: list[str]
+) -> list[transaction.SignedTransaction]:
+    """
+    Sign transactions as one atomic group. Either every transaction is
+    confirmed in the same round or none of them is applied.
+    """
+    transaction.assign_group_id(txns)
+    return [txn.sign(key) for txn, key in zip(txns, private_keys)]
 
 
 def generate_algorand_keypair() -> tuple[str, str]:
@@ -14,20 +164,21 @@ def generate_algorand_keypair() -> tuple[str, str]:
     return (private_key, address)
 
 
-def create_asa(
-    private_key: str,
+def build_asa_txn(
+    sp: transaction.SuggestedParams,
     creator_address: str,
     unit_name: str,
     asset_name: str,
     total: int,
     decimals: int,
     url: str,
-) -> int:
+    note: bytes | None = None,
+) -> transaction.AssetConfigTxn:
     """
-    Create an Algorand Standard Asset (ASA).
+    Build the transaction creating an ASA managed by its creator. A `note`
+    keeps otherwise identical creations from sharing a txid.
     """
-    sp = algod_client.suggested_params()
-    txn = transaction.AssetConfigTxn(
+    return transaction.AssetConfigTxn(
         sender=creator_address,
         sp=sp,
         default_frozen=False,
@@ -40,77 +191,44 @@ def create_asa(
         url=url,
         total=total,
         decimals=decimals,
+        note=note,
     )
 
-    # Sign with secret key of creator
-    stxn = txn.sign(private_key)
-    # Send the transaction to the network and retrieve the txid.
-    txid = algod_client.send_transaction(stxn)
-    print(f"Sent asset create transaction with txid: {txid}")
-    # Wait for the transaction to be confirmed
-    results = transaction.wait_for_confirmation(algod_client, txid, 4)
-    print(f"Result confirmed in round: {results['confirmed-round']}")
 
-    # grab the asset id for the asset we just created
-    created_asset = results["asset-index"]
-    print(f"Asset ID created: {created_asset}")
-    return created_asset
-
-
-def opt_in_to_asa(private_key: str, address: str, asset_id: int):
-    """
-    Opt-in to an Algorand Standard Asset (ASA).
-    """
-    sp = algod_client.suggested_params()
-    optin_txn = transaction.AssetOptInTxn(sender=address, sp=sp, index=asset_id)
-    signed_optin_txn = optin_txn.sign(private_key)
-    txid = algod_client.send_transaction(signed_optin_txn)
-    print(f"Sent opt in transaction with txid: {txid}")
-
-    # Wait for the transaction to be confirmed
-    results = transaction.wait_for_confirmation(algod_client, txid, 4)
-    print(f"Result confirmed in round: {results['confirmed-round']}")
-
-
-def transfer_asa(
-    private_key: str,
+def build_opt_in_and_transfer_txns(
+    sp: transaction.SuggestedParams,
     sender_address: str,
-    receiver_address: str,
+    holder_address: str,
     asset_id: int,
     amount: int,
-):
+) -> list[transaction.Transaction]:
     """
-    Transfer an Algorand Standard Asset (ASA).
+    Build the holder's opt-in to an ASA followed by the transfer of the ASA
+    to them, to be signed by the holder and the sender respectively.
     """
-    sp = algod_client.suggested_params()
-    xfer_txn = transaction.AssetTransferTxn(
-        sender=sender_address,
-        sp=sp,
-        receiver=receiver_address,
-        amt=amount,
-        index=asset_id,
-    )
-    signed_xfer_txn = xfer_txn.sign(private_key)
-    txid = algod_client.send_transaction(signed_xfer_txn)
-    print(f"Sent transfer transaction with txid: {txid}")
-
-    results = transaction.wait_for_confirmation(algod_client, txid, 4)
-    print(f"Result confirmed in round: {results['confirmed-round']}")
-    return txid
+    return [
+        transaction.AssetOptInTxn(sender=holder_address, sp=sp, index=asset_id),
+        transaction.AssetTransferTxn(
+            sender=sender_address,
+            sp=sp,
+            receiver=holder_address,
+            amt=amount,
+            index=asset_id,
+        ),
+    ]
 
 
-def revoke_asa(
-    private_key: str,
+def build_clawback_txn(
+    sp: transaction.SuggestedParams,
     clawback_address: str,
     holder_address: str,
     asset_id: int,
     amount: int,
-):
+) -> transaction.AssetTransferTxn:
     """
-    Revoke an Algorand Standard Asset (ASA) from a target account.
+    Build the transaction clawing an ASA back from a holder.
     """
-    sp = algod_client.suggested_params()
-    clawback_txn = transaction.AssetTransferTxn(
+    return transaction.AssetTransferTxn(
         sender=clawback_address,
         sp=sp,
         receiver=clawback_address,
@@ -118,10 +236,124 @@ def revoke_asa(
         index=asset_id,
         revocation_target=holder_address,
     )
-    signed_clawback_txn = clawback_txn.sign(private_key)
-    txid = algod_client.send_transaction(signed_clawback_txn)
-    print(f"Sent clawback transaction with txid: {txid}")
 
-    results = transaction.wait_for_confirmation(algod_client, txid, 4)
-    print(f"Result confirmed in round: {results['confirmed-round']}")
-    return txid
+
+async def current_round() -> int:
+    """
+    Latest round as seen by the shared suggested params, which are refreshed
+    at most every `algod_params_ttl` seconds; reading it costs no extra call.
+    """
+    sp = await suggested_params_cache.get()
+    return sp.first
+
+
+async def get_asset_params(asset_id: int) -> dict | None:
+    """
+    Return the params of an ASA, or None if it does not exist (anymore).
+    """
+    try:
+        info = await run_algod(resources.algod_client.asset_info, asset_id)
+    except error.AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    return info["params"]
+
+
+async def get_asset_balance(address: str, asset_id: int) -> int:
+    """
+    Return how much of an ASA an account holds; 0 if it has not opted in.
+    """
+    try:
+        info = await run_algod(
+            resources.algod_client.account_asset_info, address, asset_id
+        )
+    except error.AlgodHTTPError as e:
+        if e.code == 404:
+            return 0
+        raise
+    return info["asset-holding"]["amount"]
+
+
+async def get_block(round_num: int) -> dict:
+    """
+    Fetch a block as msgpack, which unlike the JSON form keeps the apply data
+    of every transaction, e.g. the ids of the assets created in the block.
+    """
+    raw = await run_algod(
+        resources.algod_client.block_info,
+        round_num=round_num,
+        response_format="msgpack",
+    )
+    block = msgpack.unpackb(
+        raw, raw=False, strict_map_key=False, unicode_errors="replace"
+    )
+    return block["block"]
+
+
+async def find_transaction(txid: str, first_valid: int, last_valid: int) -> dict | None:
+    """
+    Find out what became of a transaction that may have been sent before,
+    e.g. by a worker that died before saving the outcome. Returns its
+    confirmed `pending_transaction_info`, reduced to the `confirmed-round` if
+    algod no longer remembers it, or None once the transaction was rejected
+    or its validity window has passed without it being confirmed; then it
+    is safe to send a new one.
+    """
+    try:
+        info = await run_algod(resources.algod_client.pending_transaction_info, txid)
+    except error.AlgodHTTPError as e:
+        if e.code != 404:
+            raise
+        info = None
+    if info is not None:
+        if info.get("confirmed-round"):
+            return info
+        if info.get("pool-error"):
+            return None
+        # Still in the pool; it cannot be confirmed after `last_valid`
+        status = await run_algod(resources.algod_client.status)
+        try:
+            return await round_watcher.wait_for_confirmation(
+                txid, max(1, last_valid - status["last-round"])
+            )
+        except (error.ConfirmationTimeoutError, error.TransactionRejectedError):
+            return None
+
+    # Neither pending nor recently confirmed: search the validity window once
+    # it has passed, so the transaction cannot still land behind the search
+    status = await run_algod(resources.algod_client.status)
+    # algod gives up waiting after about a minute, before the round is reached
+    while status["last-round"] <= last_valid:
+        status = await run_algod(
+            resources.algod_client.status_after_block, status["last-round"]
+        )
+    responses = await asyncio.gather(
+        *(
+            run_algod(resources.algod_client.get_block_txids, round_num)
+            for round_num in range(first_valid, last_valid + 1)
+        )
+    )
+    for round_num, response in zip(range(first_valid, last_valid + 1), responses):
+        if txid in (response.get("blockTxids") or []):
+            return {"confirmed-round": round_num}
+    return None
+
+
+async def find_created_asset(round_num: int, creator: str, note: bytes) -> int | None:
+    """
+    Return the id of the ASA `creator` created in `round_num` with a
+    transaction carrying `note`, or None if there is none.
+    """
+    block = await get_block(round_num)
+    sender = encoding.decode_address(creator)
+    for stxn in block.get("txns") or []:
+        txn = stxn.get("txn") or {}
+        if (
+            txn.get("type") == "acfg"
+            and not txn.get("caid")
+            and txn.get("snd") == sender
+            and txn.get("note") == note
+        ):
+            return stxn.get("caid")
+    return None
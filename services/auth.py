@@ -1,15 +1,21 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
+from jose import JWTError, jwt
 from jwt import InvalidTokenError
 from passlib.context import CryptContext
 
-from config.database import engine
+from config.resources import resources
 from config.settings import settings
 from models.auth import TokenData, User
+from services.cache import TTLCache
+from services.metrics import cache_metrics, gauge, timed
 
 # Cryptographic and JWT settings
 SECRET_KEY = settings.signing_secret_key
@@ -19,22 +25,92 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class PasswordHasher:
+    """
+    Run bcrypt on a dedicated thread pool. bcrypt releases the GIL while
+    hashing, so the pool uses every core while the event loop keeps serving
+    other requests. At most `max_pending` hashes may be queued or running;
+    beyond that requests are turned away with a 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests. Please try again.",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with timed("bcrypt", func.__name__):
+                return await loop.run_in_executor(
+                    self.executor, functools.partial(func, *args)
+                )
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers or os.cpu_count() or 1,
+    max_pending=settings.password_hash_max_pending,
+)
+gauge(
+    "password_hashes_pending",
+    "Password hashes queued or running",
+    lambda: password_hasher.pending,
+)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+# Users resolved from access tokens, keyed by username. Entries are dropped
+# whenever the user is saved through `save_user`; other workers see changes
+# (e.g. `disabled`) after at most `user_cache_ttl` seconds.
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+cache_metrics("user", user_cache.stats)
 
 
 async def get_user(username: str) -> User | None:
-    current_user = await engine.find_one(User, User.username == username)
+    current_user = user_cache.get(username)
+    if current_user is None:
+        current_user = await resources.engine.find_one(User, User.username == username)
+        if current_user is not None:
+            user_cache.set(username, current_user)
     return current_user
 
 
+async def save_user(user: User) -> User:
+    """
+    Save a user and drop any cached copy of it.
+    """
+    await resources.engine.save(user)
+    user_cache.delete(user.username)
+    return user
+
+
 async def authenticate_user(username: str, password: str) -> User:
     user = await get_user(username=username)
-    if not user or not verify_password(password, user.hash_password):
+    if not user or not await verify_password(password, user.hash_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -49,6 +125,16 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def token_username(token: str) -> str | None:
+    """
+    Return the username of a valid access token without loading the user.
+    """
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("username")
+    except JWTError:
+        return None
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
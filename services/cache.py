@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire `ttl` seconds after being
+    stored. `on_evict` is called with every value that leaves the cache.
+    Expired entries are purged on every `get` and `set`, and by `sweep` for
+    caches that may sit idle, so `on_evict` runs once they expire rather
+    than whenever they are next looked up.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        on_evict: Callable[[Any], None] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # (expiry, key) in the order entries were set, which with a fixed
+        # ttl is the order they expire in; stale pairs are skipped
+        self._expiries: deque[tuple[float, Hashable]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, key: Hashable):
+        _, value = self._entries.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(value)
+
+    def purge(self):
+        """
+        Evict every expired entry, looking only at the ones due.
+        """
+        now = time.monotonic()
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, key = self._expiries.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expires_at:
+                self._evict(key)
+
+    async def sweep(self, interval: float):
+        """
+        Purge expired entries every `interval` seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.purge()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self.purge()
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self.purge()
+        if key in self._entries:
+            self._evict(key)
+        expires_at = time.monotonic() + self.ttl
+        self._entries[key] = (expires_at, value)
+        self._expiries.append((expires_at, key))
+        while len(self._entries) > self.maxsize:
+            self._evict(next(iter(self._entries)))
+
+    def delete(self, key: Hashable):
+        if key in self._entries:
+            self._evict(key)
+
+    def clear(self):
+        for key in list(self._entries):
+            self._evict(key)
+        self._expiries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
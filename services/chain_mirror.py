@@ -0,0 +1,475 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from algosdk import encoding, error
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config.resources import resources
+from config.settings import settings
+from models.auth import Role, User
+from models.chain import (
+    AssetHolding,
+    MirroredAsset,
+    ReconciliationIssue,
+    ReconciliationItem,
+    ReconciliationReport,
+    SyncCheckpoint,
+)
+from models.records import Record
+from services.algorand import (
+    current_round,
+    get_asset_params,
+    get_block,
+    run_algod,
+)
+from services.metrics import gauge
+from services.records import after_id
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "asset_holdings"
+
+# Raised by an upsert whose round guard failed because the write it would
+# make was already applied, e.g. when a block is replayed after a restart
+DUPLICATE_KEY = 11000
+
+
+class ChainMirrorUnavailable(Exception):
+    """
+    Raised when the chain mirror is off or has not finished seeding, so it
+    cannot be read in place of the chain.
+    """
+
+
+@dataclass
+class BlockChanges:
+    """
+    What one block did to the mirrored assets and their holdings.
+    """
+
+    created: dict[int, dict] = field(default_factory=dict)
+    updated: dict[int, dict] = field(default_factory=dict)
+    # (asset id, address) -> [change in amount, opted in afterwards]
+    holdings: dict[tuple[int, str], list] = field(default_factory=dict)
+
+    def move(self, asset_id: int, address: str, amount: int, opted_in: bool = True):
+        holding = self.holdings.setdefault((asset_id, address), [0, True])
+        holding[0] += amount
+        holding[1] = opted_in
+
+    def configure(self, asset_id: int, values: dict):
+        # A reconfiguration in the creating block is part of the creation
+        target = self.created.get(asset_id)
+        if target is None:
+            target = self.updated.setdefault(asset_id, {})
+        target.update(values)
+
+
+def _address(value: bytes | None) -> str | None:
+    return encoding.encode_address(value) if value else None
+
+
+def _read_txn(stxn: dict, changes: BlockChanges, issuers: set, tracked: set):
+    txn = stxn.get("txn") or {}
+    kind = txn.get("type")
+    if kind == "acfg":
+        params = txn.get("apar") or {}
+        asset_id = txn.get("caid")
+        if not asset_id:
+            creator = _address(txn.get("snd"))
+            asset_id = stxn.get("caid")
+            if creator in issuers and asset_id:
+                tracked.add(asset_id)
+                changes.created[asset_id] = {
+                    "creator": creator,
+                    "url": params.get("au", ""),
+                    "clawback": _address(params.get("c")),
+                    "destroyed": False,
+                }
+                changes.move(asset_id, creator, params.get("t", 0))
+        elif asset_id in tracked:
+            # Only the manager, reserve, freeze and clawback can change; a
+            # config without params destroys the asset
+            if params:
+                changes.configure(asset_id, {"clawback": _address(params.get("c"))})
+            else:
+                changes.configure(asset_id, {"destroyed": True})
+    elif kind == "axfer" and txn.get("xaid") in tracked:
+        asset_id = txn["xaid"]
+        sender = _address(txn.get("snd"))
+        amount = txn.get("aamt", 0)
+        if amount:
+            # A clawback moves the revocation target's units
+            changes.move(asset_id, _address(txn.get("asnd")) or sender, -amount)
+        receiver = _address(txn.get("arcv"))
+        if receiver:
+            changes.move(asset_id, receiver, amount)
+        close_to = _address(txn.get("aclose"))
+        if close_to:
+            closing = stxn.get("aca", 0)
+            changes.move(asset_id, close_to, closing)
+            changes.move(asset_id, sender, -closing, opted_in=False)
+    for inner in (stxn.get("dt") or {}).get("itx") or []:
+        _read_txn(inner, changes, issuers, tracked)
+
+
+def read_block_changes(block: dict, issuers: set, tracked: set) -> BlockChanges:
+    """
+    Collect the asset configs and transfers in a msgpack-decoded block that
+    concern ASAs created by `issuers`. Assets created in the block are added
+    to `tracked`, the ids of the assets followed so far.
+    """
+    changes = BlockChanges()
+    for stxn in block.get("txns") or []:
+        _read_txn(stxn, changes, issuers, tracked)
+    return changes
+
+
+async def _bulk_write(collection, requests: list):
+    if not requests:
+        return
+    try:
+        await collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        if e.details.get("writeConcernErrors") or any(
+            write_error["code"] != DUPLICATE_KEY
+            for write_error in e.details.get("writeErrors", [])
+        ):
+            raise
+
+
+class ChainMirror:
+    """
+    Follow algod blocks from one background task and keep `mirrored_assets`
+    and `asset_holdings` in step with the ASAs our token issuers created.
+
+    Progress is kept in a `sync_checkpoint` saved after every batch of
+    blocks. Each mirrored document remembers the round that last changed it
+    and a write only applies to documents from earlier rounds, so blocks
+    replayed after a restart are not counted twice. Run it in one process;
+    further processes would repeat the same writes to no effect.
+    """
+
+    def __init__(self, fetch_concurrency: int, max_lag: int, retry_interval: float):
+        self.fetch_concurrency = fetch_concurrency
+        self.max_lag = max_lag
+        self.retry_interval = retry_interval
+        self.round: int | None = None
+        self._issuers: set[str] = set()
+        self._tracked: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.round = None
+
+    async def _follow(self):
+        checkpoint = None
+        while True:
+            try:
+                if checkpoint is None:
+                    checkpoint = await self._load_checkpoint()
+                await self._sync(checkpoint)
+            except Exception as e:
+                logger.warning("Chain mirror failed to sync: %s", e)
+                await asyncio.sleep(self.retry_interval)
+
+    async def _load_checkpoint(self) -> SyncCheckpoint:
+        checkpoint = await resources.engine.find_one(
+            SyncCheckpoint, SyncCheckpoint.name == CHECKPOINT
+        )
+        if checkpoint is None:
+            start = settings.chain_mirror_start_round
+            if start is None:
+                status = await run_algod(resources.algod_client.status)
+                start = status["last-round"]
+            await self._bootstrap(start)
+            checkpoint = SyncCheckpoint(name=CHECKPOINT, round=start)
+            await resources.engine.save(checkpoint)
+
+        cursor = resources.engine.get_collection(MirroredAsset).find(
+            {}, {"asset_id": 1}
+        )
+        self._tracked = {doc["asset_id"] async for doc in cursor}
+        self.round = checkpoint.round
+        return checkpoint
+
+    async def _read_holding(self, address: str, asset_id: int) -> UpdateOne | None:
+        try:
+            info = await run_algod(
+                resources.algod_client.account_asset_info, address, asset_id
+            )
+        except error.AlgodHTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        # The round the balance was read at guards it against older blocks
+        return UpdateOne(
+            {"asset_id": asset_id, "address": address},
+            {
+                "$set": {
+                    "amount": info["asset-holding"]["amount"],
+                    "opted_in": True,
+                    "round": info["round"],
+                }
+            },
+            upsert=True,
+        )
+
+    async def _bootstrap(self, round_num: int):
+        """
+        Seed the mirror with the assets of issued records and the balances of
+        their creators and holders, read from algod, before following blocks
+        from `round_num`.
+        """
+        records = await resources.engine.find(Record, Record.asset_id != None)
+        user_ids = [
+            ObjectId(record.user_id)
+            for record in records
+            if ObjectId.is_valid(record.user_id)
+        ]
+        holders = {
+            str(user.id): user.algorand_address
+            for user in await resources.engine.find(User, User.id.in_(user_ids))
+        }
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        assets, holdings = [], []
+
+        async def seed(record: Record):
+            async with semaphore:
+                params = await get_asset_params(record.asset_id)
+                if params is None:
+                    return
+                assets.append(
+                    UpdateOne(
+                        {"asset_id": record.asset_id},
+                        {
+                            "$setOnInsert": {
+                                "creator": params["creator"],
+                                "url": params.get("url", ""),
+                                "clawback": params.get("clawback"),
+                                "destroyed": False,
+                                "round": round_num,
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+                addresses = {params["creator"], holders.get(record.user_id)} - {None}
+                for request in await asyncio.gather(
+                    *(
+                        self._read_holding(address, record.asset_id)
+                        for address in addresses
+                    )
+                ):
+                    if request is not None:
+                        holdings.append(request)
+
+        await asyncio.gather(*(seed(record) for record in records))
+        await _bulk_write(resources.engine.get_collection(MirroredAsset), assets)
+        await _bulk_write(resources.engine.get_collection(AssetHolding), holdings)
+        logger.info(
+            "Chain mirror seeded %s assets and %s holdings", len(assets), len(holdings)
+        )
+
+    async def _load_issuers(self):
+        cursor = resources.engine.get_collection(User).find(
+            {"role": Role.TOKEN_ISSUER.value}, {"algorand_address": 1}
+        )
+        self._issuers = {doc["algorand_address"] async for doc in cursor}
+
+    async def _apply(self, round_num: int, changes: BlockChanges):
+        assets = [
+            UpdateOne(
+                {"asset_id": asset_id},
+                {"$setOnInsert": dict(values, round=round_num)},
+                upsert=True,
+            )
+            for asset_id, values in changes.created.items()
+        ]
+        assets.extend(
+            UpdateOne(
+                {"asset_id": asset_id, "round": {"$lt": round_num}},
+                {"$set": dict(values, round=round_num)},
+            )
+            for asset_id, values in changes.updated.items()
+        )
+        holdings = [
+            UpdateOne(
+                {"asset_id": asset_id, "address": address, "round": {"$lt": round_num}},
+                {
+                    "$inc": {"amount": amount},
+                    "$set": {"opted_in": opted_in, "round": round_num},
+                },
+                upsert=True,
+            )
+            for (asset_id, address), (amount, opted_in) in changes.holdings.items()
+        ]
+        await _bulk_write(resources.engine.get_collection(MirroredAsset), assets)
+        await _bulk_write(resources.engine.get_collection(AssetHolding), holdings)
+
+    async def _sync(self, checkpoint: SyncCheckpoint):
+        status = await run_algod(
+            resources.algod_client.status_after_block, checkpoint.round
+        )
+        last_round = status["last-round"]
+        await self._load_issuers()
+        for first in range(
+            checkpoint.round + 1, last_round + 1, self.fetch_concurrency
+        ):
+            rounds = range(first, min(first + self.fetch_concurrency, last_round + 1))
+            # Fetch a batch of blocks at once when catching up, apply in order
+            blocks = await asyncio.gather(
+                *(get_block(round_num) for round_num in rounds)
+            )
+            for round_num, block in zip(rounds, blocks):
+                changes = read_block_changes(block, self._issuers, self._tracked)
+                await self._apply(round_num, changes)
+            checkpoint.round = rounds[-1]
+            await resources.engine.save(checkpoint)
+            self.round = checkpoint.round
+
+    async def lookup(self, asset_id: int, address: str) -> tuple | None:
+        """
+        Read an ASA and an account's balance of it from the mirror as
+        (asset, amount, round). Returns None when this process is not
+        following the chain, the asset is not mirrored, or the mirror is more
+        than `max_lag` rounds behind, so the caller can ask algod instead.
+        """
+        synced_round = self.round
+        if synced_round is None or asset_id not in self._tracked:
+            return None
+        if await current_round() - synced_round > self.max_lag:
+            return None
+        asset, holding = await asyncio.gather(
+            resources.engine.find_one(
+                MirroredAsset, MirroredAsset.asset_id == asset_id
+            ),
+            resources.engine.find_one(
+                AssetHolding,
+                AssetHolding.asset_id == asset_id,
+                AssetHolding.address == address,
+            ),
+        )
+        if asset is None:
+            return None
+        return asset, holding.amount if holding else 0, synced_round
+
+
+chain_mirror = ChainMirror(
+    fetch_concurrency=settings.chain_mirror_fetch_concurrency,
+    max_lag=settings.chain_mirror_max_lag,
+    retry_interval=settings.chain_mirror_retry_interval,
+)
+gauge(
+    "chain_mirror_round",
+    "Last round applied to the local chain mirror",
+    lambda: chain_mirror.round or 0,
+)
+
+
+def _reconcile(
+    record: Record, address: str | None, asset: MirroredAsset | None, amount: int
+) -> tuple[ReconciliationIssue, str] | None:
+    if asset is None:
+        return ReconciliationIssue.NOT_MIRRORED, "Asset is not in the chain mirror."
+    if asset.destroyed and not record.is_land_revoked:
+        return ReconciliationIssue.ASSET_DESTROYED, "Asset was destroyed on chain."
+    if asset.url != record.file_url:
+        return ReconciliationIssue.DEED_MISMATCH, "Asset URL differs from the deed."
+    if record.is_land_revoked and amount > 0:
+        return (
+            ReconciliationIssue.STILL_HELD,
+            f"Record is revoked but {address} still holds the asset.",
+        )
+    if record.verified and not record.is_land_revoked and amount == 0:
+        return ReconciliationIssue.NOT_HELD, "Land holder does not hold the asset."
+    if not record.verified and amount > 0:
+        return (
+            ReconciliationIssue.UNVERIFIED_BUT_HELD,
+            "Record is unverified but the land holder holds the asset.",
+        )
+    return None
+
+
+async def reconcile_records() -> ReconciliationReport:
+    """
+    Compare every record with an asset against the chain mirror and report
+    the ones whose `verified` or `is_land_revoked` state the chain does not
+    bear out. Only the mirror is read, with one query per collection for
+    each page of records; pages are read in id order so memory stays
+    bounded. Raises ChainMirrorUnavailable when the mirror is off or has no
+    checkpoint yet, as every record would then look unmirrored.
+    """
+    if not settings.chain_mirror_enabled:
+        raise ChainMirrorUnavailable("Chain mirror is not enabled.")
+    checkpoint = await resources.engine.find_one(
+        SyncCheckpoint, SyncCheckpoint.name == CHECKPOINT
+    )
+    if checkpoint is None:
+        raise ChainMirrorUnavailable("Chain mirror has not finished seeding.")
+    report = ReconciliationReport(round=checkpoint.round)
+    collection = resources.engine.get_collection(Record)
+    size = settings.record_stream_batch_size
+    after = None
+    while True:
+        cursor = collection.find(
+            after_id(Record.asset_id != None, after),
+            sort=[("_id", ASCENDING)],
+            limit=size,
+        )
+        batch = [Record.model_validate_doc(doc) async for doc in cursor]
+        if not batch:
+            break
+        user_ids = [
+            ObjectId(record.user_id)
+            for record in batch
+            if ObjectId.is_valid(record.user_id)
+        ]
+        holders = {
+            str(user.id): user.algorand_address
+            for user in await resources.engine.find(User, User.id.in_(user_ids))
+        }
+        asset_ids = [record.asset_id for record in batch]
+        assets = {
+            asset.asset_id: asset
+            for asset in await resources.engine.find(
+                MirroredAsset, MirroredAsset.asset_id.in_(asset_ids)
+            )
+        }
+        balances = {
+            (holding.asset_id, holding.address): holding.amount
+            for holding in await resources.engine.find(
+                AssetHolding,
+                AssetHolding.asset_id.in_(asset_ids),
+                AssetHolding.amount > 0,
+            )
+        }
+        for record in batch:
+            address = holders.get(record.user_id)
+            amount = balances.get((record.asset_id, address), 0)
+            issue = _reconcile(record, address, assets.get(record.asset_id), amount)
+            if issue is not None:
+                report.mismatches.append(
+                    ReconciliationItem(
+                        record_id=str(record.id),
+                        user_id=record.user_id,
+                        asset_id=record.asset_id,
+                        issue=issue[0],
+                        detail=issue[1],
+                    )
+                )
+        report.checked += len(batch)
+        if len(batch) < size:
+            break
+        after = str(batch[-1].id)
+    return report
@@ -0,0 +1,168 @@
+import asyncio
+import functools
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from algosdk import error
+
+from services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingTransaction:
+    future: asyncio.Future
+    wait_rounds: int
+    deadline: int | None = None
+
+
+class RoundWatcher:
+    """
+    Follow new algod rounds from a single background task and resolve the
+    confirmation of every pending transaction found in each block.
+
+    Instead of one `wait_for_confirmation` polling loop per transaction, the
+    watcher makes one `status_after_block` and one `get_block_txids` call per
+    round, plus one `pending_transaction_info` call per confirmed transaction.
+    The task stops as soon as nothing is pending.
+    """
+
+    MAX_FAILURES = 5
+
+    def __init__(self, get_client: Callable, executor):
+        self.get_client = get_client
+        self.executor = executor
+        self.last_round: int | None = None
+        self._pending: dict[str, PendingTransaction] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def client(self):
+        return self.get_client()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        with timed("algod", func.__name__):
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args)
+            )
+
+    def watch(self, txid: str, wait_rounds: int = 4) -> asyncio.Future:
+        """
+        Register a transaction id and return a future that resolves to its
+        `pending_transaction_info` once confirmed. Register before sending the
+        transaction so that it cannot land in a block the watcher has already
+        scanned.
+        """
+        entry = self._pending.get(txid)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            entry = PendingTransaction(future, wait_rounds)
+            self._pending[txid] = entry
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._follow_rounds())
+        return entry.future
+
+    def discard(self, txid: str):
+        """
+        Stop watching a transaction, e.g. because submitting it failed.
+        """
+        entry = self._pending.pop(txid, None)
+        if entry is not None and not entry.future.done():
+            entry.future.cancel()
+
+    async def wait_for_confirmation(self, txid: str, wait_rounds: int = 4) -> dict:
+        """
+        Wait for an already submitted transaction to be confirmed.
+        """
+        future = self.watch(txid, wait_rounds)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.discard(txid)
+            raise
+
+    async def _follow_rounds(self):
+        failures = 0
+        while self._pending:
+            try:
+                if self.last_round is None:
+                    status = await self._call(self.client.status)
+                    # Start with the round that is already committed; a
+                    # transaction may have landed in it while starting up.
+                    self.last_round = status["last-round"] - 1
+                self._assign_deadlines()
+                status = await self._call(
+                    self.client.status_after_block, self.last_round
+                )
+                for round_num in range(self.last_round + 1, status["last-round"] + 1):
+                    await self._scan_round(round_num)
+                    self.last_round = round_num
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logger.warning("Round watcher failed to read from algod: %s", e)
+                if failures >= self.MAX_FAILURES:
+                    self._fail_all(e)
+                    break
+                await asyncio.sleep(1)
+        self.last_round = None
+
+    def _fail_all(self, exc: Exception):
+        pending, self._pending = self._pending, {}
+        for entry in pending.values():
+            if not entry.future.done():
+                entry.future.set_exception(exc)
+
+    def _assign_deadlines(self):
+        for entry in self._pending.values():
+            if entry.deadline is None:
+                entry.deadline = self.last_round + 1 + entry.wait_rounds
+
+    async def _scan_round(self, round_num: int):
+        if not self._pending:
+            return
+        response = await self._call(self.client.get_block_txids, round_num)
+        confirmed = [
+            txid for txid in response.get("blockTxids") or [] if txid in self._pending
+        ]
+        expired = [
+            txid
+            for txid, entry in self._pending.items()
+            if txid not in confirmed
+            and entry.deadline is not None
+            and round_num >= entry.deadline
+        ]
+        await asyncio.gather(
+            *(self._resolve(txid, round_num) for txid in confirmed + expired)
+        )
+
+    async def _resolve(self, txid: str, round_num: int):
+        try:
+            info = await self._call(self.client.pending_transaction_info, txid)
+        except error.AlgodHTTPError as e:
+            info = {}
+            logger.warning("Could not fetch pending info for %s: %s", txid, e)
+        entry = self._pending.pop(txid, None)
+        if entry is None or entry.future.done():
+            return
+        if info.get("confirmed-round"):
+            entry.future.set_result(info)
+        elif info.get("pool-error"):
+            entry.future.set_exception(
+                error.TransactionRejectedError(
+                    "Transaction rejected: " + info["pool-error"]
+                )
+            )
+        else:
+            entry.future.set_exception(
+                error.ConfirmationTimeoutError(
+                    f"Wait for transaction id {txid} timed out in round {round_num}"
+                )
+            )
@@ -1,6 +1,29 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 
 from config.settings import settings
+from services.cache import TTLCache
+from services.metrics import cache_metrics
+
+# `ENCRYPTION_KEY` holds one or more comma separated keys. The first key
+# encrypts new data; every key can decrypt, so old keys stay listed until
+# `rotate_data` has re-encrypted everything written with them.
+fernet = MultiFernet(
+    [Fernet(key.strip().encode()) for key in settings.encryption_key.split(",")]
+)
+
+
+def _wipe(secret: bytearray):
+    secret[:] = bytes(len(secret))
+
+
+# Decrypted issuer signing keys. They are held as bytearrays so they can be
+# zeroed when evicted; copies handed out to callers are not covered.
+signing_key_cache = TTLCache(
+    maxsize=settings.signing_key_cache_size,
+    ttl=settings.signing_key_cache_ttl,
+    on_evict=_wipe,
+)
+cache_metrics("signing_key", signing_key_cache.stats)
 
 
 # Generate a key for encryption and decryption
@@ -12,13 +35,25 @@ def generate_encryption_key() -> bytes:
 
 # Encrypt the given data using the provided key
 def encrypt_data(data: str) -> bytes:
-    fernet = Fernet(settings.encryption_key.encode())
     encrypted_data = fernet.encrypt(data.encode())
     return encrypted_data
 
 
 # Decrypt the given data using the provided key
 def decrypt_data(encrypted_data: bytes) -> str:
-    fernet = Fernet(settings.encryption_key.encode())
     decrypted_data = fernet.decrypt(encrypted_data).decode()
     return decrypted_data
+
+
+# Re-encrypt data with the current primary key
+def rotate_data(encrypted_data: bytes) -> bytes:
+    return fernet.rotate(encrypted_data)
+
+
+# Decrypt a signing key, reusing recent results for the same ciphertext
+def decrypt_signing_key(encrypted_private_key: str) -> str:
+    secret = signing_key_cache.get(encrypted_private_key)
+    if secret is None:
+        secret = bytearray(fernet.decrypt(encrypted_private_key.encode()))
+        signing_key_cache.set(encrypted_private_key, secret)
+    return secret.decode()
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from fastapi import HTTPException, Response, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config.resources import resources
+from config.settings import settings
+from models.auth import User
+from models.idempotency import IdempotencyRecord, IdempotencyStatus
+from models.jobs import utc_now
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Set when a request holding a key in this process finishes, so duplicates
+# waiting here do not have to poll for its result
+_finished: dict[str, asyncio.Event] = {}
+
+
+def request_fingerprint(*parts) -> str:
+    """
+    Hash what identifies a request, to tell a retry from a different request
+    that reuses the same key.
+    """
+    return hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()
+
+
+async def _claim(collection, key: str, fingerprint: str, owner: str) -> dict | None:
+    """
+    Take the lock on `key` for `owner`. Returns None once it is held, else
+    the document of the request holding it or the stored response.
+    """
+    now = utc_now()
+    claim = {
+        "fingerprint": fingerprint,
+        "owner": owner,
+        "status": IdempotencyStatus.IN_PROGRESS.value,
+        "lock_expires_at": now + timedelta(seconds=settings.idempotency_lock_seconds),
+    }
+    try:
+        doc = await collection.find_one_and_update(
+            {"key": key},
+            {
+                "$setOnInsert": dict(
+                    claim,
+                    expires_at=now + timedelta(seconds=settings.idempotency_ttl),
+                )
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        # Another request inserted the key first; look again next time
+        return {"fingerprint": fingerprint, "status": claim["status"]}
+    if doc is None or doc["status"] != IdempotencyStatus.IN_PROGRESS.value:
+        return doc
+
+    # The request holding the lock died without finishing; take it over
+    taken = await collection.find_one_and_update(
+        {
+            "key": key,
+            "status": IdempotencyStatus.IN_PROGRESS.value,
+            "fingerprint": fingerprint,
+            "lock_expires_at": {"$lt": now},
+        },
+        {"$set": claim},
+    )
+    return None if taken is not None else doc
+
+
+def _replay(doc: dict) -> Response:
+    return Response(
+        content=doc["body"],
+        status_code=doc["status_code"],
+        media_type=doc["media_type"],
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+
+async def _wait(key: str, deadline: float):
+    finished = _finished.get(key)
+    timeout = min(settings.idempotency_poll_interval, deadline - time.monotonic())
+    if finished is None:
+        await asyncio.sleep(max(timeout, 0))
+        return
+    try:
+        await asyncio.wait_for(finished.wait(), max(timeout, 0))
+    except asyncio.TimeoutError:
+        pass
+
+
+async def idempotent(
+    user: User,
+    route: str,
+    idempotency_key: str | None,
+    fingerprint: str,
+    handler: Callable[[], Awaitable[Response]],
+) -> Response:
+    """
+    Run `handler` at most once per user, route and `Idempotency-Key`.
+
+    A retry gets the stored response back with an `Idempotent-Replayed`
+    header. A duplicate that arrives while the first request still runs
+    waits for its result, for up to `idempotency_wait_seconds`. Only
+    successful responses are stored; after an error the key is released so
+    the request can be retried. Requests without a key run as usual.
+    """
+    if idempotency_key is None:
+        return await handler()
+
+    key = f"{user.id}:{route}:{idempotency_key}"
+    owner = uuid4().hex
+    collection = resources.engine.get_collection(IdempotencyRecord)
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    while (doc := await _claim(collection, key, fingerprint, owner)) is not None:
+        if doc["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request.",
+            )
+        if doc["status"] == IdempotencyStatus.COMPLETED.value:
+            return _replay(doc)
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress.",
+            )
+        await _wait(key, deadline)
+
+    finished = _finished[key] = asyncio.Event()
+    try:
+        response = await handler()
+        if response.status_code < 300:
+            await collection.update_one(
+                {"key": key, "owner": owner},
+                {
+                    "$set": {
+                        "status": IdempotencyStatus.COMPLETED.value,
+                        "status_code": response.status_code,
+                        "media_type": response.media_type,
+                        "body": bytes(response.body),
+                    }
+                },
+            )
+        else:
+            await collection.delete_one({"key": key, "owner": owner})
+        return response
+    except BaseException:
+        await asyncio.shield(collection.delete_one({"key": key, "owner": owner}))
+        raise
+    finally:
+        finished.set()
+        if _finished.get(key) is finished:
+            del _finished[key]
@@ -0,0 +1,141 @@
+import logging
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from config.resources import resources
+from models.admission import RateLimitBucket
+from models.auth import User
+from models.chain import AssetHolding, MirroredAsset, SyncCheckpoint
+from models.idempotency import IdempotencyRecord
+from models.jobs import Job
+from models.records import Record
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing the hot queries. `_id` lookups (User.id, Job.id) use the
+# default index. `asset_id` is stored as null until a record is issued, so
+# its uniqueness only applies to documents holding a number.
+INDEXES = {
+    User: [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("national_id", ASCENDING)], name="national_id"),
+        # Covers the chain mirror's lookup of token issuer addresses
+        IndexModel(
+            [("role", ASCENDING), ("algorand_address", ASCENDING)],
+            name="role_algorand_address",
+        ),
+    ],
+    Record: [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # Also serves the keyset pagination of unverified records
+        IndexModel([("verified", ASCENDING), ("_id", ASCENDING)], name="verified_id"),
+        IndexModel(
+            [("asset_id", ASCENDING)],
+            name="asset_id_unique",
+            unique=True,
+            partialFilterExpression={"asset_id": {"$type": "number"}},
+        ),
+    ],
+    Job: [
+        IndexModel(
+            [("status", ASCENDING), ("created_at", ASCENDING)],
+            name="status_created_at",
+        ),
+    ],
+    MirroredAsset: [
+        IndexModel([("asset_id", ASCENDING)], name="asset_id_unique", unique=True),
+    ],
+    # Also makes a replayed holding upsert fail instead of adding a duplicate
+    AssetHolding: [
+        IndexModel(
+            [("asset_id", ASCENDING), ("address", ASCENDING)],
+            name="asset_id_address_unique",
+            unique=True,
+        ),
+    ],
+    SyncCheckpoint: [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    IdempotencyRecord: [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        # Mongo deletes stored responses once they expire
+        IndexModel(
+            [("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0
+        ),
+    ],
+    # Only used with the shared rate limit backend; idle buckets are dropped
+    RateLimitBucket: [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel(
+            [("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0
+        ),
+    ],
+}
+
+# Options that make two indexes with the same keys behave differently
+INDEX_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _same_index(declared: dict, existing: dict) -> bool:
+    if list(declared["key"].items()) != [tuple(key) for key in existing["key"]]:
+        return False
+    return all(declared.get(option) == existing.get(option) for option in INDEX_OPTIONS)
+
+
+async def ensure_indexes() -> dict:
+    """
+    Create missing indexes, rebuild the ones whose definition changed, and
+    report per collection which indexes are missing, undeclared or unused.
+    Failures are logged rather than raised so the API still starts.
+    """
+    report = {}
+    for model, indexes in INDEXES.items():
+        collection = resources.engine.get_collection(model)
+        entry = report[collection.name] = {
+            "created": [],
+            "missing": [],
+            "undeclared": [],
+            "unused": [],
+        }
+        try:
+            existing = await collection.index_information()
+        except ConnectionFailure as e:
+            # Every other collection would wait out the same timeout
+            logger.error("Could not reach MongoDB to check indexes: %s", e)
+            break
+        except PyMongoError as e:
+            logger.error("Could not list indexes of %s: %s", collection.name, e)
+            continue
+
+        for index in indexes:
+            declared = index.document
+            name = declared["name"]
+            if name in existing and _same_index(declared, existing[name]):
+                continue
+            try:
+                if name in existing:
+                    await collection.drop_index(name)
+                await collection.create_indexes([index])
+                entry["created"].append(name)
+            except PyMongoError as e:
+                logger.error(
+                    "Could not create index %s.%s: %s", collection.name, name, e
+                )
+                entry["missing"].append(name)
+
+        declared_names = {index.document["name"] for index in indexes}
+        entry["undeclared"] = sorted(set(existing) - declared_names - {"_id_"})
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    entry["unused"].append(stats["name"])
+        except PyMongoError as e:
+            logger.warning("Could not read index usage of %s: %s", collection.name, e)
+
+    for name, entry in report.items():
+        if entry["missing"] or entry["undeclared"] or entry["unused"]:
+            logger.warning("Index report for %s: %s", name, entry)
+        else:
+            logger.info("Index report for %s: %s", name, entry)
+    return report
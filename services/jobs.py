@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import secrets
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+
+from config.resources import resources
+from config.settings import settings
+from models.jobs import Job, JobKind, JobStatus, utc_now
+from services.records import (
+    RecordWorkflowError,
+    get_user_by_id,
+    issue_land_record,
+    issue_land_records,
+    revoke_land_record,
+    revoke_land_records,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    JobKind.ISSUE: issue_land_record,
+    JobKind.REVOKE: revoke_land_record,
+}
+# Handlers for many land holders at once, reporting on each of them
+BATCH_HANDLERS = {
+    JobKind.ISSUE_BATCH: issue_land_records,
+    JobKind.REVOKE_BATCH: revoke_land_records,
+}
+
+
+class JobQueue:
+    """
+    Mongo-backed queue for land record issuance and revocation.
+
+    Jobs are claimed with an atomic `find_one_and_update` and leased for
+    `lease_seconds`, so several API processes can share the collection. The
+    worker renews the lease while the job runs and only writes the outcome
+    while the lease token it claimed with is still on the job. A job whose
+    worker died is claimed again once its lease expires; the workflows look
+    up the transactions saved on the Record before sending new ones.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        lease_seconds: int,
+        poll_interval: float,
+        max_attempts: int,
+    ):
+        self.workers = workers
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def enqueue(
+        self,
+        kind: JobKind,
+        issuer_id: str,
+        land_holder_id: str | None = None,
+        land_holder_ids: list[str] | None = None,
+    ) -> Job:
+        job = Job(
+            kind=kind,
+            issuer_id=issuer_id,
+            land_holder_id=land_holder_id,
+            land_holder_ids=land_holder_ids or [],
+        )
+        await resources.engine.save(job)
+        self._wakeup.set()
+        return job
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self) -> Job | None:
+        now = utc_now()
+        doc = await resources.engine.get_collection(Job).find_one_and_update(
+            {
+                "$or": [
+                    {"status": JobStatus.PENDING.value},
+                    {
+                        "status": JobStatus.RUNNING.value,
+                        "lease_expires_at": {"$lt": now},
+                    },
+                ]
+            },
+            {
+                "$set": {
+                    "status": JobStatus.RUNNING.value,
+                    "lease_expires_at": now + self.lease,
+                    "lease_token": secrets.token_hex(16),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return Job.model_validate_doc(doc) if doc else None
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.warning("Could not claim a job: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception:
+                # The lease runs out and the job is claimed again
+                logger.exception("Could not run job %s", job.id)
+
+    async def _renew_lease(self, job: Job):
+        """
+        Extend the lease on `job` every third of its length. Returns once
+        another worker has taken the job over.
+        """
+        collection = resources.engine.get_collection(Job)
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            expires_at = utc_now() + self.lease
+            try:
+                renewed = await collection.find_one_and_update(
+                    {"_id": job.id, "lease_token": job.lease_token},
+                    {"$set": {"lease_expires_at": expires_at}},
+                )
+            except Exception as e:
+                logger.warning("Could not renew the lease on job %s: %s", job.id, e)
+                continue
+            if renewed is None:
+                return
+            job.lease_expires_at = expires_at
+
+    async def _save_outcome(self, job: Job, token: str, expires_at):
+        """
+        Write the outcome of `job` if the lease claimed with `token` still
+        holds, retrying failed writes until the lease expires at
+        `expires_at`. After that another worker claims the job and resumes
+        it from the Record.
+        """
+        outcome = job.model_dump_doc()
+        del outcome["_id"]
+        collection = resources.engine.get_collection(Job)
+        while True:
+            try:
+                saved = await collection.find_one_and_update(
+                    {"_id": job.id, "lease_token": token}, {"$set": outcome}
+                )
+                break
+            except Exception as e:
+                remaining = (expires_at - utc_now()).total_seconds()
+                if remaining <= 0:
+                    raise
+                logger.warning("Could not save job %s, retrying: %s", job.id, e)
+                await asyncio.sleep(min(self.poll_interval, remaining))
+        if saved is None:
+            logger.warning("Lost the lease on job %s before saving it", job.id)
+
+    async def _execute(self, job: Job):
+        record = None
+        try:
+            issuer = await get_user_by_id(job.issuer_id)
+            if not issuer:
+                raise RecordWorkflowError("Token issuer not found.")
+            if job.kind in BATCH_HANDLERS:
+                job.report = await BATCH_HANDLERS[job.kind](issuer, job.land_holder_ids)
+            else:
+                record = await JOB_HANDLERS[job.kind](issuer, job.land_holder_id)
+        except RecordWorkflowError as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        except Exception as e:
+            logger.exception("Job %s failed on attempt %s", job.id, job.attempts)
+            job.error = str(e)
+            job.status = (
+                JobStatus.FAILED
+                if job.attempts >= self.max_attempts
+                else JobStatus.PENDING
+            )
+        else:
+            job.status = JobStatus.SUCCEEDED
+            job.error = None
+        if record is not None:
+            job.record_id = str(record.id)
+            job.asset_id = record.asset_id
+            job.transaction_id = (
+                record.revoke_transaction_id
+                if job.kind == JobKind.REVOKE
+                else record.transaction_id
+            )
+
+    async def _run(self, job: Job):
+        work = asyncio.create_task(self._execute(job))
+        renewal = asyncio.create_task(self._renew_lease(job))
+        await asyncio.wait((work, renewal), return_when=asyncio.FIRST_COMPLETED)
+        renewal.cancel()
+        if not work.done():
+            # Another worker owns the job now and resumes it from the Record
+            logger.warning("Lost the lease on job %s; abandoning it", job.id)
+            work.cancel()
+            await asyncio.gather(work, return_exceptions=True)
+            return
+
+        token, expires_at = job.lease_token, job.lease_expires_at
+        job.lease_expires_at = None
+        job.lease_token = None
+        job.updated_at = utc_now()
+        await self._save_outcome(job, token, expires_at)
+
+
+job_queue = JobQueue(
+    workers=settings.job_workers,
+    lease_seconds=settings.job_lease_seconds,
+    poll_interval=settings.job_poll_interval,
+    max_attempts=settings.job_max_attempts,
+)
@@ -0,0 +1,215 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+from pymongo import monitoring
+
+# Upper bounds in seconds, from a cache hit to a slow algod round trip
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per combination of label values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [count per bucket..., count above the last, sum]
+        self._series: dict[tuple, list[float]] = {}
+        # The Mongo command listener observes from the driver's threads
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            snapshot = sorted(
+                (values, list(series)) for values, series in self._series.items()
+            )
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                labels = _labels(self.labelnames, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge or counter read from the running application when scraped.
+    `callback` returns a value, or a mapping of label values to values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        kind: str,
+        callback: Callable[[], float | dict[tuple, float]],
+        labelnames: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def render(self) -> list[str]:
+        samples = self.callback()
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {value}")
+        return lines
+
+
+_metrics: dict[str, Histogram | CallbackMetric] = {}
+
+
+def gauge(name: str, description: str, callback, labelnames: tuple[str, ...] = ()):
+    _metrics[name] = CallbackMetric(name, description, "gauge", callback, labelnames)
+
+
+def counter(name: str, description: str, callback, labelnames: tuple[str, ...] = ()):
+    _metrics[name] = CallbackMetric(name, description, "counter", callback, labelnames)
+
+
+def cache_metrics(cache: str, stats: Callable[[], dict]):
+    """
+    Publish the hit and miss counts of a cache with a `stats()` method.
+    """
+    for field in ("hits", "misses"):
+        name = f"{cache}_cache_{field}_total"
+        counter(name, f"{cache} cache {field}", lambda field=field: stats()[field])
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route template and status",
+    ("method", "route", "status"),
+)
+dependency_latency = Histogram(
+    "dependency_call_duration_seconds",
+    "Time spent in calls to Mongo, S3, bcrypt and algod",
+    ("dependency", "operation", "outcome"),
+)
+_metrics[request_latency.name] = request_latency
+_metrics[dependency_latency.name] = dependency_latency
+
+
+@contextmanager
+def timed(dependency: str, operation: str):
+    """
+    Record how long the block takes in `dependency_latency`.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        dependency_latency.observe(
+            time.perf_counter() - start, dependency, operation, outcome
+        )
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Time every command the Mongo driver sends, including the raw collection
+    calls that bypass the ODMantic engine.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        dependency_latency.observe(
+            event.duration_micros / 1e6, "mongo", event.command_name, "ok"
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        dependency_latency.observe(
+            event.duration_micros / 1e6, "mongo", event.command_name, "error"
+        )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template, so path
+    parameters do not create a series per id. Streaming responses are timed
+    until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_latency.observe(
+                time.perf_counter() - start, scope["method"], route, str(status_code)
+            )
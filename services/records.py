@@ -0,0 +1,658 @@
+import asyncio
+import itertools
+from typing import AsyncIterator
+
+from bson import ObjectId
+from odmantic import query
+from odmantic.query import QueryExpression
+from pymongo import ASCENDING, UpdateOne
+
+from config.resources import resources
+from config.settings import settings
+from models.auth import User
+from models.records import (
+    RECORD_FIELDS,
+    BatchItemStatus,
+    Record,
+    RecordBatchItem,
+    RecordView,
+    TransactionAttempt,
+)
+from services.algorand import (
+    MAX_GROUP_SIZE,
+    build_asa_txn,
+    build_clawback_txn,
+    build_opt_in_and_transfer_txns,
+    find_created_asset,
+    find_transaction,
+    is_rejection,
+    issuance_params,
+    send_signed_group_and_confirm,
+    sign_group,
+)
+from services.auth import save_user
+from services.crypto import decrypt_data, decrypt_signing_key
+from services.upload import UploadedFile
+
+
+class RecordWorkflowError(Exception):
+    """
+    Raised when a land record workflow cannot succeed by retrying it.
+    """
+
+
+class AttemptConflictError(Exception):
+    """
+    Raised when another worker saved its own transaction for the same step
+    of a land record first, and that transaction did not confirm. The step
+    can be retried.
+    """
+
+
+async def get_user_by_id(user_id: str) -> User | None:
+    if not ObjectId.is_valid(user_id):
+        return None
+    return await resources.engine.find_one(User, User.id == ObjectId(user_id))
+
+
+async def load_land_holder(user_id: str) -> tuple[User, Record]:
+    land_holder = await get_user_by_id(user_id)
+    if not land_holder:
+        raise RecordWorkflowError("Land holder not found.")
+
+    land_holder_record = await resources.engine.find_one(
+        Record, Record.user_id == user_id
+    )
+    if not land_holder_record:
+        raise RecordWorkflowError("Land holder record not found.")
+    return land_holder, land_holder_record
+
+
+async def save_land_record(
+    owner: User, location: str, uploaded: UploadedFile
+) -> Record:
+    """
+    Save an unverified land record for an uploaded deed and link it to its
+    owner.
+    """
+    user = await resources.engine.find_one(User, User.id == owner.id)
+    if not user:
+        raise RecordWorkflowError("Error saving record. Please try again.")
+
+    record = Record(
+        location=location,
+        file_url=uploaded.url,
+        sha256=uploaded.sha256,
+        verified=False,
+        user_id=str(owner.id),
+    )
+    await resources.engine.save(record)
+    user.file_id = str(record.id)
+    await save_user(user)
+    return record
+
+
+def after_id(expression: QueryExpression, after: str | None) -> QueryExpression:
+    """
+    Restrict a record query to ids after the `after` cursor. Raises
+    RecordWorkflowError for malformed cursors.
+    """
+    if after is None:
+        return expression
+    if not ObjectId.is_valid(after):
+        raise RecordWorkflowError("Invalid cursor.")
+    return query.and_(expression, Record.id > ObjectId(after))
+
+
+def record_projection(fields: str | None) -> dict | None:
+    """
+    Turn a comma separated `fields` parameter into a Mongo projection, or
+    None for whole records. Raises RecordWorkflowError for unknown fields.
+    """
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - RECORD_FIELDS
+    if unknown:
+        raise RecordWorkflowError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return dict.fromkeys(names, 1)
+
+
+async def find_records_page(
+    expression: QueryExpression,
+    limit: int,
+    after: str | None = None,
+    projection: dict | None = None,
+) -> tuple[list[RecordView], str | None]:
+    """
+    Fetch one page of records ordered by id, using the id of the last record
+    as the keyset cursor. Returns the page and the cursor for the next one.
+    """
+    cursor = resources.engine.get_collection(Record).find(
+        after_id(expression, after),
+        projection,
+        sort=[("_id", ASCENDING)],
+        limit=limit,
+    )
+    records = [RecordView.model_validate(doc) async for doc in cursor]
+    next_after = str(records[-1].id) if len(records) == limit else None
+    return records, next_after
+
+
+async def stream_records(
+    expression: QueryExpression,
+    after: str | None = None,
+    projection: dict | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yield matching records as NDJSON lines, reading the cursor in batches so
+    memory use does not grow with the collection.
+    """
+    cursor = resources.engine.get_collection(Record).find(
+        after_id(expression, after),
+        projection,
+        sort=[("_id", ASCENDING)],
+        batch_size=settings.record_stream_batch_size,
+    )
+    async for doc in cursor:
+        record = RecordView.model_validate(doc)
+        yield record.model_dump_json(exclude_unset=True).encode() + b"\n"
+
+
+async def load_land_holders(
+    user_ids: list[str],
+) -> tuple[dict[str, User], dict[str, Record], dict[str, RecordBatchItem]]:
+    """
+    Resolve many land holders and their records with one query each. Returns
+    users and records keyed by user id, plus a report entry for every id.
+    """
+    report = {user_id: RecordBatchItem(land_holder_id=user_id) for user_id in user_ids}
+    object_ids = [ObjectId(user_id) for user_id in report if ObjectId.is_valid(user_id)]
+    users = {
+        str(user.id): user
+        for user in await resources.engine.find(User, User.id.in_(object_ids))
+    }
+    records = {}
+    for record in await resources.engine.find(Record, Record.user_id.in_(list(users))):
+        records.setdefault(record.user_id, record)
+
+    for user_id, item in report.items():
+        if user_id not in users:
+            item.detail = "Land holder not found."
+        elif user_id not in records:
+            item.detail = "Land holder record not found."
+    return users, records, report
+
+
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def land_record_asset(land_holder: User, land_holder_record: Record) -> dict:
+    """
+    Describe the NFT representing a land record.
+    """
+    name = (
+        f"{land_holder.first_name}_{land_holder.surname}_{land_holder_record.location}"
+    )
+    return dict(
+        asset_name=name,
+        unit_name=name,
+        total=1,  # Algorand configiration for NFT
+        decimals=0,  # Algorand configuration for NFT
+        url=land_holder_record.file_url,
+        note=str(land_holder_record.id).encode(),
+    )
+
+
+async def resume_attempt(attempt: TransactionAttempt | None) -> dict | None:
+    """
+    Look up a transaction saved on a record by an earlier attempt. Returns
+    its confirmed info, or None if there was no attempt or it can no longer
+    be confirmed.
+    """
+    if attempt is None:
+        return None
+    return await find_transaction(attempt.txid, attempt.first_valid, attempt.last_valid)
+
+
+def transaction_attempt(signed_txn) -> TransactionAttempt:
+    txn = signed_txn.transaction
+    return TransactionAttempt(
+        txid=signed_txn.get_txid(),
+        first_valid=txn.first_valid_round,
+        last_valid=txn.last_valid_round,
+    )
+
+
+def attempt_filter(record: Record, field: str) -> dict:
+    """
+    Match `record` only while its `field` attempt is still the one it was
+    loaded with.
+    """
+    attempt = getattr(record, field)
+    if attempt is None:
+        return {"_id": record.id, field: None}
+    return {"_id": record.id, f"{field}.txid": attempt.txid}
+
+
+async def send_attempt(record: Record, field: str, signed_txns: list) -> dict:
+    """
+    Save the last of `signed_txns` on `record` as its `field` attempt, then
+    send them as one group and return the confirmed info of that last one.
+    The txid is stored before sending, so a retry never sends the step twice.
+    The attempt is only stored if nobody stored another since `record` was
+    loaded; otherwise the other worker's transaction is followed instead.
+    """
+    attempt = transaction_attempt(signed_txns[-1])
+    collection = resources.engine.get_collection(Record)
+    claimed = await collection.find_one_and_update(
+        attempt_filter(record, field), {"$set": {field: attempt.model_dump()}}
+    )
+    if claimed is None:
+        latest = await resources.engine.find_one(Record, Record.id == record.id)
+        setattr(record, field, getattr(latest, field))
+        info = await resume_attempt(getattr(record, field))
+        if info is None:
+            raise AttemptConflictError(
+                "Another attempt at this land record did not confirm."
+            )
+        return info
+
+    setattr(record, field, attempt)
+    try:
+        _, results = await send_signed_group_and_confirm(signed_txns)
+    except Exception as e:
+        if is_rejection(e):
+            # Nothing was applied, so there is nothing to look up later
+            await collection.update_one(
+                attempt_filter(record, field), {"$set": {field: None}}
+            )
+            setattr(record, field, None)
+        raise
+    return results[-1]
+
+
+async def update_records(changes: dict[ObjectId, dict]):
+    """
+    Set fields on many records, keyed by record id, with one bulk write.
+    """
+    if changes:
+        await resources.engine.get_collection(Record).bulk_write(
+            [
+                UpdateOne({"_id": record_id}, {"$set": values})
+                for record_id, values in changes.items()
+            ],
+            ordered=False,
+        )
+
+
+async def send_group_attempts(
+    chunk: list[Record], field: str, signed_txns: list, attempts: list
+) -> tuple[list[str], list[dict]]:
+    """
+    Batch counterpart of `send_attempt`: save `attempts`, one signed
+    transaction for each record of `chunk`, as their `field` attempts with
+    one bulk write, then send `signed_txns` as one group. If another worker
+    stored an attempt on any of the records first, nothing is sent and
+    AttemptConflictError is raised.
+    """
+    collection = resources.engine.get_collection(Record)
+    claims = [
+        (record, transaction_attempt(stxn)) for record, stxn in zip(chunk, attempts)
+    ]
+    result = await collection.bulk_write(
+        [
+            UpdateOne(attempt_filter(record, field), {"$set": {field: a.model_dump()}})
+            for record, a in claims
+        ],
+        ordered=False,
+    )
+    for record, attempt in claims:
+        setattr(record, field, attempt)
+
+    async def release():
+        await collection.bulk_write(
+            [
+                UpdateOne(attempt_filter(record, field), {"$set": {field: None}})
+                for record in chunk
+            ],
+            ordered=False,
+        )
+        for record in chunk:
+            setattr(record, field, None)
+
+    if result.matched_count < len(chunk):
+        await release()
+        raise AttemptConflictError("Another job is already sending this land record.")
+    try:
+        return await send_signed_group_and_confirm(signed_txns)
+    except Exception as e:
+        if is_rejection(e):
+            await release()
+        raise
+
+
+async def split_on_rejection(send, chunk: list[str]) -> list[tuple[str, Exception]]:
+    """
+    Call `send` for a group of land holders. If algod rejects the group, or
+    another job is already sending some of it, try each half of it again,
+    down to single holders, so that such a holder only fails itself.
+    Returns the holders that still failed, with their error.
+    """
+    try:
+        await send(chunk)
+        return []
+    except Exception as e:
+        splittable = is_rejection(e) or isinstance(e, AttemptConflictError)
+        if len(chunk) == 1 or not splittable:
+            return [(user_id, e) for user_id in chunk]
+    half = len(chunk) // 2
+    first, second = await asyncio.gather(
+        split_on_rejection(send, chunk[:half]), split_on_rejection(send, chunk[half:])
+    )
+    return first + second
+
+
+async def send_in_groups(
+    send, user_ids: list[str], size: int, report: dict, action: str
+):
+    """
+    Call `send` for the land holders in groups of `size`, splitting groups
+    algod rejects, and record the holders that failed in `report`.
+    """
+    failed = await asyncio.gather(
+        *(split_on_rejection(send, chunk) for chunk in chunked(user_ids, size))
+    )
+    for user_id, e in itertools.chain.from_iterable(failed):
+        report[user_id].status = BatchItemStatus.FAILED
+        report[user_id].detail = f"Error {action} asset. {e}"
+
+
+async def issue_land_record(issuer: User, land_holder_id: str) -> Record:
+    """
+    Create the ASA representing a land record and transfer it to the land
+    holder. Every transaction is saved on the Record before it is sent, so
+    running this again for the same holder resumes from what the chain says
+    instead of minting or transferring twice.
+    """
+    land_holder, land_holder_record = await load_land_holder(land_holder_id)
+    if land_holder_record.transaction_id:
+        return land_holder_record
+
+    issuer_private_key = decrypt_signing_key(issuer.algorand_encrypted_private_key)
+    asset = land_record_asset(land_holder, land_holder_record)
+
+    # Create ASA, unless an earlier attempt did
+    if land_holder_record.asset_id is None:
+        info = await resume_attempt(land_holder_record.asset_attempt)
+        if info is None:
+            txn = build_asa_txn(
+                await issuance_params(), issuer.algorand_address, **asset
+            )
+            info = await send_attempt(
+                land_holder_record, "asset_attempt", [txn.sign(issuer_private_key)]
+            )
+        # algod only reports the asset id for recently confirmed transactions
+        asset_id = info.get("asset-index") or await find_created_asset(
+            info["confirmed-round"], issuer.algorand_address, asset["note"]
+        )
+        if asset_id is None:
+            raise RecordWorkflowError("Created asset not found on chain.")
+        land_holder_record.asset_id = asset_id
+        await resources.engine.save(land_holder_record)
+
+    # Land owner opts-in to ASA and receives it in the same atomic group
+    if await resume_attempt(land_holder_record.transfer_attempt) is None:
+        txns = build_opt_in_and_transfer_txns(
+            await issuance_params(),
+            issuer.algorand_address,
+            land_holder.algorand_address,
+            land_holder_record.asset_id,
+            amount=1,
+        )
+        holder_private_key = decrypt_data(
+            land_holder.algorand_encrypted_private_key.encode()
+        )
+        await send_attempt(
+            land_holder_record,
+            "transfer_attempt",
+            sign_group(txns, [holder_private_key, issuer_private_key]),
+        )
+
+    # save transaction id to Record document
+    land_holder_record.transaction_id = land_holder_record.transfer_attempt.txid
+    land_holder_record.verified = True
+    await resources.engine.save(land_holder_record)
+    return land_holder_record
+
+
+async def issue_land_records(
+    issuer: User, land_holder_ids: list[str]
+) -> list[RecordBatchItem]:
+    """
+    Issue land records for many holders. ASAs are created in atomic groups of
+    MAX_GROUP_SIZE, then opted in to and transferred in groups of pairs. As
+    with a single issuance the transactions of a group are saved on its
+    Records before the group is sent, and the outcome is written back as
+    soon as the group confirms, so a crash loses nothing already minted. A
+    group algod rejects is split and sent again until the holders causing
+    it are found. Records an earlier attempt left half done are finished
+    one by one with `issue_land_record`.
+    """
+    users, records, report = await load_land_holders(land_holder_ids)
+    issuer_private_key = decrypt_signing_key(issuer.algorand_encrypted_private_key)
+    semaphore = asyncio.Semaphore(settings.batch_group_concurrency)
+
+    pending, resumed = [], []
+    for user_id, record in records.items():
+        if record.transaction_id:
+            report[user_id].status = BatchItemStatus.SKIPPED
+            report[user_id].detail = "Land record already issued."
+        elif record.transfer_attempt or (
+            record.asset_id is None and record.asset_attempt
+        ):
+            resumed.append(user_id)
+        else:
+            pending.append(user_id)
+
+    async def resume(user_id: str):
+        async with semaphore:
+            try:
+                records[user_id] = await issue_land_record(issuer, user_id)
+            except Exception as e:
+                report[user_id].detail = f"Error issuing asset. {e}"
+                return
+        report[user_id].status = BatchItemStatus.ISSUED
+
+    async def create_assets(chunk: list[str]):
+        async with semaphore:
+            sp = await issuance_params()
+            signed_txns = sign_group(
+                [
+                    build_asa_txn(
+                        sp,
+                        issuer.algorand_address,
+                        **land_record_asset(users[uid], records[uid]),
+                    )
+                    for uid in chunk
+                ],
+                [issuer_private_key] * len(chunk),
+            )
+            _, results = await send_group_attempts(
+                [records[uid] for uid in chunk],
+                "asset_attempt",
+                signed_txns,
+                signed_txns,
+            )
+        for user_id, result in zip(chunk, results):
+            records[user_id].asset_id = result["asset-index"]
+        await update_records(
+            {records[uid].id: {"asset_id": records[uid].asset_id} for uid in chunk}
+        )
+
+    async def transfer_assets(chunk: list[str]):
+        async with semaphore:
+            txns, private_keys = [], []
+            sp = await issuance_params()
+            for uid in chunk:
+                txns.extend(
+                    build_opt_in_and_transfer_txns(
+                        sp,
+                        issuer.algorand_address,
+                        users[uid].algorand_address,
+                        records[uid].asset_id,
+                        amount=1,
+                    )
+                )
+                private_keys.append(
+                    decrypt_data(users[uid].algorand_encrypted_private_key.encode())
+                )
+                private_keys.append(issuer_private_key)
+            signed_txns = sign_group(txns, private_keys)
+            # The transfer, second of each pair, stands for the pair
+            txids, _ = await send_group_attempts(
+                [records[uid] for uid in chunk],
+                "transfer_attempt",
+                signed_txns,
+                signed_txns[1::2],
+            )
+        for user_id, txid in zip(chunk, txids[1::2]):
+            records[user_id].transaction_id = txid
+            records[user_id].verified = True
+            report[user_id].status = BatchItemStatus.ISSUED
+            report[user_id].detail = None
+        await update_records(
+            {
+                records[uid].id: {
+                    "transaction_id": records[uid].transaction_id,
+                    "verified": True,
+                }
+                for uid in chunk
+            }
+        )
+
+    await asyncio.gather(*(resume(user_id) for user_id in resumed))
+    to_create = [uid for uid in pending if records[uid].asset_id is None]
+    await send_in_groups(create_assets, to_create, MAX_GROUP_SIZE, report, "creating")
+    to_transfer = [uid for uid in pending if records[uid].asset_id is not None]
+    await send_in_groups(
+        transfer_assets, to_transfer, MAX_GROUP_SIZE // 2, report, "transferring"
+    )
+
+    for user_id, record in records.items():
+        report[user_id].asset_id = record.asset_id
+        report[user_id].transaction_id = record.transaction_id
+    return list(report.values())
+
+
+async def revoke_land_record(issuer: User, land_holder_id: str) -> Record:
+    """
+    Claw the land record ASA back from the land holder. Like issuance, the
+    clawback is saved on the Record before it is sent.
+    """
+    land_holder, land_holder_record = await load_land_holder(land_holder_id)
+    if land_holder_record.is_land_revoked:
+        return land_holder_record
+    if land_holder_record.asset_id is None:
+        raise RecordWorkflowError("Land holder record has not been issued.")
+
+    if await resume_attempt(land_holder_record.revoke_attempt) is None:
+        txn = build_clawback_txn(
+            await issuance_params(),
+            clawback_address=issuer.algorand_address,
+            holder_address=land_holder.algorand_address,
+            asset_id=land_holder_record.asset_id,
+            amount=1,
+        )
+        private_key = decrypt_signing_key(issuer.algorand_encrypted_private_key)
+        await send_attempt(
+            land_holder_record, "revoke_attempt", [txn.sign(private_key)]
+        )
+
+    # save revoke transaction id to Record document
+    land_holder_record.revoke_transaction_id = land_holder_record.revoke_attempt.txid
+    land_holder_record.is_land_revoked = True
+    await resources.engine.save(land_holder_record)
+    return land_holder_record
+
+
+async def revoke_land_records(
+    issuer: User, land_holder_ids: list[str]
+) -> list[RecordBatchItem]:
+    """
+    Claw land record ASAs back from many holders in atomic groups of
+    MAX_GROUP_SIZE. Like batch issuance, the clawbacks are saved on their
+    Records before a group is sent and the outcome right after it confirms,
+    and a group algod rejects is split until the holders causing it are
+    found. Records an earlier attempt left half done are finished one by
+    one with `revoke_land_record`.
+    """
+    users, records, report = await load_land_holders(land_holder_ids)
+    issuer_private_key = decrypt_signing_key(issuer.algorand_encrypted_private_key)
+    semaphore = asyncio.Semaphore(settings.batch_group_concurrency)
+
+    pending, resumed = [], []
+    for user_id, record in records.items():
+        if record.is_land_revoked:
+            report[user_id].status = BatchItemStatus.SKIPPED
+            report[user_id].detail = "Land record already revoked."
+        elif record.asset_id is None:
+            report[user_id].detail = "Land holder record has not been issued."
+        elif record.revoke_attempt:
+            resumed.append(user_id)
+        else:
+            pending.append(user_id)
+
+    async def resume(user_id: str):
+        async with semaphore:
+            try:
+                records[user_id] = await revoke_land_record(issuer, user_id)
+            except Exception as e:
+                report[user_id].detail = f"Error revoking asset. {e}"
+                return
+        report[user_id].status = BatchItemStatus.REVOKED
+
+    async def revoke_assets(chunk: list[str]):
+        async with semaphore:
+            sp = await issuance_params()
+            signed_txns = sign_group(
+                [
+                    build_clawback_txn(
+                        sp,
+                        issuer.algorand_address,
+                        users[uid].algorand_address,
+                        records[uid].asset_id,
+                        amount=1,
+                    )
+                    for uid in chunk
+                ],
+                [issuer_private_key] * len(chunk),
+            )
+            txids, _ = await send_group_attempts(
+                [records[uid] for uid in chunk],
+                "revoke_attempt",
+                signed_txns,
+                signed_txns,
+            )
+        for user_id, txid in zip(chunk, txids):
+            records[user_id].revoke_transaction_id = txid
+            records[user_id].is_land_revoked = True
+            report[user_id].status = BatchItemStatus.REVOKED
+        await update_records(
+            {
+                records[uid].id: {
+                    "revoke_transaction_id": records[uid].revoke_transaction_id,
+                    "is_land_revoked": True,
+                }
+                for uid in chunk
+            }
+        )
+
+    await asyncio.gather(*(resume(user_id) for user_id in resumed))
+    await send_in_groups(revoke_assets, pending, MAX_GROUP_SIZE, report, "revoking")
+
+    for user_id, record in records.items():
+        report[user_id].asset_id = record.asset_id
+        report[user_id].transaction_id = record.revoke_transaction_id
+    return list(report.values())
@@ -0,0 +1,42 @@
+from typing import Any, Mapping
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.background import BackgroundTask
+
+
+def dump_json(content: Any, exclude_unset: bool = False) -> bytes:
+    """
+    Serialise models, or lists and dicts of them, straight to JSON bytes with
+    pydantic-core instead of building a dict tree for `json.dumps`. ObjectIds
+    and datetimes go through the models' own serialisers; bare ObjectIds
+    fall back to `str`.
+    """
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(
+            content, exclude_unset=exclude_unset, fallback=str
+        )
+    return to_json(content, fallback=str)
+
+
+class ModelResponse(JSONResponse):
+    """
+    JSON response rendered with `dump_json`. Returning one from a route with
+    an already validated model skips FastAPI's re-validation and encoding.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+        exclude_unset: bool = False,
+    ):
+        self.exclude_unset = exclude_unset
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content, self.exclude_unset)
@@ -1,43 +1,393 @@
+import asyncio
+import base64
+import functools
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
-import boto3
-import boto3.resources
 from botocore.exceptions import ClientError
+from fastapi import UploadFile
 
+from config.resources import resources
 from config.settings import settings
+from services.metrics import timed
 
-ACCESS_ID = settings.digital_ocean_access_key
-SECRET_KEY = settings.digital_ocean_secret_key
+# boto3 is blocking, so S3 requests run on their own bounded thread pool.
+upload_executor = ThreadPoolExecutor(
+    max_workers=settings.upload_max_workers, thread_name_prefix="s3"
+)
 
 
-s3_client = boto3.client(
-    "s3",
-    region_name="ams3",
-    endpoint_url="https://ams3.digitaloceanspaces.com",
-    aws_access_key_id=ACCESS_ID,
-    aws_secret_access_key=SECRET_KEY,
-)
+@dataclass
+class UploadedFile:
+    url: str
+    sha256: str
+    size: int
+
+
+class UploadVerificationError(Exception):
+    """
+    Raised when a directly uploaded object does not match its upload ticket.
+    """
+
+
+def file_url_for(key: str, bucket_name: str = "land-records") -> str:
+    return f"https://{bucket_name}.ams3.digitaloceanspaces.com/{key}"
+
 
+async def run_s3(func, *args, **kwargs):
+    """
+    Run a blocking S3 call on the upload thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    with timed("s3", func.__name__):
+        return await loop.run_in_executor(
+            upload_executor, functools.partial(func, *args, **kwargs)
+        )
 
-def upload_file_to_bucket(
-    file_obj, bucket_name: str = "land-records", s3_client=s3_client
-):
-    """Upload a file to an S3 bucket
+
+async def hash_chunk(digest, chunk: bytes):
+    """
+    hashlib releases the GIL on large buffers, so hash off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(upload_executor, digest.update, chunk)
+
+
+async def _upload_part(
+    s3_client,
+    bucket_name: str,
+    key: str,
+    upload_id: str,
+    part_number: int,
+    body: bytes,
+    slots: asyncio.Semaphore,
+) -> dict:
+    try:
+        response = await run_s3(
+            s3_client.upload_part,
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+    finally:
+        slots.release()
+
+
+async def upload_file_to_bucket(
+    file_obj: UploadFile,
+    bucket_name: str = "land-records",
+    s3_client=None,
+    key: str | None = None,
+    metadata: dict[str, str] | None = None,
+    hashed: tuple[str, int] | None = None,
+) -> UploadedFile:
+    """Stream a file to an S3 bucket
+
+    Files larger than one part are sent as a multipart upload with at most
+    `upload_concurrency` parts in flight, which bounds memory use to about
+    that many parts. The SHA-256 of the content is computed on the way,
+    unless `hashed` already gives it.
 
     :param file_obj: File to upload
-    :param bucket: Bucket to upload to
-    :param s3_client: S3 client
-    :return: True if file was uploaded, else False
+    :param bucket_name: Bucket to upload to
+    :param s3_client: S3 client, defaults to the shared one
+    :param key: Object key, defaults to the file name
+    :param metadata: User metadata stored with the object
+    :param hashed: SHA-256 and size of the file from `hash_file`, if known
+    :return: URL, SHA-256 and size of the uploaded file
+    """
+    with timed("s3", "upload_file_to_bucket"):
+        return await _stream_to_bucket(
+            file_obj,
+            bucket_name,
+            s3_client or resources.s3_client,
+            key or file_obj.filename,
+            metadata,
+            hashed,
+        )
+
+
+async def _stream_to_bucket(
+    file_obj: UploadFile,
+    bucket_name: str,
+    s3_client,
+    key: str,
+    metadata: dict[str, str] | None,
+    hashed: tuple[str, int] | None = None,
+) -> UploadedFile:
+    content_type = file_obj.content_type or "application/octet-stream"
+    part_size = settings.upload_part_size
+    digest = None if hashed else hashlib.sha256()
+
+    chunk = await file_obj.read(part_size)
+    if digest:
+        await hash_chunk(digest, chunk)
+    size = len(chunk)
+
+    try:
+        if len(chunk) < part_size:
+            await run_s3(
+                s3_client.put_object,
+                Bucket=bucket_name,
+                Key=key,
+                Body=chunk,
+                ContentType=content_type,
+                Metadata=metadata or {},
+            )
+        else:
+            response = await run_s3(
+                s3_client.create_multipart_upload,
+                Bucket=bucket_name,
+                Key=key,
+                ContentType=content_type,
+                Metadata=metadata or {},
+            )
+            upload_id = response["UploadId"]
+            slots = asyncio.Semaphore(settings.upload_concurrency)
+            tasks = []
+            try:
+                part_number = 1
+                while chunk:
+                    await slots.acquire()
+                    tasks.append(
+                        asyncio.create_task(
+                            _upload_part(
+                                s3_client,
+                                bucket_name,
+                                key,
+                                upload_id,
+                                part_number,
+                                chunk,
+                                slots,
+                            )
+                        )
+                    )
+                    chunk = await file_obj.read(part_size)
+                    if digest:
+                        await hash_chunk(digest, chunk)
+                    size += len(chunk)
+                    part_number += 1
+                parts = await asyncio.gather(*tasks)
+                await run_s3(
+                    s3_client.complete_multipart_upload,
+                    Bucket=bucket_name,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await run_s3(
+                    s3_client.abort_multipart_upload,
+                    Bucket=bucket_name,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+                raise
+    except ClientError as e:
+        logging.error(e)
+        raise
+
+    file_url = file_url_for(key, bucket_name)
+    sha256 = hashed[0] if hashed else digest.hexdigest()
+    return UploadedFile(url=file_url, sha256=sha256, size=size)
+
+
+def deed_key(sha256: str) -> str:
+    """
+    Deeds are stored under their content hash, so identical files share one
+    object and no upload can overwrite a different deed.
     """
+    return f"deeds/{sha256}"
 
-    # Upload the file
+
+async def hash_file(file_obj: UploadFile) -> tuple[str, int]:
+    """
+    Compute the SHA-256 and size of an uploaded file, reading it in chunks,
+    and rewind it afterwards.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file_obj.read(settings.upload_part_size):
+        await hash_chunk(digest, chunk)
+        size += len(chunk)
+    await file_obj.seek(0)
+    return digest.hexdigest(), size
+
+
+async def object_exists(
+    key: str, bucket_name: str = "land-records", s3_client=None
+) -> bool:
+    s3_client = s3_client or resources.s3_client
     try:
-        response = s3_client.upload_fileobj(
-            file_obj.file, bucket_name, file_obj.filename
+        await run_s3(s3_client.head_object, Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+async def store_deed(
+    file_obj: UploadFile,
+    bucket_name: str = "land-records",
+    s3_client=None,
+    hashed: tuple[str, int] | None = None,
+) -> UploadedFile:
+    """Store a deed under its content hash
+
+    Starlette has already spooled the request body, so the file is hashed
+    first and only uploaded when no object with that hash exists yet.
+    Pass `hashed` from `hash_file` when the caller already has it.
+    """
+    sha256, size = hashed or await hash_file(file_obj)
+    key = deed_key(sha256)
+    if await object_exists(key, bucket_name, s3_client):
+        return UploadedFile(
+            url=file_url_for(key, bucket_name), sha256=sha256, size=size
         )
-        file_url = (
-            f"https://{bucket_name}.ams3.digitaloceanspaces.com/{file_obj.filename}"
+    return await upload_file_to_bucket(
+        file_obj,
+        bucket_name,
+        s3_client,
+        key=key,
+        metadata={"sha256": sha256, "size": str(size)},
+        hashed=(sha256, size),
+    )
+
+
+def create_upload_url(
+    key: str,
+    content_type: str,
+    size: int,
+    sha256: str,
+    bucket_name: str = "land-records",
+    s3_client=None,
+) -> tuple[str, dict]:
+    """Presign a PUT that lets a client upload a file straight to the bucket
+
+    The declared size and SHA-256 are part of the signature, so the client
+    must send them as headers. S3 also rejects a body that does not match
+    the checksum header, but Spaces does not check it, so the content is
+    only trusted once `verify_uploaded_file` has checked it.
+
+    :return: URL and the headers the client must send with the PUT
+    """
+    s3_client = s3_client or resources.s3_client
+    headers = {
+        "Content-Type": content_type,
+        "x-amz-checksum-sha256": base64.b64encode(bytes.fromhex(sha256)).decode(),
+        "x-amz-meta-sha256": sha256,
+        "x-amz-meta-size": str(size),
+    }
+    url = s3_client.generate_presigned_url(
+        "put_object",
+        Params={
+            "Bucket": bucket_name,
+            "Key": key,
+            "ContentType": content_type,
+            "ChecksumSHA256": headers["x-amz-checksum-sha256"],
+            "Metadata": {"sha256": sha256, "size": str(size)},
+        },
+        ExpiresIn=settings.upload_url_expires,
+    )
+    return url, headers
+
+
+def staging_key(user_id: str, sha256: str) -> str:
+    """
+    Direct uploads land under a per-user prefix and only reach `deeds/` once
+    the API has verified their content.
+    """
+    return f"uploads/{user_id}/{sha256}"
+
+
+async def hash_object(
+    key: str, bucket_name: str = "land-records", s3_client=None
+) -> tuple[str, int]:
+    """
+    Compute the SHA-256 and size of a stored object, streaming it in parts.
+    """
+    s3_client = s3_client or resources.s3_client
+    response = await run_s3(s3_client.get_object, Bucket=bucket_name, Key=key)
+    body = response["Body"]
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await run_s3(body.read, settings.upload_part_size):
+            await hash_chunk(digest, chunk)
+            size += len(chunk)
+    finally:
+        body.close()
+    return digest.hexdigest(), size
+
+
+async def verify_uploaded_file(
+    user_id: str, sha256: str, bucket_name: str = "land-records", s3_client=None
+) -> UploadedFile:
+    """Move a direct upload into `deeds/` once its content is verified
+
+    The upload is read from the user's staging key. Where storage reports
+    the object's checksum it must match `sha256`; otherwise the object is
+    streamed and hashed here, so nothing the client declared is trusted.
+    Only a verified object is copied to the deed key, and the staging copy
+    is removed either way.
+
+    Spaces reports no checksum, so there every finalize downloads the whole
+    object through this worker, in `upload_part_size` parts. That is the
+    price of not storing unverified deeds: the upload itself still skips the
+    API, but its verification does not.
+    """
+    s3_client = s3_client or resources.s3_client
+    key = deed_key(sha256)
+    staged = staging_key(user_id, sha256)
+    try:
+        head = await run_s3(
+            s3_client.head_object,
+            Bucket=bucket_name,
+            Key=staged,
+            ChecksumMode="ENABLED",
         )
-        return file_url
     except ClientError as e:
+        # Nothing to upload when the deed was already stored
+        if await object_exists(key, bucket_name, s3_client):
+            head = await run_s3(s3_client.head_object, Bucket=bucket_name, Key=key)
+            return UploadedFile(
+                url=file_url_for(key, bucket_name),
+                sha256=sha256,
+                size=head["ContentLength"],
+            )
         logging.error(e)
+        raise UploadVerificationError("Uploaded file not found.")
+
+    try:
+        size = head["ContentLength"]
+        if size > settings.upload_max_size:
+            raise UploadVerificationError("File is too large.")
+        checksum = head.get("ChecksumSHA256")
+        if checksum:
+            actual = base64.b64decode(checksum).hex()
+        else:
+            actual, size = await hash_object(staged, bucket_name, s3_client)
+        if actual != sha256:
+            raise UploadVerificationError("Uploaded file checksum does not match.")
+
+        await run_s3(
+            s3_client.copy_object,
+            Bucket=bucket_name,
+            Key=key,
+            CopySource={"Bucket": bucket_name, "Key": staged},
+            ContentType=head.get("ContentType", "application/octet-stream"),
+            Metadata={"sha256": sha256, "size": str(size)},
+            MetadataDirective="REPLACE",
+        )
+    finally:
+        await run_s3(s3_client.delete_object, Bucket=bucket_name, Key=staged)
+
+    return UploadedFile(url=file_url_for(key, bucket_name), sha256=sha256, size=size)
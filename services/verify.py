@@ -0,0 +1,217 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from algosdk import error
+
+from config.resources import resources
+from config.settings import settings
+from models.auth import Role, User
+from models.records import Record
+from models.verify import VerificationResult, VerificationStatus, VerifyUser
+from services.algorand import current_round, get_asset_balance, get_asset_params
+from services.cache import TTLCache
+from services.chain_mirror import chain_mirror
+from services.metrics import cache_metrics
+from services.upload import deed_key
+
+
+@dataclass
+class ChainAsset:
+    """
+    What the chain said about a land record ASA in `round`. `url` is None
+    when the asset no longer exists.
+    """
+
+    url: str | None
+    amount: int
+    round: int
+
+
+# Chain reads keyed by (asset id, round). Asset ids are unique per record,
+# so the holder is implied. Once the round moves on older entries are never
+# read again; the TTL only bounds how long they take up memory.
+chain_cache = TTLCache(
+    maxsize=settings.verify_cache_size, ttl=settings.verify_cache_ttl
+)
+cache_metrics("verification", chain_cache.stats)
+# An ASA's URL cannot change after creation, so it is read once per asset
+asset_url_cache = TTLCache(maxsize=settings.verify_cache_size, ttl=24 * 3600)
+_inflight: dict[tuple[int, int], asyncio.Task] = {}
+
+
+async def _asset_url(asset_id: int) -> str | None:
+    url = asset_url_cache.get(asset_id)
+    if url is None:
+        params = await get_asset_params(asset_id)
+        if params is None:
+            return None
+        url = params.get("url", "")
+        asset_url_cache.set(asset_id, url)
+    return url
+
+
+async def _read_chain_asset(asset_id: int, holder: str, round_num: int) -> ChainAsset:
+    url, amount = await asyncio.gather(
+        _asset_url(asset_id), get_asset_balance(holder, asset_id)
+    )
+    chain_asset = ChainAsset(url=url, amount=amount, round=round_num)
+    chain_cache.set((asset_id, round_num), chain_asset)
+    return chain_asset
+
+
+async def read_chain_asset(asset_id: int, holder: str) -> ChainAsset:
+    """
+    Read an ASA's deed URL and the holder's balance from the chain mirror
+    when it is in sync, else from algod at most once per asset and round.
+    Concurrent checks of the same asset share a single algod read.
+    """
+    mirrored = await chain_mirror.lookup(asset_id, holder)
+    if mirrored is not None:
+        asset, amount, round_num = mirrored
+        url = None if asset.destroyed else asset.url
+        return ChainAsset(url=url, amount=amount, round=round_num)
+
+    round_num = await current_round()
+    key = (asset_id, round_num)
+    chain_asset = chain_cache.get(key)
+    if chain_asset is not None:
+        return chain_asset
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_read_chain_asset(asset_id, holder, round_num))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # One caller giving up must not cancel the read for the others
+    return await asyncio.shield(task)
+
+
+def deed_matches(record: Record, chain_url: str | None, sha256: str | None):
+    """
+    Deeds are stored under their content hash, so a URL on chain that points
+    at the record's deed key pins the content too. Returns None when the
+    record predates content hashes and a given hash cannot be compared.
+    """
+    if chain_url != record.file_url:
+        return False
+    if record.sha256 is None:
+        return None if sha256 else True
+    if not record.file_url.endswith(deed_key(record.sha256)):
+        return False
+    return sha256 is None or sha256 == record.sha256
+
+
+def _same_person(data: VerifyUser, land_holder: User | None) -> bool:
+    # A national id alone must not reveal whose land it is
+    return land_holder is not None and (
+        data.first_name.casefold() == land_holder.first_name.casefold()
+        and data.surname.casefold() == land_holder.surname.casefold()
+    )
+
+
+async def _verify(
+    data: VerifyUser, land_holder: User | None, record: Record | None
+) -> VerificationResult:
+    result = VerificationResult(
+        national_id=data.national_id, status=VerificationStatus.NOT_FOUND
+    )
+    if not _same_person(data, land_holder):
+        result.detail = "Land holder not found."
+        return result
+
+    if record is None or record.asset_id is None or not record.transaction_id:
+        result.status = VerificationStatus.NOT_ISSUED
+        result.detail = "Land record has not been issued."
+        return result
+    result.asset_id = record.asset_id
+    result.location = record.location
+
+    chain_asset = await read_chain_asset(record.asset_id, land_holder.algorand_address)
+    result.round = chain_asset.round
+    result.holds_asset = chain_asset.amount > 0
+    result.deed_matches = deed_matches(record, chain_asset.url, data.sha256)
+
+    if not result.holds_asset:
+        result.status = VerificationStatus.REVOKED
+        result.detail = "Land holder no longer holds the land record token."
+    elif result.deed_matches is False:
+        result.status = VerificationStatus.MISMATCH
+        result.detail = "Deed does not match the land record."
+    else:
+        result.status = VerificationStatus.VERIFIED
+        if result.deed_matches is None:
+            result.detail = "Deed content could not be compared."
+    return result
+
+
+async def verify_land_holder(data: VerifyUser) -> VerificationResult:
+    """
+    Check that the person with `data.national_id` and name holds the token
+    of their land record on chain and that it points at the expected deed.
+    """
+    land_holder = await resources.engine.find_one(
+        User,
+        User.national_id == data.national_id,
+        User.role == Role.TOKEN_HOLDER,
+    )
+    record = None
+    if _same_person(data, land_holder):
+        record = await resources.engine.find_one(
+            Record, Record.user_id == str(land_holder.id)
+        )
+    return await _verify(data, land_holder, record)
+
+
+async def verify_land_holders(
+    items: list[VerifyUser],
+) -> AsyncIterator[VerificationResult]:
+    """
+    Verify many land holders. Holders and records are resolved with one
+    query each before returning, so a database error surfaces here rather
+    than halfway through a streamed response. The returned iterator yields
+    a result per item in request order; chain reads run at most
+    `verify_batch_concurrency` at a time and are shared between items for
+    the same asset. A failed chain read only fails its own item.
+    """
+    land_holders = {}
+    for user in await resources.engine.find(
+        User,
+        User.national_id.in_(list({item.national_id for item in items})),
+        User.role == Role.TOKEN_HOLDER,
+    ):
+        land_holders.setdefault(user.national_id, user)
+    records = {}
+    for record in await resources.engine.find(
+        Record, Record.user_id.in_([str(user.id) for user in land_holders.values()])
+    ):
+        records.setdefault(record.user_id, record)
+    return _verify_all(items, land_holders, records)
+
+
+async def _verify_all(
+    items: list[VerifyUser], land_holders: dict[int, User], records: dict[str, Record]
+) -> AsyncIterator[VerificationResult]:
+    semaphore = asyncio.Semaphore(settings.verify_batch_concurrency)
+
+    async def verify(item: VerifyUser) -> VerificationResult:
+        land_holder = land_holders.get(item.national_id)
+        record = records.get(str(land_holder.id)) if land_holder else None
+        async with semaphore:
+            try:
+                return await _verify(item, land_holder, record)
+            except (error.AlgodHTTPError, OSError):
+                return VerificationResult(
+                    national_id=item.national_id,
+                    status=VerificationStatus.ERROR,
+                    detail="Could not reach the Algorand network.",
+                )
+
+    tasks = [asyncio.create_task(verify(item)) for item in items]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        # The client went away; drop the checks nobody will read
+        for task in tasks:
+            task.cancel()
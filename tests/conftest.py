@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks.fakes import configure_environment, install_fakes
+
+# App modules build their settings on import
+configure_environment()
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """
+    Fresh fake Mongo engine, S3 client and algod client for one test, and
+    fresh algod helpers, whose locks and futures belong to one event loop.
+    Users cached by an earlier test are forgotten.
+    """
+    import services.algorand as algorand
+    import services.auth as auth
+    from config.resources import resources
+    from services.confirmation import RoundWatcher
+
+    monkeypatch.setattr(
+        algorand,
+        "suggested_params_cache",
+        algorand.SuggestedParamsCache(ttl=algorand.settings.algod_params_ttl),
+    )
+    monkeypatch.setattr(
+        algorand,
+        "round_watcher",
+        RoundWatcher(lambda: resources.algod_client, algorand.algod_executor),
+    )
+    auth.user_cache.clear()
+    return install_fakes(round_time=0.02)
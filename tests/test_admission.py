@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from pymongo.errors import ServerSelectionTimeoutError
+from starlette.responses import Response
+
+import services.admission as admission
+from config.settings import settings
+from models.admission import RateLimitBucket
+from services.auth import create_access_token
+
+POLICY = admission.AdmissionPolicy(max_concurrent=1, rate=0.5, burst=2)
+ROUTE = ("POST", "/auth/token")
+
+
+def scope(headers: dict | None = None, client: str = "10.0.0.1") -> dict:
+    return {
+        "type": "http",
+        "method": ROUTE[0],
+        "path": ROUTE[1],
+        "headers": [(k.encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": (client, 50000),
+    }
+
+
+def test_refills_the_token_bucket_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    limiter = admission.MemoryRateLimiter(maxsize=10, idle_seconds=60)
+
+    async def take():
+        return await limiter.take("client", POLICY)
+
+    assert asyncio.run(take()) == 0
+    assert asyncio.run(take()) == 0
+    # Empty: one token comes back every two seconds
+    assert asyncio.run(take()) == 2.0
+    now[0] += 1.5
+    assert asyncio.run(take()) == 0.5
+    now[0] += 0.5
+    assert asyncio.run(take()) == 0
+
+
+def test_answers_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: 100.0))
+    control = admission.AdmissionControl(
+        {ROUTE: POLICY}, admission.MemoryRateLimiter(maxsize=10, idle_seconds=60)
+    )
+
+    async def app(scope, receive, send):
+        await Response("ok")(scope, receive, send)
+
+    async def run():
+        transport = httpx.ASGITransport(app=admission.AdmissionMiddleware(app, control))
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return [await c.post(ROUTE[1]) for _ in range(3)]
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[2].headers["Retry-After"] == "2"
+    assert control.rejected[ROUTE[1], "rate"] == 1
+    assert control.in_flight[ROUTE] == 0
+
+
+def test_caps_requests_in_flight_per_route():
+    control = admission.AdmissionControl(
+        {ROUTE: POLICY}, admission.MemoryRateLimiter(maxsize=10, idle_seconds=60)
+    )
+
+    async def run():
+        first = await control.admit(scope(), ROUTE)
+        second = await control.admit(scope(client="10.0.0.2"), ROUTE)
+        control.release(ROUTE)
+        third = await control.admit(scope(client="10.0.0.2"), ROUTE)
+        return first, second, third
+
+    assert asyncio.run(run()) == (0, 1.0, 0)
+    assert control.rejected[ROUTE[1], "concurrency"] == 1
+
+
+def test_keys_clients_by_token_user_else_address(monkeypatch):
+    token = create_access_token({"username": "alice"})
+    assert admission.client_id(scope({"authorization": f"Bearer {token}"})) == (
+        "user:alice"
+    )
+    assert admission.client_id(scope({"authorization": "Bearer forged"})) == (
+        "ip:10.0.0.1"
+    )
+
+    forwarded = scope({"x-forwarded-for": "6.6.6.6, 203.0.113.7"})
+    monkeypatch.setattr(settings, "trust_forwarded_for", False)
+    assert admission.client_id(forwarded) == "ip:10.0.0.1"
+    monkeypatch.setattr(settings, "trust_forwarded_for", True)
+    # Only the address the trusted proxy appended counts
+    assert admission.client_id(forwarded) == "ip:203.0.113.7"
+
+
+def test_mongo_limiter_lets_requests_through_when_mongo_is_down(fakes, monkeypatch):
+    engine, _, _ = fakes
+    collection_type = type(engine.get_collection(RateLimitBucket))
+
+    async def unreachable(*args, **kwargs):
+        raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(collection_type, "find_one_and_update", unreachable)
+    limiter = admission.MongoRateLimiter()
+    assert asyncio.run(limiter.take("client", POLICY)) == 0
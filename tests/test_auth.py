@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import httpx
+
+import services.auth as auth
+from benchmarks.load_test import new_user
+from main import app
+from models.auth import Role
+
+
+def test_turns_logins_away_once_too_many_hashes_are_pending(fakes, monkeypatch):
+    engine, _, _ = fakes
+    hasher = auth.PasswordHasher(workers=1, max_pending=2)
+    monkeypatch.setattr(auth, "password_hasher", hasher)
+    release = threading.Event()
+
+    async def run():
+        await engine.save(new_user("holder", Role.TOKEN_HOLDER))
+        # Fill the queue with hashes that only finish when released
+        busy = [asyncio.create_task(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            response = await c.post(
+                "/auth/token", data={"username": "holder", "password": "secret"}
+            )
+        release.set()
+        await asyncio.gather(*busy)
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert hasher.pending == 0
+
+
+def test_saving_a_user_drops_its_cached_copy(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        user = new_user("holder", Role.TOKEN_HOLDER)
+        await engine.save(user)
+        cached = await auth.get_user("holder")
+        # Saved behind the cache's back: the cached copy is still served
+        user.disabled = True
+        await engine.save(user)
+        stale = await auth.get_user("holder")
+        await auth.save_user(user)
+        return cached, stale, await auth.get_user("holder")
+
+    cached, stale, fresh = asyncio.run(run())
+    assert stale is cached
+    assert not stale.disabled
+    assert fresh.disabled
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from services.cache import TTLCache
+
+
+def test_wipes_expired_entries_on_the_next_access():
+    evicted = []
+    cache = TTLCache(maxsize=10, ttl=0.05, on_evict=evicted.append)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    time.sleep(0.06)
+    cache.set("c", 3)
+
+    # Looking "a" up did not keep it past its ttl
+    assert sorted(evicted) == [1, 2]
+    assert len(cache) == 1
+
+
+def test_keeps_entries_set_again_until_their_new_expiry():
+    evicted = []
+    cache = TTLCache(maxsize=10, ttl=0.05, on_evict=evicted.append)
+    cache.set("a", 1)
+    time.sleep(0.03)
+    cache.set("a", 2)
+    time.sleep(0.03)
+    cache.purge()
+
+    assert evicted == [1]
+    assert cache.get("a") == 2
+
+
+def test_sweep_wipes_entries_nobody_looks_up():
+    evicted = []
+    cache = TTLCache(maxsize=10, ttl=0.05, on_evict=evicted.append)
+
+    async def run():
+        sweeper = asyncio.create_task(cache.sweep(0.01))
+        cache.set("key", bytearray(b"secret"))
+        await asyncio.sleep(0.1)
+        sweeper.cancel()
+
+    asyncio.run(run())
+    assert evicted == [bytearray(b"secret")]
+    assert len(cache) == 0
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from benchmarks.load_test import new_user
+from config.settings import settings
+from models.auth import Role
+from models.chain import AssetHolding, MirroredAsset, SyncCheckpoint
+from models.records import Record
+from services.chain_mirror import (
+    CHECKPOINT,
+    ChainMirrorUnavailable,
+    reconcile_records,
+)
+
+
+async def seed(engine, count: int):
+    """
+    Issued records for `count` holders, all mirrored and held except the
+    last, whose holder no longer has the asset.
+    """
+    for i in range(count):
+        holder = new_user(f"holder{i}", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        await engine.save(
+            Record(
+                location=f"Plot {i}",
+                file_url=f"deed{i}",
+                verified=True,
+                user_id=str(holder.id),
+                asset_id=100 + i,
+            )
+        )
+        await engine.save(
+            MirroredAsset(asset_id=100 + i, creator="issuer", url=f"deed{i}", round=1)
+        )
+        amount = 0 if i == count - 1 else 1
+        await engine.save(
+            AssetHolding(
+                asset_id=100 + i,
+                address=holder.algorand_address,
+                amount=amount,
+                round=1,
+            )
+        )
+    await engine.save(SyncCheckpoint(name=CHECKPOINT, round=7))
+
+
+def test_reconciles_every_record_page_by_page(fakes, monkeypatch):
+    engine, _, _ = fakes
+    monkeypatch.setattr(settings, "chain_mirror_enabled", True)
+    monkeypatch.setattr(settings, "record_stream_batch_size", 2)
+
+    async def run():
+        await seed(engine, 5)
+        return await reconcile_records()
+
+    report = asyncio.run(run())
+    assert (report.round, report.checked) == (7, 5)
+    assert [item.asset_id for item in report.mismatches] == [104]
+    assert engine.calls["find"] == 3 * 3
+
+
+def test_refuses_to_reconcile_while_the_mirror_is_off(fakes, monkeypatch):
+    engine, _, _ = fakes
+    monkeypatch.setattr(settings, "chain_mirror_enabled", False)
+    asyncio.run(seed(engine, 1))
+    with pytest.raises(ChainMirrorUnavailable):
+        asyncio.run(reconcile_records())
+
+
+def test_refuses_to_reconcile_before_the_mirror_is_seeded(fakes, monkeypatch):
+    engine, _, _ = fakes
+    monkeypatch.setattr(settings, "chain_mirror_enabled", True)
+    with pytest.raises(ChainMirrorUnavailable):
+        asyncio.run(reconcile_records())
@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from algosdk import account, error, transaction
+
+from benchmarks.fakes import FakeAlgodClient
+from services.confirmation import RoundWatcher
+
+ROUND_TIME = 0.05
+
+
+class RejectingAlgodClient(FakeAlgodClient):
+    """
+    Drops every submitted transaction from the pool with an error, as algod
+    does when e.g. the sender cannot pay for it.
+    """
+
+    def send_transaction(self, stxn):
+        self._call("send_transaction")
+        return stxn.get_txid()
+
+    def pending_transaction_info(self, txid: str):
+        self._call("pending_transaction_info")
+        return {"confirmed-round": 0, "pool-error": "overspend"}
+
+
+def signed_payment(client: FakeAlgodClient, note: bytes = b""):
+    private_key, address = account.generate_account()
+    txn = transaction.PaymentTxn(
+        address, client.suggested_params(), address, 0, note=note
+    )
+    return txn.sign(private_key)
+
+
+async def submit_and_wait(client: FakeAlgodClient, stxns, wait_rounds: int = 4):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        watcher = RoundWatcher(lambda: client, executor)
+        futures = [watcher.watch(stxn.get_txid(), wait_rounds) for stxn in stxns]
+        for stxn in stxns:
+            client.send_transaction(stxn)
+        try:
+            return await asyncio.gather(*futures)
+        finally:
+            assert watcher.pending_count == 0
+
+
+def test_confirms_transactions_in_the_round_they_land():
+    client = FakeAlgodClient(round_time=ROUND_TIME)
+    stxns = [signed_payment(client, str(i).encode()) for i in range(3)]
+
+    infos = asyncio.run(submit_and_wait(client, stxns))
+
+    assert [info["txn"]["txid"] for info in infos] == [s.get_txid() for s in stxns]
+    assert all(info["confirmed-round"] for info in infos)
+    # One scan of the block confirms all of them
+    assert client.calls["pending_transaction_info"] == len(stxns)
+
+
+def test_times_out_after_wait_rounds():
+    client = FakeAlgodClient(round_time=ROUND_TIME)
+    stxn = signed_payment(client)
+
+    async def wait_unsent():
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            watcher = RoundWatcher(lambda: client, executor)
+            start = client.status()["last-round"]
+            with pytest.raises(error.ConfirmationTimeoutError):
+                await watcher.wait_for_confirmation(stxn.get_txid(), wait_rounds=3)
+            return start, client.status()["last-round"]
+
+    start, end = asyncio.run(wait_unsent())
+
+    assert end - start >= 3
+    assert client.calls["pending_transaction_info"] == 1
+
+
+def test_reports_pool_errors_as_rejections():
+    client = RejectingAlgodClient(round_time=ROUND_TIME)
+    stxn = signed_payment(client)
+
+    with pytest.raises(error.TransactionRejectedError, match="overspend"):
+        asyncio.run(submit_and_wait(client, [stxn], wait_rounds=2))
+
+
+def test_fails_pending_transactions_when_algod_is_unreachable(monkeypatch):
+    client = FakeAlgodClient(round_time=ROUND_TIME)
+    stxn = signed_payment(client)
+    monkeypatch.setattr(RoundWatcher, "MAX_FAILURES", 2)
+
+    def unreachable(round_num):
+        raise error.AlgodHTTPError("connection refused")
+
+    monkeypatch.setattr(client, "status_after_block", unreachable)
+
+    with pytest.raises(error.AlgodHTTPError):
+        asyncio.run(submit_and_wait(client, [stxn]))
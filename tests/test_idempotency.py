@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+import services.auth as auth
+from benchmarks.load_test import new_user
+from main import app
+from models.auth import Role
+from models.records import Record
+
+
+async def create_records(engine, *deeds: bytes) -> list[httpx.Response]:
+    """
+    Post each deed in turn to /records/create-record under one
+    Idempotency-Key, with the same location, file name and size.
+    """
+    holder = new_user("holder", Role.TOKEN_HOLDER)
+    await engine.save(holder)
+    token = auth.create_access_token({"username": holder.username})
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "deed-1"}
+    transport = httpx.ASGITransport(app=app)
+    responses = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        for deed in deeds:
+            responses.append(
+                await c.post(
+                    "/records/create-record",
+                    params={"location": "Plot 7"},
+                    files={"file": ("deed.pdf", deed, "application/pdf")},
+                    headers=headers,
+                )
+            )
+    return responses
+
+
+def test_replays_a_retry_with_the_same_deed(fakes):
+    engine, _, _ = fakes
+    first, retry = asyncio.run(create_records(engine, b"%PDF one", b"%PDF one"))
+    assert (first.status_code, retry.status_code) == (200, 200)
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["id"] == first.json()["id"]
+
+
+def test_rejects_a_different_deed_of_the_same_name_and_size(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        responses = await create_records(engine, b"%PDF one", b"%PDF two")
+        return responses, await engine.find(Record)
+
+    (first, second), records = asyncio.run(run())
+    assert (first.status_code, second.status_code) == (200, 422)
+    assert len(records) == 1
@@ -0,0 +1,22 @@
+import asyncio
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from benchmarks.fakes import FakeCollection
+from services.indexes import ensure_indexes
+
+
+def test_starts_without_indexes_when_mongo_is_unreachable(fakes, monkeypatch):
+    calls = []
+
+    async def unreachable(self):
+        calls.append(self)
+        raise ServerSelectionTimeoutError("localhost:27017: connection refused")
+
+    monkeypatch.setattr(FakeCollection, "index_information", unreachable, raising=False)
+
+    report = asyncio.run(ensure_indexes())
+
+    # Gives up after the first collection instead of timing out on each
+    assert len(calls) == 1
+    assert all(not entry["created"] for entry in report.values())
@@ -0,0 +1,234 @@
+import asyncio
+
+import httpx
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+import services.auth as auth
+import services.jobs as jobs
+from benchmarks.load_test import new_user
+from main import app
+from models.auth import Role, User
+from models.jobs import Job, JobKind, JobStatus
+from models.records import BatchItemStatus, Record
+
+
+def slow_handler(seconds: float, calls: list):
+    async def handler(issuer, land_holder_id):
+        calls.append(land_holder_id)
+        await asyncio.sleep(seconds)
+        return Record(location="", file_url="", verified=True, user_id="", asset_id=1)
+
+    return handler
+
+
+async def enqueue(engine, queue: jobs.JobQueue) -> Job:
+    issuer = new_user("issuer", Role.TOKEN_ISSUER)
+    await engine.save(issuer)
+    return await queue.enqueue(JobKind.ISSUE, str(issuer.id), "holder")
+
+
+async def load(engine, job: Job) -> Job:
+    return await engine.find_one(Job, Job.id == job.id)
+
+
+def test_renews_the_lease_while_the_job_runs(fakes, monkeypatch):
+    engine, _, _ = fakes
+    calls = []
+    monkeypatch.setitem(jobs.JOB_HANDLERS, JobKind.ISSUE, slow_handler(0.5, calls))
+
+    async def run():
+        queue = jobs.JobQueue(2, lease_seconds=0.15, poll_interval=0.01, max_attempts=3)
+        job = await enqueue(engine, queue)
+        await queue.start()
+        await asyncio.sleep(0.8)
+        await queue.stop()
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    # The second worker never got to claim the running job
+    assert calls == ["holder"]
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.attempts == 1
+    assert job.lease_token is None
+
+
+def test_abandons_a_job_taken_over_by_another_worker(fakes, monkeypatch):
+    engine, _, _ = fakes
+    calls = []
+    monkeypatch.setitem(jobs.JOB_HANDLERS, JobKind.ISSUE, slow_handler(0.5, calls))
+
+    async def run():
+        queue = jobs.JobQueue(1, lease_seconds=0.15, poll_interval=10, max_attempts=3)
+        job = await enqueue(engine, queue)
+        claimed = await queue._claim()
+        running = asyncio.create_task(queue._run(claimed))
+        await asyncio.sleep(0.01)
+        # Another process claims the job as if the lease had expired
+        await engine.get_collection(Job).update_one(
+            {"_id": job.id}, {"$set": {"lease_token": "other"}}
+        )
+        await running
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.RUNNING
+    assert job.lease_token == "other"
+
+
+def test_does_not_overwrite_a_job_it_no_longer_holds(fakes, monkeypatch):
+    engine, _, _ = fakes
+    monkeypatch.setitem(jobs.JOB_HANDLERS, JobKind.ISSUE, slow_handler(0.05, []))
+
+    async def run():
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=10, max_attempts=3)
+        job = await enqueue(engine, queue)
+        claimed = await queue._claim()
+        claimed.lease_token = "stale"
+        await queue._run(claimed)
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.RUNNING
+    assert job.lease_token not in (None, "stale")
+
+
+def test_runs_batch_issuance_and_keeps_the_report(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        holder = new_user("holder", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        await engine.save(
+            Record(
+                location="Plot", file_url="u", verified=False, user_id=str(holder.id)
+            )
+        )
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=10, max_attempts=3)
+        job = await queue.enqueue(
+            JobKind.ISSUE_BATCH,
+            str(issuer.id),
+            land_holder_ids=[str(holder.id), "missing"],
+        )
+        await queue._run(await queue._claim())
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.SUCCEEDED
+    assert [item.status for item in job.report] == [
+        BatchItemStatus.ISSUED,
+        BatchItemStatus.FAILED,
+    ]
+    assert job.report[0].asset_id is not None
+
+
+def test_retries_saving_the_outcome_after_a_mongo_blip(fakes, monkeypatch):
+    engine, _, _ = fakes
+    monkeypatch.setitem(jobs.JOB_HANDLERS, JobKind.ISSUE, slow_handler(0, []))
+    collection_type = type(engine.get_collection(Job))
+    find_one_and_update = collection_type.find_one_and_update
+    blips = []
+
+    async def blip_once(self, query, update, **kwargs):
+        if "status" in update.get("$set", {}) and "$inc" not in update and not blips:
+            blips.append(query)
+            raise AutoReconnect("connection reset")
+        return await find_one_and_update(self, query, update, **kwargs)
+
+    monkeypatch.setattr(collection_type, "find_one_and_update", blip_once)
+
+    async def run():
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=0.01, max_attempts=3)
+        job = await enqueue(engine, queue)
+        await queue._run(await queue._claim())
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    assert blips
+    assert job.status == JobStatus.SUCCEEDED
+
+
+def test_a_failing_job_does_not_stop_the_worker(fakes, monkeypatch):
+    engine, _, _ = fakes
+    calls = []
+    monkeypatch.setitem(jobs.JOB_HANDLERS, JobKind.ISSUE, slow_handler(0, calls))
+    run_job = jobs.JobQueue._run
+
+    async def crash_first(self, job):
+        if not calls:
+            calls.append("crashed")
+            raise AutoReconnect("connection reset")
+        await run_job(self, job)
+
+    monkeypatch.setattr(jobs.JobQueue, "_run", crash_first)
+
+    async def run():
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=0.01, max_attempts=3)
+        first = await enqueue(engine, queue)
+        second = await queue.enqueue(JobKind.ISSUE, first.issuer_id, "holder")
+        await queue.start()
+        await asyncio.sleep(0.2)
+        await queue.stop()
+        return await load(engine, second)
+
+    job = asyncio.run(run())
+    assert calls == ["crashed", "holder"]
+    assert job.status == JobStatus.SUCCEEDED
+
+
+def test_job_status_leaves_out_lease_internals(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=10, max_attempts=3)
+        job = await enqueue(engine, queue)
+        await queue._claim()
+        issuer = await engine.find_one(User, User.id == ObjectId(job.issuer_id))
+        token = auth.create_access_token({"username": issuer.username})
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await c.get(
+                f"/records/jobs/{job.id}", headers={"Authorization": f"Bearer {token}"}
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == JobStatus.RUNNING
+    assert not {"lease_token", "lease_expires_at", "attempts"} & set(body)
+
+
+def test_runs_batch_revocation_and_keeps_the_report(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        holder = new_user("holder", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        await engine.save(
+            Record(
+                location="Plot", file_url="u", verified=False, user_id=str(holder.id)
+            )
+        )
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        queue = jobs.JobQueue(1, lease_seconds=60, poll_interval=10, max_attempts=3)
+        await queue.enqueue(
+            JobKind.ISSUE_BATCH, str(issuer.id), land_holder_ids=[str(holder.id)]
+        )
+        await queue._run(await queue._claim())
+        job = await queue.enqueue(
+            JobKind.REVOKE_BATCH,
+            str(issuer.id),
+            land_holder_ids=[str(holder.id), "missing"],
+        )
+        await queue._run(await queue._claim())
+        return await load(engine, job)
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.SUCCEEDED
+    assert [item.status for item in job.report] == [
+        BatchItemStatus.REVOKED,
+        BatchItemStatus.FAILED,
+    ]
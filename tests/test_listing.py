@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+import services.auth as auth
+from benchmarks.load_test import new_user
+from main import app
+from models.auth import Role
+from models.records import RECORD_FIELDS, Record
+from services.records import record_projection
+
+
+async def get_records(engine, count: int, **params) -> list[httpx.Response]:
+    """
+    Save `count` records, then list them as a token issuer following
+    `next_after` until the last page.
+    """
+    issuer = new_user("issuer", Role.TOKEN_ISSUER)
+    await engine.save(issuer)
+    for i in range(count):
+        await engine.save(
+            Record(location=f"Plot {i}", file_url="u", verified=False, user_id="h")
+        )
+    token = auth.create_access_token({"username": issuer.username})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+    responses = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+        while True:
+            response = await c.get(
+                "/records/fetch-record", params=params, headers=headers
+            )
+            responses.append(response)
+            if response.status_code != 200 or not response.json()["next_after"]:
+                return responses
+            params["after"] = response.json()["next_after"]
+
+
+def test_pages_through_records_by_id(fakes):
+    engine, _, _ = fakes
+    responses = asyncio.run(get_records(engine, 5, limit=2))
+    pages = [[r["location"] for r in page.json()["records"]] for page in responses]
+    assert pages == [["Plot 0", "Plot 1"], ["Plot 2", "Plot 3"], ["Plot 4"]]
+
+
+def test_rejects_a_malformed_cursor(fakes):
+    engine, _, _ = fakes
+    (response,) = asyncio.run(get_records(engine, 1, after="not-an-id"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
+
+
+def test_returns_only_the_requested_fields(fakes):
+    engine, _, _ = fakes
+    (response,) = asyncio.run(get_records(engine, 1, fields="location, asset_id"))
+    (record,) = response.json()["records"]
+    assert set(record) == {"id", "location", "asset_id"}
+    assert record["location"] == "Plot 0"
+
+
+def test_rejects_unknown_fields(fakes):
+    engine, _, _ = fakes
+    (response,) = asyncio.run(get_records(engine, 1, fields="location,secret"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: secret."
+
+
+def test_projects_only_known_record_fields():
+    assert record_projection(None) is None
+    assert record_projection("sha256,verified,") == {"sha256": 1, "verified": 1}
+    assert "asset_attempt" not in RECORD_FIELDS
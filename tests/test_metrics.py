@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from config.settings import settings
+from routes.default import read_metrics
+from services.metrics import Histogram
+
+
+def test_histogram_counts_observations_from_many_threads():
+    histogram = Histogram("test_seconds", "Test", ("outcome",))
+
+    def observe():
+        for _ in range(10000):
+            histogram.observe(0.01, "ok")
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 'test_seconds_count{outcome="ok"} 80000' in histogram.render()
+
+
+def test_metrics_are_hidden_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", None)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(read_metrics("Bearer anything"))
+    assert e.value.status_code == 404
+
+
+def test_metrics_require_the_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape")
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(read_metrics("Bearer wrong"))
+    assert e.value.status_code == 401
+    response = asyncio.run(read_metrics("Bearer scrape"))
+    assert b"http_request_duration_seconds" in response.body
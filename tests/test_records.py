@@ -0,0 +1,310 @@
+import asyncio
+import time
+
+import pytest
+from algosdk import error
+from bson import ObjectId
+
+import services.records as records
+from benchmarks.load_test import new_user
+from models.auth import Role, User
+from models.records import BatchItemStatus, Record, TransactionAttempt
+from services.algorand import find_transaction
+
+
+class WorkerDied(BaseException):
+    """
+    Stops a workflow the way a killed process would, past its error handling.
+    """
+
+
+async def seed(engine):
+    issuer = new_user("issuer", Role.TOKEN_ISSUER)
+    holder = new_user("holder", Role.TOKEN_HOLDER)
+    record = Record(
+        location="Plot 7", file_url="u", verified=False, user_id=str(holder.id)
+    )
+    for instance in (issuer, holder, record):
+        await engine.save(instance)
+    return issuer, holder
+
+
+async def reload(engine, holder) -> Record:
+    return await engine.find_one(Record, Record.user_id == str(holder.id))
+
+
+def test_issues_a_land_record(fakes):
+    engine, _, algod = fakes
+
+    async def run():
+        issuer, holder = await seed(engine)
+        await records.issue_land_record(issuer, str(holder.id))
+        return await reload(engine, holder)
+
+    record = asyncio.run(run())
+    assert record.verified
+    assert record.transaction_id == record.transfer_attempt.txid
+    assert algod.asset_info(record.asset_id)["params"]["url"] == "u"
+
+
+@pytest.mark.parametrize("field", ["asset_attempt", "transfer_attempt"])
+def test_retry_resumes_from_the_saved_transaction(fakes, monkeypatch, field):
+    engine, _, algod = fakes
+    send = records.send_attempt
+    lost = []
+
+    async def send_and_lose(record, name, signed_txns):
+        info = await send(record, name, signed_txns)
+        if name == field and not lost:
+            lost.append(name)
+            raise error.ConfirmationTimeoutError("worker died")
+        return info
+
+    monkeypatch.setattr(records, "send_attempt", send_and_lose)
+
+    async def run():
+        issuer, holder = await seed(engine)
+        with pytest.raises(error.ConfirmationTimeoutError):
+            await records.issue_land_record(issuer, str(holder.id))
+        await records.issue_land_record(issuer, str(holder.id))
+        return await reload(engine, holder), holder
+
+    record, holder = asyncio.run(run())
+    # One asset minted and transferred once
+    holding = algod.account_asset_info(holder.algorand_address, 1000)
+    assert record.asset_id == 1000
+    assert len(algod._assets) == 1
+    assert holding["asset-holding"]["amount"] == 1
+    assert record.transaction_id == record.transfer_attempt.txid
+
+
+def test_recovers_the_asset_id_from_the_block(fakes, monkeypatch):
+    engine, _, algod = fakes
+    send = records.send_attempt
+    info = algod.pending_transaction_info
+    forgotten = set()
+
+    async def send_and_forget(record, name, signed_txns):
+        await send(record, name, signed_txns)
+        monkeypatch.setattr(records, "send_attempt", send)
+        forgotten.add(record.asset_attempt.txid)
+        raise error.ConfirmationTimeoutError("worker died")
+
+    def pending_transaction_info(txid):
+        # algod no longer remembers the confirmed creation
+        if txid in forgotten:
+            raise error.AlgodHTTPError("txid not found", 404)
+        return info(txid)
+
+    monkeypatch.setattr(records, "send_attempt", send_and_forget)
+    monkeypatch.setattr(algod, "pending_transaction_info", pending_transaction_info)
+
+    async def run():
+        issuer, holder = await seed(engine)
+        with pytest.raises(error.ConfirmationTimeoutError):
+            await records.issue_land_record(issuer, str(holder.id))
+        await records.issue_land_record(issuer, str(holder.id))
+        return await reload(engine, holder)
+
+    record = asyncio.run(run())
+    assert record.asset_id == 1000
+    assert len(algod._assets) == 1
+    assert record.verified
+
+
+def test_sends_again_once_the_lost_transaction_expired(fakes):
+    engine, _, algod = fakes
+
+    async def run():
+        issuer, holder = await seed(engine)
+        record = await reload(engine, holder)
+        # A creation saved on the record but never sent
+        status = algod.status()["last-round"]
+        record.asset_attempt = TransactionAttempt(
+            txid="NEVER-SENT", first_valid=status, last_valid=status + 2
+        )
+        await engine.save(record)
+        await records.issue_land_record(issuer, str(holder.id))
+        return await reload(engine, holder)
+
+    record = asyncio.run(run())
+    assert record.asset_id == 1000
+    assert record.asset_attempt.txid != "NEVER-SENT"
+    assert record.verified
+
+
+def test_waits_out_the_validity_window_past_algod_timeouts(fakes, monkeypatch):
+    engine, _, algod = fakes
+
+    def time_out(round_num):
+        # As when algod's wait gives up before the round is reached
+        time.sleep(0.005)
+        return algod.status()
+
+    monkeypatch.setattr(algod, "status_after_block", time_out)
+    status = algod.status()["last-round"]
+    info = asyncio.run(find_transaction("NEVER-SENT", status, status + 3))
+    assert info is None
+    assert algod.status()["last-round"] > status + 3
+
+
+async def seed_holders(engine, count: int) -> list[str]:
+    user_ids = []
+    for i in range(count):
+        holder = new_user(f"holder{i}", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        await engine.save(
+            Record(
+                location="Plot", file_url="u", verified=False, user_id=str(holder.id)
+            )
+        )
+        user_ids.append(str(holder.id))
+    return user_ids
+
+
+def test_issues_many_land_records_in_groups(fakes):
+    engine, _, algod = fakes
+
+    async def run():
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        user_ids = await seed_holders(engine, 20)
+        return await records.issue_land_records(issuer, user_ids + ["missing"])
+
+    report = asyncio.run(run())
+    assert [item.status for item in report] == [BatchItemStatus.ISSUED] * 20 + [
+        BatchItemStatus.FAILED
+    ]
+    # Two creation groups and three groups of opt-in and transfer pairs
+    assert algod.calls["send_transactions"] == 5
+    assert len(algod._assets) == 20
+
+
+def test_saves_each_group_as_soon_as_it_confirms(fakes, monkeypatch):
+    engine, _, algod = fakes
+    send = records.send_signed_group_and_confirm
+    sent = []
+
+    async def send_then_crash(signed_txns):
+        # The batch dies while sending its second group
+        sent.append(signed_txns)
+        if len(sent) == 2:
+            raise WorkerDied()
+        return await send(signed_txns)
+
+    monkeypatch.setattr(records, "send_signed_group_and_confirm", send_then_crash)
+
+    async def run():
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        user_ids = await seed_holders(engine, 20)
+        monkeypatch.setattr(records.settings, "batch_group_concurrency", 1)
+        with pytest.raises(WorkerDied):
+            await records.issue_land_records(issuer, user_ids)
+        saved = await engine.find(Record)
+        monkeypatch.setattr(records, "send_signed_group_and_confirm", send)
+        report = await records.issue_land_records(issuer, user_ids)
+        return saved, report
+
+    saved, report = asyncio.run(run())
+    assert sum(record.asset_id is not None for record in saved) == 16
+    # The second group was saved but never sent; the retry creates it anew
+    assert sum(record.asset_attempt is not None for record in saved) == 20
+    assert all(item.status == BatchItemStatus.ISSUED for item in report)
+    assert len(algod._assets) == 20
+
+
+def test_a_rejected_holder_only_fails_itself(fakes, monkeypatch):
+    engine, _, algod = fakes
+    send_transactions = algod.send_transactions
+
+    async def run():
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        user_ids = await seed_holders(engine, 8)
+        bad = await engine.find_one(User, User.id == ObjectId(user_ids[5]))
+        bad_address = bad.algorand_address
+
+        def reject_bad_holder(stxns):
+            # As if the holder could not pay for its opt-in
+            if any(stxn.transaction.sender == bad_address for stxn in stxns):
+                raise error.AlgodHTTPError("overspend", 400)
+            return send_transactions(stxns)
+
+        monkeypatch.setattr(algod, "send_transactions", reject_bad_holder)
+        monkeypatch.setattr(
+            algod, "send_transaction", lambda stxn: reject_bad_holder([stxn])
+        )
+        report = await records.issue_land_records(issuer, user_ids)
+        return report, await reload(engine, bad)
+
+    report, bad_record = asyncio.run(run())
+    statuses = [item.status for item in report]
+    assert (
+        statuses
+        == [BatchItemStatus.ISSUED] * 5
+        + [BatchItemStatus.FAILED]
+        + [BatchItemStatus.ISSUED] * 2
+    )
+    assert "overspend" in report[5].detail
+    # The rejected attempt is not left behind for a retry to look up
+    assert bad_record.transfer_attempt is None
+
+
+def test_revokes_many_land_records_isolating_rejections(fakes, monkeypatch):
+    engine, _, algod = fakes
+    send_transactions = algod.send_transactions
+
+    async def run():
+        issuer = new_user("issuer", Role.TOKEN_ISSUER)
+        await engine.save(issuer)
+        user_ids = await seed_holders(engine, 20)
+        await records.issue_land_records(issuer, user_ids)
+        bad = await engine.find_one(User, User.id == ObjectId(user_ids[17]))
+
+        def reject_bad_holder(stxns):
+            if any(
+                stxn.transaction.revocation_target == bad.algorand_address
+                for stxn in stxns
+            ):
+                raise error.AlgodHTTPError("asset frozen", 400)
+            return send_transactions(stxns)
+
+        monkeypatch.setattr(algod, "send_transactions", reject_bad_holder)
+        monkeypatch.setattr(
+            algod, "send_transaction", lambda stxn: reject_bad_holder([stxn])
+        )
+        return await records.revoke_land_records(issuer, user_ids), user_ids
+
+    report, user_ids = asyncio.run(run())
+    assert [item.status for item in report] == [BatchItemStatus.REVOKED] * 17 + [
+        BatchItemStatus.FAILED
+    ] + [BatchItemStatus.REVOKED] * 2
+    revoked = {
+        record.user_id
+        for record in asyncio.run(engine.find(Record))
+        if record.is_land_revoked
+    }
+    assert revoked == set(user_ids) - {user_ids[17]}
+
+
+def test_concurrent_issuances_of_one_record_mint_once(fakes):
+    engine, _, algod = fakes
+
+    async def run():
+        issuer, holder = await seed(engine)
+        user_ids = await seed_holders(engine, 3) + [str(holder.id)]
+        results = await asyncio.gather(
+            records.issue_land_record(issuer, str(holder.id)),
+            records.issue_land_record(issuer, str(holder.id)),
+            records.issue_land_records(issuer, user_ids),
+        )
+        return results, await reload(engine, holder)
+
+    (first, second, report), record = asyncio.run(run())
+    # Three holders in the batch, plus the one all three workflows shared
+    assert len(algod._assets) == 4
+    assert first.asset_id == second.asset_id == record.asset_id
+    assert first.transaction_id == second.transaction_id == record.transaction_id
+    assert report[-1].status in (BatchItemStatus.ISSUED, BatchItemStatus.FAILED)
+    assert [item.status for item in report[:3]] == [BatchItemStatus.ISSUED] * 3
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import UploadFile
+
+import services.upload as upload
+from config.settings import settings
+from services.upload import (
+    UploadVerificationError,
+    deed_key,
+    staging_key,
+    verify_uploaded_file,
+)
+
+BUCKET = "land-records"
+DEED = b"%PDF-1.7 deed of plot 7"
+SHA256 = hashlib.sha256(DEED).hexdigest()
+
+
+def stage(s3, body: bytes, user_id: str = "user"):
+    # What the presigned PUT stores; the metadata is whatever the client sent
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=staging_key(user_id, SHA256),
+        Body=body,
+        Metadata={"sha256": SHA256, "size": str(len(DEED))},
+    )
+
+
+def test_moves_a_verified_upload_into_deeds(fakes):
+    _, s3, _ = fakes
+    stage(s3, DEED)
+
+    uploaded = asyncio.run(verify_uploaded_file("user", SHA256))
+
+    assert uploaded.sha256 == SHA256
+    assert uploaded.url.endswith(deed_key(SHA256))
+    assert s3.read(BUCKET, deed_key(SHA256)) == DEED
+    assert (BUCKET, staging_key("user", SHA256)) not in s3.objects
+
+
+def test_rejects_content_that_does_not_match_the_declared_hash(fakes):
+    _, s3, _ = fakes
+    stage(s3, b"%PDF-1.7 forged deed!!")
+
+    with pytest.raises(UploadVerificationError, match="checksum"):
+        asyncio.run(verify_uploaded_file("user", SHA256))
+
+    assert (BUCKET, deed_key(SHA256)) not in s3.objects
+    assert (BUCKET, staging_key("user", SHA256)) not in s3.objects
+
+
+def test_only_reads_the_users_own_staging_key(fakes):
+    _, s3, _ = fakes
+    stage(s3, DEED, user_id="someone-else")
+
+    with pytest.raises(UploadVerificationError, match="not found"):
+        asyncio.run(verify_uploaded_file("user", SHA256))
+
+
+def test_accepts_a_deed_that_is_already_stored(fakes):
+    _, s3, _ = fakes
+    s3.put_object(Bucket=BUCKET, Key=deed_key(SHA256), Body=DEED)
+
+    uploaded = asyncio.run(verify_uploaded_file("user", SHA256))
+
+    assert uploaded.size == len(DEED)
+    assert s3.calls["copy_object"] == 0
+
+
+def test_stores_a_deed_reading_it_through_the_hash_once(fakes, monkeypatch):
+    _, s3, _ = fakes
+    monkeypatch.setattr(settings, "upload_part_size", 8)
+    hashed = []
+    hash_chunk = upload.hash_chunk
+
+    async def count(digest, chunk):
+        hashed.append(chunk)
+        await hash_chunk(digest, chunk)
+
+    monkeypatch.setattr(upload, "hash_chunk", count)
+    file = UploadFile(io.BytesIO(DEED), filename="deed.pdf")
+
+    uploaded = asyncio.run(upload.store_deed(file))
+
+    assert uploaded.sha256 == SHA256
+    assert b"".join(hashed) == DEED
+    assert s3.read(BUCKET, deed_key(SHA256)) == DEED
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import httpx
+from pymongo.errors import ServerSelectionTimeoutError
+
+from benchmarks.load_test import new_user
+from main import app
+from models.auth import Role
+
+
+def request(first_name: str, surname: str, national_id: int) -> dict:
+    return {
+        "first_name": first_name,
+        "surname": surname,
+        "company_name": "Lender",
+        "email": "checks@lender.test",
+        "national_id": national_id,
+    }
+
+
+async def post_batch(items: list[dict]) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.post("/verify/third-party/batch", json={"items": items})
+
+
+def test_streams_a_result_per_item(fakes):
+    engine, _, _ = fakes
+
+    async def run():
+        holder = new_user("holder", Role.TOKEN_HOLDER)
+        await engine.save(holder)
+        return await post_batch(
+            [
+                request(holder.first_name, holder.surname, holder.national_id),
+                request("No", "Body", 2),
+            ]
+        )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["status"] for line in lines] == ["not_issued", "not_found"]
+
+
+def test_fails_before_streaming_when_the_lookup_fails(fakes, monkeypatch):
+    engine, _, _ = fakes
+
+    async def unreachable(*args, **kwargs):
+        raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(engine, "find", unreachable)
+    response = asyncio.run(post_batch([request("No", "Body", 2)]))
+    assert response.status_code == 500